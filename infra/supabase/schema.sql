@@ -13,11 +13,15 @@ create table if not exists public.roles (
   description text,
   tags text[] not null default '{}',
   script text[] not null default '{}',
+  reply_max_chars integer check (reply_max_chars > 0),
   status text not null default 'published',
   created_at timestamptz not null default now(),
   updated_at timestamptz not null default now()
 );
 
+-- Per-role reply length cap enforced by the chat API (null = server default).
+alter table public.roles add column if not exists reply_max_chars integer check (reply_max_chars > 0);
+
 create table if not exists public.explore_items (
   id text primary key,
   type text not null check (type in ('post', 'world')),
@@ -41,6 +45,10 @@ create table if not exists public.explore_items (
   updated_at timestamptz not null default now()
 );
 
+-- The API's periodic catalog refresh reads rows by updated_at.
+create index if not exists roles_updated_at_idx on public.roles (updated_at);
+create index if not exists explore_items_updated_at_idx on public.explore_items (updated_at);
+
 create table if not exists public.daily_theater_templates (
   id text primary key,
   title text not null,
@@ -68,10 +76,23 @@ create table if not exists public.daily_theater_tasks (
   target_words text[] not null default '{}',
   reward_points integer not null default 5,
   completed boolean not null default false,
+  opener text,
+  opener_alternates text[] not null default '{}',
+  opener_generated_at timestamptz,
+  opener_claim text,
+  opener_claimed_at timestamptz not null default 'epoch',
   created_at timestamptz not null default now(),
   updated_at timestamptz not null default now()
 );
 
+-- Pre-generated first in-character message (filled by the API's opener job).
+alter table public.daily_theater_tasks add column if not exists opener text;
+alter table public.daily_theater_tasks add column if not exists opener_alternates text[] not null default '{}';
+alter table public.daily_theater_tasks add column if not exists opener_generated_at timestamptz;
+-- Lease taken by the worker generating a task's opener, so each is generated once.
+alter table public.daily_theater_tasks add column if not exists opener_claim text;
+alter table public.daily_theater_tasks add column if not exists opener_claimed_at timestamptz not null default 'epoch';
+
 create table if not exists public.role_seed_messages (
   id uuid primary key default uuid_generate_v4(),
   role_id text references public.roles(id) on delete cascade,
@@ -84,6 +105,30 @@ create table if not exists public.role_seed_messages (
   unique (role_id, position)
 );
 
+-- Server-side chat history. Turns are append-only: the API assigns id and seq
+-- and inserts each turn once (write-behind, batched).
+create table if not exists public.conversations (
+  id text primary key,
+  role_id text references public.roles(id) on delete set null,
+  user_id text,
+  created_at timestamptz not null default now()
+);
+
+create table if not exists public.conversation_turns (
+  id uuid primary key,
+  conversation_id text not null references public.conversations(id) on delete cascade,
+  seq integer not null,
+  sender text not null check (sender in ('user', 'assistant')),
+  content text not null,
+  created_at timestamptz not null default now()
+);
+
+-- One turn per position: workers number turns from their own cached tail, and a
+-- clash tells the writer to reload and renumber instead of storing an ambiguous order.
+create unique index if not exists conversation_turns_conversation_seq_key
+  on public.conversation_turns (conversation_id, seq);
+drop index if exists public.conversation_turns_conversation_seq_idx;
+
 create or replace function public.set_updated_at()
 returns trigger as $$
 begin
@@ -116,3 +161,32 @@ create trigger role_seed_messages_set_updated_at
 before update on public.role_seed_messages
 for each row
 execute function public.set_updated_at();
+
+-- Swap a day's daily tasks atomically: delete + insert run in one transaction,
+-- serialized per day by an advisory lock. With p_replace = false an already
+-- materialized day is returned untouched, so concurrent triggers are idempotent.
+create or replace function public.replace_daily_tasks(p_day_key date, p_tasks jsonb, p_replace boolean default true)
+returns setof public.daily_theater_tasks
+language plpgsql
+as $$
+begin
+  perform pg_advisory_xact_lock(hashtext('daily_theater_tasks:' || p_day_key::text));
+  if not p_replace and exists (select 1 from public.daily_theater_tasks where day_key = p_day_key) then
+    return query select * from public.daily_theater_tasks where day_key = p_day_key;
+    return;
+  end if;
+  delete from public.daily_theater_tasks where day_key = p_day_key;
+  insert into public.daily_theater_tasks (
+    day_key, template_id, title, description, scene, target_role_id,
+    kickoff_prompt, difficulty, target_words, reward_points, completed
+  )
+  select
+    p_day_key, t.template_id, t.title, t.description, t.scene, t.target_role_id,
+    t.kickoff_prompt, t.difficulty, coalesce(t.target_words, '{}'), coalesce(t.reward_points, 5), false
+  from jsonb_to_recordset(p_tasks) as t(
+    template_id text, title text, description text, scene text, target_role_id text,
+    kickoff_prompt text, difficulty text, target_words text[], reward_points integer
+  );
+  return query select * from public.daily_theater_tasks where day_key = p_day_key;
+end;
+$$;
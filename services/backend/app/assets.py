@@ -0,0 +1,254 @@
+"""On-disk LRU cache for Storage objects served by ``GET /assets/{bucket}/{path}``.
+
+Each object is stored as ``<root>/<aa>/<sha1>.bin`` with a JSON sidecar
+holding the bucket, path, content type and fill time. A restart therefore
+rebuilds the index from disk, using the ``.bin`` mtimes as the recency order.
+Once the total size passes ``max_bytes``, the least recently used entries are
+deleted. Because lookups touch that mtime, HTTP validators (``etag``,
+``last_modified``) come from the key, size and fill time instead, so they stay
+the same for as long as the object is cached.
+
+A miss never blocks the request. ``request_fill`` queues a background download,
+one per key, on a small thread pool, and the route redirects to the origin in
+the meantime. Downloads stream into a temp file that is renamed into place, so
+readers never see a partial object. Several processes may share ``root``. An
+object another worker already stored is adopted on lookup, but each process
+enforces the byte budget over the entries it knows about.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger("wondera")
+
+
+class AssetEntry:
+    __slots__ = ("file", "size", "content_type", "touched", "stored")
+
+    def __init__(self, file: str, size: int, content_type: str, touched: float, stored: float):
+        self.file = file
+        self.size = size
+        self.content_type = content_type
+        self.touched = touched
+        self.stored = stored
+
+    @property
+    def etag(self) -> str:
+        key = os.path.basename(self.file)[:-4]
+        return f'"{key[:16]}-{self.size:x}-{int(self.stored * 1000):x}"'
+
+    @property
+    def last_modified(self) -> str:
+        return formatdate(self.stored, usegmt=True)
+
+
+class DiskAssetCache:
+    def __init__(
+        self,
+        root: str,
+        max_bytes: int,
+        origin_url: Callable[[str, str], Optional[str]],
+        http_client: Callable[[], Any],
+        max_object_bytes: Optional[int] = None,
+        workers: int = 2,
+        retry_after: float = 60.0,
+    ):
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self.max_object_bytes = max_object_bytes or max_bytes // 4
+        self.origin_url = origin_url
+        self.http_client = http_client
+        self.retry_after = retry_after
+        self._entries: "OrderedDict[str, AssetEntry]" = OrderedDict()
+        self._bytes = 0
+        self._filling: set = set()
+        self._failed: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="asset-fill")
+        self.hits = 0
+        self.misses = 0
+        self.fills = 0
+        self.fill_errors = 0
+        self.evictions = 0
+        os.makedirs(os.path.join(self.root, "tmp"), exist_ok=True)
+        self._scan()
+
+    @staticmethod
+    def key(bucket: str, path: str) -> str:
+        return hashlib.sha1(f"{bucket}/{path}".encode("utf-8")).hexdigest()
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], f"{key}.bin")
+
+    def _scan(self) -> None:
+        # Leftovers of downloads interrupted by a crash; recent ones may belong to a live worker.
+        tmp = os.path.join(self.root, "tmp")
+        for name in os.listdir(tmp):
+            try:
+                if time.time() - os.path.getmtime(os.path.join(tmp, name)) > 3600:
+                    os.remove(os.path.join(tmp, name))
+            except OSError:
+                pass
+        found = []
+        for name in os.listdir(self.root):
+            folder = os.path.join(self.root, name)
+            if len(name) != 2 or not os.path.isdir(folder):
+                continue
+            for filename in os.listdir(folder):
+                if not filename.endswith(".bin"):
+                    continue
+                entry = self._read_entry(filename[:-4])
+                if entry is not None:
+                    found.append((entry.touched, filename[:-4], entry))
+        with self._lock:
+            for _, key, entry in sorted(found):
+                self._entries[key] = entry
+                self._bytes += entry.size
+            self._evict_locked()
+
+    def _read_entry(self, key: str) -> Optional[AssetEntry]:
+        file = self._file(key)
+        try:
+            with open(file[:-4] + ".json", "r", encoding="utf-8") as handle:
+                meta = json.load(handle)
+                # Sidecars from before storedAt existed: the sidecar itself is never touched after the fill.
+                stored = float(meta.get("storedAt") or os.fstat(handle.fileno()).st_mtime)
+            stat = os.stat(file)
+        except (OSError, ValueError):
+            return None
+        return AssetEntry(file, stat.st_size, meta.get("contentType") or "application/octet-stream", stat.st_mtime, stored)
+
+    def lookup(self, bucket: str, path: str) -> Optional[AssetEntry]:
+        key = self.key(bucket, path)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None:
+            # Possibly stored by another worker sharing the directory.
+            entry = self._read_entry(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            with self._lock:
+                if key not in self._entries:
+                    self._entries[key] = entry
+                    self._bytes += entry.size
+                    self._evict_locked()
+        elif not os.path.exists(entry.file):
+            self._drop(key)
+            self.misses += 1
+            return None
+        if now - entry.touched > 60:
+            # Keep mtime roughly in step with use so a restart restores the LRU order.
+            entry.touched = now
+            try:
+                os.utime(entry.file)
+            except OSError:
+                pass
+        self.hits += 1
+        return entry
+
+    def request_fill(self, bucket: str, path: str) -> bool:
+        """Queue a background download unless one is running or recently failed."""
+        key = self.key(bucket, path)
+        with self._lock:
+            if key in self._filling or key in self._entries:
+                return False
+            if time.monotonic() < self._failed.get(key, 0.0):
+                return False
+            self._filling.add(key)
+        self._pool.submit(self._fill, key, bucket, path)
+        return True
+
+    def _fill(self, key: str, bucket: str, path: str) -> None:
+        tmp = os.path.join(self.root, "tmp", f"{key}.{uuid.uuid4().hex}")
+        try:
+            url = self.origin_url(bucket, path)
+            if not url:
+                raise ValueError("no storage origin configured")
+            size = 0
+            with self.http_client().stream("GET", url, timeout=120.0) as resp:
+                if resp.status_code != 200:
+                    raise ValueError(f"origin returned {resp.status_code}")
+                declared = int(resp.headers.get("content-length") or 0)
+                if declared > self.max_object_bytes:
+                    raise ValueError(f"object too large to cache ({declared} bytes)")
+                content_type = (resp.headers.get("content-type") or "application/octet-stream").split(";")[0].strip()
+                with open(tmp, "wb") as handle:
+                    for chunk in resp.iter_bytes(1 << 20):
+                        size += len(chunk)
+                        if size > self.max_object_bytes:
+                            raise ValueError(f"object too large to cache (> {self.max_object_bytes} bytes)")
+                        handle.write(chunk)
+            file = self._file(key)
+            os.makedirs(os.path.dirname(file), exist_ok=True)
+            stored = time.time()
+            with open(file[:-4] + ".json", "w", encoding="utf-8") as handle:
+                json.dump({"bucket": bucket, "path": path, "contentType": content_type, "size": size, "storedAt": stored}, handle)
+            os.replace(tmp, file)
+            with self._lock:
+                previous = self._entries.pop(key, None)
+                if previous is not None:
+                    self._bytes -= previous.size
+                self._entries[key] = AssetEntry(file, size, content_type, stored, stored)
+                self._bytes += size
+                self._evict_locked()
+            self.fills += 1
+        except Exception as exc:
+            self.fill_errors += 1
+            with self._lock:
+                self._failed[key] = time.monotonic() + self.retry_after
+            logger.warning("Asset cache fill failed for %s/%s: %s", bucket, path, exc)
+        finally:
+            with self._lock:
+                self._filling.discard(key)
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+    def _drop(self, key: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry.size
+
+    def _evict_locked(self) -> None:
+        while self._bytes > self.max_bytes and self._entries:
+            key, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.size
+            self.evictions += 1
+            for file in (entry.file, entry.file[:-4] + ".json"):
+                try:
+                    os.remove(file)
+                except OSError:
+                    pass
+        if len(self._failed) > 10000:
+            now = time.monotonic()
+            self._failed = {key: until for key, until in self._failed.items() if until > now}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "root": self.root,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "maxBytes": self.max_bytes,
+                "maxObjectBytes": self.max_object_bytes,
+                "filling": len(self._filling),
+                "hits": self.hits,
+                "misses": self.misses,
+                "fills": self.fills,
+                "fillErrors": self.fill_errors,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,195 @@
+"""Per-route-class execution pools ("bulkheads") for sync handlers.
+
+FastAPI runs every sync ``def`` endpoint on one shared threadpool, so a
+handler that blocks for minutes can take all of its threads. ``BulkheadRoute``
+runs each sync endpoint under its class's own ``CapacityLimiter`` and rejects
+with 503 at once when that class is saturated and its queue is full.
+
+A sync iterator handed to ``StreamingResponse`` would still be drained on the
+shared threadpool after the handler returns; ``Bulkhead.stream`` keeps such a
+body inside its pool for as long as it runs.
+"""
+import contextvars
+import functools
+import inspect
+import os
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+import anyio
+from fastapi import HTTPException
+from fastapi.routing import APIRoute
+
+from .profiling import active_session
+
+# The pool whose job is running in the current thread; lets a handler hand its admission to its stream.
+_CURRENT_POOL: contextvars.ContextVar[Optional["Bulkhead"]] = contextvars.ContextVar("bulkhead", default=None)
+
+
+class Bulkhead:
+    def __init__(self, name: str, max_concurrent: int, max_queue: int):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self._limiter: Optional[anyio.CapacityLimiter] = None
+        self.admitted = 0
+        self.peak_admitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.queue_wait_seconds = 0.0
+        self.run_seconds = 0.0
+
+    @property
+    def limiter(self) -> anyio.CapacityLimiter:
+        # Created lazily: a CapacityLimiter must be built inside the running event loop.
+        if self._limiter is None:
+            self._limiter = anyio.CapacityLimiter(self.max_concurrent)
+        return self._limiter
+
+    def snapshot(self) -> Dict[str, Any]:
+        stats = self._limiter.statistics() if self._limiter is not None else None
+        return {
+            "maxConcurrent": self.max_concurrent,
+            "maxQueue": self.max_queue,
+            "running": stats.borrowed_tokens if stats else 0,
+            "waiting": stats.tasks_waiting if stats else 0,
+            "peakAdmitted": self.peak_admitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "queueWaitSeconds": round(self.queue_wait_seconds, 3),
+            "runSeconds": round(self.run_seconds, 3),
+        }
+
+    def _admit(self, handover: bool = False) -> None:
+        # Counted here rather than read from the limiter: to_thread.run_sync may yield
+        # before it borrows a token, so limiter statistics lag behind admissions.
+        if not handover and self.admitted >= self.max_concurrent + self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail=f"{self.name} capacity exhausted, retry shortly",
+                headers={"Retry-After": "1"},
+            )
+        self.admitted += 1
+        self.peak_admitted = max(self.peak_admitted, self.admitted)
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        limiter = self.limiter
+        self._admit()
+        queued_at = time.perf_counter()
+        started_at: List[float] = []
+        session = active_session()
+
+        def call():
+            started_at.append(time.perf_counter())
+            _CURRENT_POOL.set(self)
+            if session is not None:
+                return session.run(func, *args, **kwargs)
+            return func(*args, **kwargs)
+
+        try:
+            result = await anyio.to_thread.run_sync(call, limiter=limiter)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.admitted -= 1
+            if started_at:
+                self.queue_wait_seconds += started_at[0] - queued_at
+                self.run_seconds += time.perf_counter() - started_at[0]
+        self.completed += 1
+        return result
+
+    def stream(self, body: Iterator[Any]) -> AsyncIterator[Any]:
+        """Response body that drains the sync iterator ``body`` as one job of this pool.
+
+        Admission is checked here, while the handler can still answer 503; a handler already
+        running in this pool passes its own admission on. Once the response starts, the stream
+        holds one slot until it ends and pulls chunks on its own thread, not on the shared threadpool.
+        """
+        self._admit(handover=_CURRENT_POOL.get() is self)
+        return self._drain(body)
+
+    async def _drain(self, body: Iterator[Any]) -> AsyncIterator[Any]:
+        done = object()
+        own = anyio.CapacityLimiter(1)
+        queued_at = time.perf_counter()
+        started_at: Optional[float] = None
+        try:
+            async with self.limiter:
+                started_at = time.perf_counter()
+                while True:
+                    chunk = await anyio.to_thread.run_sync(next, body, done, limiter=own)
+                    if chunk is done:
+                        break
+                    yield chunk
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.admitted -= 1
+            if started_at is not None:
+                self.queue_wait_seconds += started_at - queued_at
+                self.run_seconds += time.perf_counter() - started_at
+            close = getattr(body, "close", None)
+            if close is not None:
+                # A client that went away leaves the generator suspended; close it off the event loop.
+                with anyio.CancelScope(shield=True):
+                    await anyio.to_thread.run_sync(close, limiter=own)
+        self.completed += 1
+
+    def wrap(self, func: Callable[..., Any]) -> Callable[..., Any]:
+        # functools.wraps keeps __wrapped__, so FastAPI still reads the original signature.
+        @functools.wraps(func)
+        async def endpoint(*args, **kwargs):
+            return await self.run(func, *args, **kwargs)
+
+        return endpoint
+
+
+class BulkheadRegistry:
+    def __init__(self, pools: Dict[str, Bulkhead], routes: List[Tuple[str, str]], default: str):
+        self.pools = pools
+        self.routes = routes
+        self.default = default
+
+    def for_path(self, path: str) -> Bulkhead:
+        for prefix, name in self.routes:
+            if path == prefix.rstrip("/") or path.startswith(prefix):
+                return self.pools[name]
+        return self.pools[self.default]
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {name: pool.snapshot() for name, pool in self.pools.items()}
+
+
+def _pool_from_env(name: str, concurrent: int, queue: int) -> Bulkhead:
+    """BULKHEAD_<NAME>=<max_concurrent>:<max_queue>, e.g. BULKHEAD_MEDIA=8:4."""
+    raw = (os.getenv(f"BULKHEAD_{name.upper()}") or "").strip()
+    if raw:
+        parts = raw.split(":")
+        concurrent = int(parts[0])
+        queue = int(parts[1]) if len(parts) > 1 else queue
+    return Bulkhead(name, concurrent, queue)
+
+
+BULKHEADS = BulkheadRegistry(
+    pools={
+        "catalog": _pool_from_env("catalog", 32, 128),
+        "chat": _pool_from_env("chat", 16, 32),
+        "media": _pool_from_env("media", 6, 6),
+        "admin": _pool_from_env("admin", 8, 16),
+    },
+    # First matching prefix wins; everything else is catalog traffic.
+    routes=[("/ai/", "media"), ("/admin/upload", "media"), ("/chat/", "chat"), ("/admin/", "admin")],
+    default="catalog",
+)
+
+
+class BulkheadRoute(APIRoute):
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs):
+        if not inspect.iscoroutinefunction(endpoint):
+            endpoint = BULKHEADS.for_path(path).wrap(endpoint)
+        super().__init__(path, endpoint, **kwargs)
@@ -0,0 +1,351 @@
+"""Catalog cache with in-process, Redis and two-tier backends.
+
+All backends have the same small interface: ``get_many``, ``set``,
+``delete`` and ``delete_groups``. A *group* names a family of keys that one
+write invalidates together (e.g. every cached explore page).
+
+``CatalogCache`` adds read-through loading with per-key single flight. It
+invalidates across processes: writes delete locally and in Redis, then publish
+the keys/groups on a Redis channel. Each worker's subscriber thread evicts them
+from its local tier, so other workers stop serving stale rows within
+milliseconds. If a message is lost (e.g. during a reconnect), the whole local
+tier is dropped, and the short local TTL bounds any remaining staleness.
+
+Other in-process views derived from the same rows (search index, feed ranker)
+register with ``add_listener`` to receive the same messages, plus a call after
+each reconnect, since anything published meanwhile was missed.
+
+``redis`` is imported only when a Redis-backed mode is selected.
+"""
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+logger = logging.getLogger("wondera")
+
+MISSING = object()
+
+
+class LocalCache:
+    """Thread-safe TTL + LRU map."""
+
+    def __init__(self, max_entries: int = 10000, default_ttl: float = 300.0):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, value, group)
+        self._groups: Dict[str, set] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _drop_locked(self, key: str) -> None:
+        entry = self._data.pop(key, None)
+        if entry is not None and entry[2]:
+            members = self._groups.get(entry[2])
+            if members is not None:
+                members.discard(key)
+                if not members:
+                    del self._groups[entry[2]]
+
+    def get_many(self, keys: Sequence[str], group: Optional[str] = None) -> Dict[str, Any]:
+        now = time.monotonic()
+        found: Dict[str, Any] = {}
+        with self._lock:
+            for key in keys:
+                entry = self._data.get(key)
+                if entry is None:
+                    continue
+                if entry[0] <= now:
+                    self._drop_locked(key)
+                    continue
+                self._data.move_to_end(key)
+                found[key] = entry[1]
+        return found
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None, group: Optional[str] = None) -> None:
+        expires_at = time.monotonic() + (ttl if ttl is not None else self.default_ttl)
+        with self._lock:
+            self._drop_locked(key)
+            self._data[key] = (expires_at, value, group)
+            if group:
+                self._groups.setdefault(group, set()).add(key)
+            while len(self._data) > self.max_entries:
+                self._drop_locked(next(iter(self._data)))
+
+    def delete(self, keys: Iterable[str]) -> None:
+        with self._lock:
+            for key in keys:
+                self._drop_locked(key)
+
+    def delete_groups(self, groups: Iterable[str]) -> None:
+        with self._lock:
+            for group in groups:
+                for key in self._groups.pop(group, ()):
+                    self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._groups.clear()
+
+
+class RedisCache:
+    """JSON values under ``<namespace>:``; a group is a Redis set of its member keys.
+
+    Errors are logged and treated as misses. After a failure Redis is skipped
+    for ``retry_after`` seconds, so an outage costs one timeout, not one per call.
+    """
+
+    def __init__(self, client, namespace: str = "wondera", default_ttl: float = 300.0, retry_after: float = 5.0):
+        self.client = client
+        self.namespace = namespace
+        self.default_ttl = default_ttl
+        self.retry_after = retry_after
+        self._down_until = 0.0
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def _group_key(self, group: str) -> str:
+        return f"{self.namespace}:group:{group}"
+
+    def _call(self, fn: Callable[[], Any], fallback: Any = None) -> Any:
+        if time.monotonic() < self._down_until:
+            return fallback
+        try:
+            return fn()
+        except Exception as exc:
+            self._down_until = time.monotonic() + self.retry_after
+            logger.warning("Redis cache unavailable for %.0fs: %s", self.retry_after, exc)
+            return fallback
+
+    def get_many(self, keys: Sequence[str], group: Optional[str] = None) -> Dict[str, Any]:
+        if not keys:
+            return {}
+        raw = self._call(lambda: self.client.mget([self._key(key) for key in keys]), [None] * len(keys))
+        return {key: json.loads(value) for key, value in zip(keys, raw) if value is not None}
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None, group: Optional[str] = None) -> None:
+        seconds = max(int(ttl if ttl is not None else self.default_ttl), 1)
+        payload = json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str)
+
+        def write():
+            pipe = self.client.pipeline(transaction=False)
+            pipe.set(self._key(key), payload, ex=seconds)
+            if group:
+                pipe.sadd(self._group_key(group), self._key(key))
+                pipe.expire(self._group_key(group), seconds * 2)
+            pipe.execute()
+
+        self._call(write)
+
+    def delete(self, keys: Iterable[str]) -> None:
+        names = [self._key(key) for key in keys]
+        if names:
+            self._call(lambda: self.client.delete(*names))
+
+    def delete_groups(self, groups: Iterable[str]) -> None:
+        def drop(group: str):
+            members = list(self.client.smembers(self._group_key(group)))
+            self.client.delete(self._group_key(group), *members)
+
+        for group in groups:
+            self._call(lambda: drop(group))
+
+
+class TieredCache:
+    """Local tier in front of Redis; remote hits refill the local tier with a shorter TTL."""
+
+    def __init__(self, local: LocalCache, remote: RedisCache, local_ttl: float = 30.0):
+        self.local = local
+        self.remote = remote
+        self.local_ttl = local_ttl
+
+    def get_many(self, keys: Sequence[str], group: Optional[str] = None) -> Dict[str, Any]:
+        found = self.local.get_many(keys)
+        missing = [key for key in keys if key not in found]
+        if missing:
+            remote = self.remote.get_many(missing)
+            for key, value in remote.items():
+                # Keep the group so a later group invalidation also reaches this local copy.
+                self.local.set(key, value, self.local_ttl, group)
+            found.update(remote)
+        return found
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None, group: Optional[str] = None) -> None:
+        local_ttl = self.local_ttl if ttl is None else min(ttl, self.local_ttl)
+        self.local.set(key, value, local_ttl, group)
+        self.remote.set(key, value, ttl, group)
+
+    def delete(self, keys: Iterable[str]) -> None:
+        keys = list(keys)
+        self.local.delete(keys)
+        self.remote.delete(keys)
+
+    def delete_groups(self, groups: Iterable[str]) -> None:
+        groups = list(groups)
+        self.local.delete_groups(groups)
+        self.remote.delete_groups(groups)
+
+
+class CatalogCache:
+    def __init__(self, backend, default_ttl: float = 300.0, redis_client=None, channel: str = "wondera:cache:invalidate"):
+        self.backend = backend
+        self.default_ttl = default_ttl
+        self.redis = redis_client
+        self.channel = channel
+        self.origin = uuid.uuid4().hex
+        self.hits = 0
+        self.misses = 0
+        self.invalidations_received = 0
+        self._flights: Dict[str, threading.Lock] = {}
+        self._flights_lock = threading.Lock()
+        self._subscriber: Optional[threading.Thread] = None
+        self._listeners: List[Callable[[List[str], List[str]], None]] = []
+        self._resync_listeners: List[Callable[[], None]] = []
+
+    @property
+    def local(self) -> Optional[LocalCache]:
+        if isinstance(self.backend, LocalCache):
+            return self.backend
+        return getattr(self.backend, "local", None)
+
+    def get_many(self, keys: Sequence[str], group: Optional[str] = None) -> Dict[str, Any]:
+        found = self.backend.get_many(list(keys), group)
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None, group: Optional[str] = None) -> None:
+        self.backend.set(key, value, ttl if ttl is not None else self.default_ttl, group)
+
+    def get_or_load(self, key: str, loader: Callable[[], Any], ttl: Optional[float] = None, group: Optional[str] = None) -> Any:
+        """Read-through; concurrent misses on one key in this process share a single load. None is not cached."""
+        value = self.get_many([key], group).get(key, MISSING)
+        if value is not MISSING:
+            return value
+        with self._flights_lock:
+            flight = self._flights.setdefault(key, threading.Lock())
+        with flight:
+            value = self.backend.get_many([key], group).get(key, MISSING)
+            if value is MISSING:
+                value = loader()
+                if value is not None:
+                    self.set(key, value, ttl, group)
+        with self._flights_lock:
+            self._flights.pop(key, None)
+        return value
+
+    def invalidate(self, keys: Iterable[str] = (), groups: Iterable[str] = ()) -> None:
+        keys, groups = list(keys), list(groups)
+        if not keys and not groups:
+            return
+        self.backend.delete(keys)
+        self.backend.delete_groups(groups)
+        if self.redis is not None:
+            message = json.dumps({"origin": self.origin, "keys": keys, "groups": groups})
+            try:
+                self.redis.publish(self.channel, message)
+            except Exception as exc:
+                logger.warning("Cache invalidation publish failed: %s", exc)
+
+    def add_listener(self, on_invalidate: Callable[[List[str], List[str]], None], on_resync: Optional[Callable[[], None]] = None) -> None:
+        """Call ``on_invalidate(keys, groups)`` for invalidations published by other processes.
+
+        ``on_resync`` runs after the subscriber reconnects: messages published while it was
+        disconnected are lost. Register before ``start_subscriber``; listeners run on the
+        subscriber thread, so they should hand slow work off.
+        """
+        self._listeners.append(on_invalidate)
+        if on_resync is not None:
+            self._resync_listeners.append(on_resync)
+
+    def _apply(self, raw: Any) -> None:
+        message = json.loads(raw)
+        if message.get("origin") == self.origin:
+            return
+        keys, groups = message.get("keys") or [], message.get("groups") or []
+        local = self.local
+        if local is not None:
+            local.delete(keys)
+            local.delete_groups(groups)
+        for listener in self._listeners:
+            try:
+                listener(keys, groups)
+            except Exception:
+                logger.exception("Cache invalidation listener failed")
+        self.invalidations_received += 1
+
+    def _resync(self) -> None:
+        for listener in self._resync_listeners:
+            try:
+                listener()
+            except Exception:
+                logger.exception("Cache resync listener failed")
+
+    def start_subscriber(self) -> None:
+        if self.redis is None or (self.local is None and not self._listeners) or self._subscriber is not None:
+            return
+        self._subscriber = threading.Thread(target=self._subscribe_loop, name="cache-invalidation", daemon=True)
+        self._subscriber.start()
+
+    def _subscribe_loop(self) -> None:
+        delay = 1.0
+        reconnect = False
+        while True:
+            try:
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                # Anything published while we were disconnected is lost: start from an empty local tier.
+                if self.local is not None:
+                    self.local.clear()
+                if reconnect:
+                    self._resync()
+                reconnect = True
+                delay = 1.0
+                while True:
+                    # Polling with a timeout instead of listen(): the client's socket_timeout would abort a blocking read.
+                    message = pubsub.get_message(timeout=5.0)
+                    if message and message.get("type") == "message":
+                        try:
+                            self._apply(message["data"])
+                        except ValueError:
+                            logger.warning("Ignoring malformed cache invalidation message")
+            except Exception as exc:
+                logger.warning("Cache invalidation subscriber disconnected: %s", exc)
+            time.sleep(delay)
+            delay = min(delay * 2, 30.0)
+
+    def stats(self) -> Dict[str, Any]:
+        local = self.local
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "localEntries": len(local) if local is not None else None,
+            "invalidationsReceived": self.invalidations_received,
+            "subscriber": self._subscriber is not None and self._subscriber.is_alive(),
+        }
+
+
+def build_cache(backend: str, redis_url: Optional[str], ttl: float, local_ttl: float, max_entries: int) -> CatalogCache:
+    """CACHE_BACKEND: ``local`` (default), ``redis`` or ``tiered``."""
+    backend = (backend or "local").strip().lower()
+    if backend == "local" or not redis_url:
+        if backend != "local":
+            logger.warning("CACHE_BACKEND=%s needs REDIS_URL; using the in-process cache", backend)
+        return CatalogCache(LocalCache(max_entries, ttl), ttl)
+    import redis
+
+    client = redis.Redis.from_url(redis_url, socket_timeout=1.0, socket_connect_timeout=1.0, health_check_interval=30)
+    remote = RedisCache(client, default_ttl=ttl)
+    if backend == "redis":
+        return CatalogCache(remote, ttl, redis_client=client)
+    if backend == "tiered":
+        return CatalogCache(TieredCache(LocalCache(max_entries, local_ttl), remote, local_ttl), ttl, redis_client=client)
+    raise ValueError(f"Unknown CACHE_BACKEND {backend!r}, expected local, redis or tiered")
@@ -0,0 +1,351 @@
+"""Server-side chat history with a hot in-memory tail and write-behind persistence.
+
+Clients send a ``conversation_id`` and only the new user message. The store
+keeps the last ``tail_size`` turns of recently used conversations in memory, so
+building the model context needs no database round trip. New turns go onto
+that tail and into a queue. ``flush()`` writes the queue to
+``conversation_turns`` in batches; it runs from a ``PeriodicJob`` about once a
+second and once more at shutdown.
+
+Turns are append-only. Each one gets its id and ``seq`` here and is inserted
+with ``ignore_duplicates``, so a retried flush cannot write a turn twice. A
+crash loses at most the turns queued since the last flush. A conversation with
+unflushed turns is never evicted, so reloading it from the database cannot drop
+turns that this worker accepted.
+
+If a batch fails, the flush falls back to one write per conversation, so a
+single bad row (e.g. a header whose role no longer exists) cannot hold back
+everyone else's turns. A conversation that keeps failing while others go
+through is dropped after ``max_attempts`` flushes, and the drop is logged. If
+every conversation fails, that is an outage: everything stays queued and no
+attempts are counted.
+
+``seq`` comes from this worker's tail, which can be behind turns another worker
+wrote. ``(conversation_id, seq)`` is unique in the database. When a write hits
+that constraint, the conversation is reloaded, and its unflushed turns are
+renumbered after the stored ones and re-queued, so a stale tail reorders turns
+instead of losing them.
+"""
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from .metrics import timed
+
+logger = logging.getLogger("wondera")
+
+SEQ_CONSTRAINT = "conversation_turns_conversation_seq_key"
+
+
+def is_seq_conflict(exc: Exception) -> bool:
+    # PostgREST reports a unique violation as code 23505, with the constraint name in the message.
+    text = f"{getattr(exc, 'code', '')} {exc}"
+    return "23505" in text and SEQ_CONSTRAINT in text
+
+
+class Conversation:
+    __slots__ = ("id", "role_id", "user_id", "tail", "next_seq", "pending", "loaded_at")
+
+    def __init__(self, conversation_id: str, role_id: Optional[str], user_id: Optional[str], tail: List[Dict[str, Any]], next_seq: int):
+        self.id = conversation_id
+        self.role_id = role_id
+        self.user_id = user_id
+        self.tail = tail
+        self.next_seq = next_seq
+        self.pending = 0
+        self.loaded_at = time.monotonic()
+
+
+def turn_to_api(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {"id": row.get("id"), "seq": row.get("seq"), "role": row.get("sender"), "content": row.get("content"), "createdAt": row.get("created_at")}
+
+
+class ConversationStore:
+    def __init__(
+        self,
+        client_factory: Callable[[], Any],
+        tail_size: int = 40,
+        max_hot: int = 5000,
+        reload_after: float = 300.0,
+        batch_size: int = 500,
+        max_attempts: int = 5,
+    ):
+        self.client_factory = client_factory
+        self.tail_size = tail_size
+        self.max_hot = max_hot
+        # A clean conversation is re-read after this many seconds, picking up turns other workers wrote.
+        self.reload_after = reload_after
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self._hot: "OrderedDict[str, Conversation]" = OrderedDict()
+        self._pending_conversations: List[Dict[str, Any]] = []
+        self._pending_turns: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._attempts: Dict[str, int] = {}
+        self.flushed_turns = 0
+        self.dropped_turns = 0
+        self.resequenced_turns = 0
+        self.loads = 0
+
+    def _remember_locked(self, conversation: Conversation) -> None:
+        self._hot[conversation.id] = conversation
+        self._hot.move_to_end(conversation.id)
+        if len(self._hot) <= self.max_hot:
+            return
+        for conversation_id in list(self._hot):
+            if len(self._hot) <= self.max_hot:
+                break
+            if self._hot[conversation_id].pending == 0:
+                del self._hot[conversation_id]
+
+    def create(self, role_id: Optional[str], user_id: Optional[str] = None) -> Conversation:
+        conversation = Conversation(f"conv-{uuid.uuid4().hex}", role_id, user_id, [], 0)
+        conversation.pending = 1  # the header row itself
+        row = {"id": conversation.id, "role_id": role_id, "user_id": user_id, "created_at": _now()}
+        with self._lock:
+            self._pending_conversations.append(row)
+            self._remember_locked(conversation)
+        return conversation
+
+    def get(self, conversation_id: str) -> Optional[Conversation]:
+        with self._lock:
+            conversation = self._hot.get(conversation_id)
+            if conversation is not None:
+                fresh = conversation.pending or time.monotonic() - conversation.loaded_at < self.reload_after
+                if fresh:
+                    self._hot.move_to_end(conversation_id)
+                    return conversation
+        loaded = self._load(conversation_id)
+        if loaded is None:
+            return None
+        with self._lock:
+            current = self._hot.get(conversation_id)
+            if current is not None and current.pending:
+                # Turns were appended while we were reading; keep the live object.
+                return current
+            self._remember_locked(loaded)
+        return loaded
+
+    def _load(self, conversation_id: str) -> Optional[Conversation]:
+        client = self.client_factory()
+        with timed("supabase", "load conversation"):
+            header = client.table("conversations").select("id,role_id,user_id").eq("id", conversation_id).limit(1).execute().data
+        if not header:
+            return None
+        with timed("supabase", "load conversation tail"):
+            rows = (
+                client.table("conversation_turns")
+                .select("*")
+                .eq("conversation_id", conversation_id)
+                .order("seq", desc=True)
+                .limit(self.tail_size)
+                .execute()
+                .data
+                or []
+            )
+        rows.reverse()
+        self.loads += 1
+        next_seq = rows[-1]["seq"] + 1 if rows else 0
+        return Conversation(conversation_id, header[0].get("role_id"), header[0].get("user_id"), rows, next_seq)
+
+    def append(self, conversation: Conversation, turns: Sequence[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        """Queue (sender, content) turns; returns the stored rows."""
+        rows = []
+        with self._lock:
+            for sender, content in turns:
+                row = {
+                    "id": str(uuid.uuid4()),
+                    "conversation_id": conversation.id,
+                    "seq": conversation.next_seq,
+                    "sender": sender,
+                    "content": content,
+                    "created_at": _now(),
+                }
+                conversation.next_seq += 1
+                rows.append(row)
+            conversation.tail.extend(rows)
+            del conversation.tail[: -self.tail_size]
+            conversation.pending += len(rows)
+            self._pending_turns.extend(rows)
+            self._remember_locked(conversation)
+        return rows
+
+    def context(self, conversation: Conversation, limit: int) -> List[Dict[str, str]]:
+        with self._lock:
+            tail = conversation.tail[-limit:]
+        return [{"role": row["sender"], "content": row["content"]} for row in tail]
+
+    def history(self, conversation: Conversation, limit: int, before: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Up to ``limit`` turns with ``seq < before`` (newest page by default), oldest first."""
+        query = (
+            self.client_factory()
+            .table("conversation_turns")
+            .select("*")
+            .eq("conversation_id", conversation.id)
+            .order("seq", desc=True)
+            .limit(limit)
+        )
+        if before is not None:
+            query = query.lt("seq", before)
+        with timed("supabase", "conversation history"):
+            rows = query.execute().data or []
+        # Unflushed turns are only in the tail.
+        by_id = {row["id"]: row for row in rows}
+        with self._lock:
+            for row in conversation.tail:
+                if before is None or row["seq"] < before:
+                    by_id.setdefault(row["id"], row)
+        ordered = sorted(by_id.values(), key=lambda row: (row["seq"], row.get("created_at") or ""))
+        return ordered[-limit:]
+
+    def flush(self) -> int:
+        """Write queued conversations and turns; a failure is raised only when nothing could be written."""
+        with self._flush_lock:
+            with self._lock:
+                conversations, self._pending_conversations = self._pending_conversations, []
+                turns, self._pending_turns = self._pending_turns, []
+            if not conversations and not turns:
+                return 0
+            client = self.client_factory()
+            try:
+                self._write(client, conversations, turns)
+            except Exception as exc:
+                if len({row["id"] for row in conversations} | {row["conversation_id"] for row in turns}) > 1:
+                    return self._flush_each(client, conversations, turns)
+                if self._resequence(conversations, turns, exc):
+                    return 0
+                self._failed(conversations, turns, exc, isolated=False)
+                raise
+            self._written(conversations, turns)
+            return len(turns)
+
+    def _write(self, client, conversations: List[Dict[str, Any]], turns: List[Dict[str, Any]]) -> None:
+        if conversations:
+            with timed("supabase", "flush conversations"):
+                client.table("conversations").upsert(conversations, on_conflict="id", ignore_duplicates=True).execute()
+        for start in range(0, len(turns), self.batch_size):
+            with timed("supabase", "flush conversation turns"):
+                client.table("conversation_turns").upsert(
+                    turns[start:start + self.batch_size], on_conflict="id", ignore_duplicates=True
+                ).execute()
+
+    def _flush_each(self, client, conversations: List[Dict[str, Any]], turns: List[Dict[str, Any]]) -> int:
+        groups: "OrderedDict[str, Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]]" = OrderedDict()
+        for row in conversations:
+            groups.setdefault(row["id"], ([], []))[0].append(row)
+        for row in turns:
+            groups.setdefault(row["conversation_id"], ([], []))[1].append(row)
+        failed: List[Tuple[List[Dict[str, Any]], List[Dict[str, Any]], Exception]] = []
+        written = 0
+        for index, (headers, rows) in enumerate(groups.values()):
+            if not written and len(failed) >= 3:
+                # The first few all failed: treat it as an outage rather than probing every conversation.
+                # The probed ones go to the back, so bad rows cannot be the only ones probed next time.
+                failed[:0] = [(h, r, failed[-1][2]) for h, r in list(groups.values())[index:]]
+                break
+            try:
+                self._write(client, headers, rows)
+            except Exception as exc:
+                if not self._resequence(headers, rows, exc):
+                    failed.append((headers, rows, exc))
+                continue
+            self._written(headers, rows)
+            written += len(rows)
+        # Re-queued back to front so each conversation's rows keep their order at the head of the queue.
+        for headers, rows, exc in reversed(failed):
+            self._failed(headers, rows, exc, isolated=written > 0)
+        if failed and not written:
+            raise failed[0][2]
+        return written
+
+    def _written(self, conversations: List[Dict[str, Any]], turns: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            for row in conversations:
+                self._attempts.pop(row["id"], None)
+                conversation = self._hot.get(row["id"])
+                if conversation is not None and conversation.pending:
+                    conversation.pending -= 1
+            for row in turns:
+                self._attempts.pop(row["conversation_id"], None)
+                conversation = self._hot.get(row["conversation_id"])
+                if conversation is not None and conversation.pending:
+                    conversation.pending -= 1
+        self.flushed_turns += len(turns)
+
+    def _resequence(self, conversations: List[Dict[str, Any]], turns: List[Dict[str, Any]], exc: Exception) -> bool:
+        """On a ``seq`` clash with turns another worker wrote, renumber and re-queue; False for any other failure."""
+        if not turns or not is_seq_conflict(exc):
+            return False
+        conversation_id = turns[0]["conversation_id"]
+        try:
+            loaded = self._load(conversation_id)
+        except Exception as load_exc:
+            logger.warning("Reloading conversation %s after a seq conflict failed: %s", conversation_id, load_exc)
+            return False
+        if loaded is None:
+            return False
+        with self._lock:
+            # Turns of this conversation queued since the flush started follow the failed ones.
+            queued = [row for row in self._pending_turns if row["conversation_id"] == conversation_id]
+            unflushed = turns + queued
+            for offset, row in enumerate(unflushed):
+                row["seq"] = loaded.next_seq + offset
+            conversation = self._hot.get(conversation_id)
+            if conversation is not None:
+                ids = {row["id"] for row in unflushed}
+                conversation.tail = ([row for row in loaded.tail if row["id"] not in ids] + unflushed)[-self.tail_size:]
+                conversation.next_seq = loaded.next_seq + len(unflushed)
+                conversation.loaded_at = time.monotonic()
+            self._pending_conversations[:0] = conversations
+            self._pending_turns[:0] = turns
+            self.resequenced_turns += len(unflushed)
+        logger.warning(
+            "Conversation %s had turns written by another worker; renumbered %d unflushed turns from seq %d",
+            conversation_id, len(unflushed), loaded.next_seq,
+        )
+        return True
+
+    def _failed(self, conversations: List[Dict[str, Any]], turns: List[Dict[str, Any]], exc: Exception, isolated: bool) -> None:
+        """Re-queue rows of a failed write; ``isolated`` (others went through) counts towards dropping them."""
+        conversation_id = conversations[0]["id"] if conversations else turns[0]["conversation_id"]
+        with self._lock:
+            attempts = self._attempts.get(conversation_id, 0) + (1 if isolated else 0)
+            if attempts < self.max_attempts:
+                if isolated:
+                    self._attempts[conversation_id] = attempts
+                self._pending_conversations[:0] = conversations
+                self._pending_turns[:0] = turns
+                dropped = False
+            else:
+                self._attempts.pop(conversation_id, None)
+                conversation = self._hot.get(conversation_id)
+                if conversation is not None:
+                    conversation.pending = max(conversation.pending - len(conversations) - len(turns), 0)
+                self.dropped_turns += len(turns)
+                dropped = True
+        if dropped:
+            logger.error(
+                "Dropping conversation %s (%d header, %d turn rows) after %d failed flushes: %s",
+                conversation_id, len(conversations), len(turns), attempts, exc,
+            )
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "hotConversations": len(self._hot),
+                "pendingConversations": len(self._pending_conversations),
+                "pendingTurns": len(self._pending_turns),
+                "flushedTurns": self.flushed_turns,
+                "droppedTurns": self.dropped_turns,
+                "resequencedTurns": self.resequenced_turns,
+                "loads": self.loads,
+            }
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
@@ -0,0 +1,109 @@
+"""Run a suite of test conversations against a persona draft in parallel.
+
+``evaluate_cases`` sends each case through a completion callable, at most
+``concurrency`` at a time. It yields one result per case as soon as that case
+finishes, so the endpoint can stream results instead of waiting for the
+slowest one. ``summarize`` folds the results into suite-level stats: how many
+replies fall inside the length guideline, latency percentiles and total token
+usage.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Iterator, List, Sequence, Tuple
+
+from .replies import reply_length
+
+
+def length_verdict(length: int, guideline: Tuple[int, int]) -> str:
+    low, high = guideline
+    if length < low:
+        return "short"
+    if length > high:
+        return "long"
+    return "ok"
+
+
+def usage_to_api(usage: Dict[str, Any]) -> Dict[str, int]:
+    return {
+        "promptTokens": int(usage.get("prompt_tokens") or 0),
+        "completionTokens": int(usage.get("completion_tokens") or 0),
+        "totalTokens": int(usage.get("total_tokens") or 0),
+    }
+
+
+def evaluate_cases(
+    cases: Sequence[Dict[str, Any]],
+    complete: Callable[[List[Dict[str, str]]], Dict[str, Any]],
+    guideline: Tuple[int, int],
+    concurrency: int,
+) -> Iterator[Dict[str, Any]]:
+    """Yield a result per ``{"id", "messages"}`` case in completion order.
+
+    ``complete(messages)`` returns ``{"content", "usage"}``. A failing case
+    becomes an ``ok: false`` result and does not stop the suite.
+    """
+
+    def run(index: int, case: Dict[str, Any]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            reply = complete(case["messages"])
+        except Exception as exc:
+            return {
+                "type": "result",
+                "index": index,
+                "id": case.get("id"),
+                "ok": False,
+                "error": str(getattr(exc, "detail", None) or exc),
+                "latencyMs": round((time.perf_counter() - started) * 1000, 1),
+            }
+        content = reply.get("content") or ""
+        length = reply_length(content)
+        return {
+            "type": "result",
+            "index": index,
+            "id": case.get("id"),
+            "ok": True,
+            "content": content,
+            "chars": length,
+            "length": length_verdict(length, guideline),
+            "latencyMs": round((time.perf_counter() - started) * 1000, 1),
+            "usage": usage_to_api(reply.get("usage") or {}),
+        }
+
+    pool = ThreadPoolExecutor(max_workers=max(concurrency, 1), thread_name_prefix="persona-eval")
+    try:
+        futures = [pool.submit(run, index, case) for index, case in enumerate(cases)]
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        # If the stream is closed early (client gone), cases that have not started are dropped.
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _percentile(ordered: List[float], pct: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def summarize(results: Sequence[Dict[str, Any]], guideline: Tuple[int, int], wall_seconds: float) -> Dict[str, Any]:
+    replies = [result for result in results if result.get("ok")]
+    lengths = [result["chars"] for result in replies]
+    latencies = sorted(result["latencyMs"] for result in replies)
+    verdicts = {"short": 0, "ok": 0, "long": 0}
+    usage = {"promptTokens": 0, "completionTokens": 0, "totalTokens": 0}
+    for result in replies:
+        verdicts[result["length"]] += 1
+        for key in usage:
+            usage[key] += result["usage"][key]
+    return {
+        "type": "summary",
+        "cases": len(results),
+        "ok": len(replies),
+        "failed": len(results) - len(replies),
+        "guideline": {"minChars": guideline[0], "maxChars": guideline[1]},
+        "length": verdicts,
+        "withinGuideline": round(verdicts["ok"] / len(replies), 3) if replies else None,
+        "chars": {"mean": round(sum(lengths) / len(lengths), 1), "min": min(lengths), "max": max(lengths)} if lengths else None,
+        "latencyMs": {"p50": _percentile(latencies, 0.5), "p95": _percentile(latencies, 0.95), "max": latencies[-1]} if latencies else None,
+        "usage": usage,
+        "wallMs": round(wall_seconds * 1000, 1),
+    }
@@ -0,0 +1,278 @@
+"""``Idempotency-Key`` handling for endpoints that are expensive or create rows.
+
+A client sends the same key on every retry of one logical request. Under that
+key, the first request runs the handler and the result is kept for ``ttl``
+seconds:
+
+* a duplicate that arrives while the first is still running waits for it
+  (up to ``wait_timeout``) and receives the same result instead of starting a
+  second paid task;
+* a duplicate that arrives later gets the stored result replayed;
+* a request that reuses the key with a different payload is rejected with 422.
+
+Only successful results are stored. If the handler raises, the key is released
+so the next retry runs again. A waiting duplicate then becomes that retry.
+
+``MemoryStore`` covers one process. ``RedisStore`` shares keys between workers:
+``SET NX`` claims a key and waiters on other workers poll it. While running, the
+claim expires after ``lock_ttl``, so a crashed worker does not block the key
+forever. Redis errors fail open: the handler runs without idempotency and the
+error is logged.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+
+logger = logging.getLogger("wondera")
+
+MAX_KEY_LENGTH = 255
+
+
+def fingerprint(payload: Any) -> str:
+    """Hash of the request payload; a key may only be reused with an identical payload."""
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":"), sort_keys=True, default=str)
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+
+class Claim:
+    """Outcome of ``begin``: ``run`` (caller owns the key), ``replay``, ``pending`` or ``conflict``."""
+
+    __slots__ = ("state", "body")
+
+    def __init__(self, state: str, body: Any = None):
+        self.state = state
+        self.body = body
+
+
+class _Entry:
+    __slots__ = ("fingerprint", "done", "body", "expires", "event")
+
+    def __init__(self, fingerprint: str, expires: float):
+        self.fingerprint = fingerprint
+        self.done = False
+        self.body: Any = None
+        self.expires = expires
+        self.event = threading.Event()
+
+
+class MemoryStore:
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def begin(self, key: str, fingerprint: str, lock_ttl: float) -> Claim:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires <= now:
+                self._entries.pop(key)
+                entry.event.set()
+                entry = None
+            if entry is None:
+                self._entries[key] = _Entry(fingerprint, now + lock_ttl)
+                self._evict_locked(now)
+                return Claim("run")
+            if entry.fingerprint != fingerprint:
+                return Claim("conflict")
+            if entry.done:
+                self._entries.move_to_end(key)
+                return Claim("replay", entry.body)
+            return Claim("pending")
+
+    def wait(self, key: str, timeout: float) -> None:
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and not entry.done:
+            entry.event.wait(timeout)
+
+    def complete(self, key: str, fingerprint: str, body: Any, ttl: float) -> None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.fingerprint != fingerprint:
+                return
+            entry.done = True
+            entry.body = body
+            entry.expires = time.monotonic() + ttl
+        entry.event.set()
+
+    def release(self, key: str, fingerprint: str) -> None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.done or entry.fingerprint != fingerprint:
+                return
+            self._entries.pop(key)
+        entry.event.set()
+
+    def _evict_locked(self, now: float) -> None:
+        # Expired entries first; beyond that the oldest stored results go, never running ones.
+        if len(self._entries) <= self.max_entries:
+            return
+        for key in [key for key, entry in self._entries.items() if entry.expires <= now]:
+            self._entries.pop(key).event.set()
+        for key in list(self._entries):
+            if len(self._entries) <= self.max_entries:
+                break
+            if self._entries[key].done:
+                self._entries.pop(key)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# Deletes a claim only while it is still the pending value this worker wrote.
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class RedisStore:
+    def __init__(self, client, namespace: str = "wondera:idempotency", poll_interval: float = 0.25, retry_after: float = 5.0):
+        self.client = client
+        self.namespace = namespace
+        self.poll_interval = poll_interval
+        self.retry_after = retry_after
+        self._release = client.register_script(_RELEASE_SCRIPT)
+        self._down_until = 0.0
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    @staticmethod
+    def _pending(fingerprint: str) -> str:
+        return json.dumps({"fp": fingerprint, "done": False}, separators=(",", ":"))
+
+    def _unavailable(self, exc: Exception) -> None:
+        self._down_until = time.monotonic() + self.retry_after
+        logger.warning("Idempotency Redis unavailable for %.0fs, running requests without keys: %s", self.retry_after, exc)
+
+    def begin(self, key: str, fingerprint: str, lock_ttl: float) -> Optional[Claim]:
+        """None when Redis is unavailable; the caller runs the handler unprotected."""
+        if time.monotonic() < self._down_until:
+            return None
+        try:
+            for _ in range(3):
+                if self.client.set(self._key(key), self._pending(fingerprint), nx=True, px=int(lock_ttl * 1000)):
+                    return Claim("run")
+                raw = self.client.get(self._key(key))
+                if raw is None:
+                    continue  # Expired or released between SET and GET.
+                record = json.loads(raw)
+                if record.get("fp") != fingerprint:
+                    return Claim("conflict")
+                if record.get("done"):
+                    return Claim("replay", record.get("body"))
+                return Claim("pending")
+        except Exception as exc:
+            self._unavailable(exc)
+            return None
+        return Claim("pending")
+
+    def wait(self, key: str, timeout: float) -> None:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            time.sleep(min(self.poll_interval, max(deadline - time.monotonic(), 0.0)))
+            try:
+                raw = self.client.get(self._key(key))
+            except Exception as exc:
+                self._unavailable(exc)
+                return
+            if raw is None or json.loads(raw).get("done"):
+                return
+
+    def complete(self, key: str, fingerprint: str, body: Any, ttl: float) -> None:
+        record = json.dumps({"fp": fingerprint, "done": True, "body": body}, ensure_ascii=False, separators=(",", ":"), default=str)
+        try:
+            self.client.set(self._key(key), record, px=int(ttl * 1000))
+        except Exception as exc:
+            self._unavailable(exc)
+
+    def release(self, key: str, fingerprint: str) -> None:
+        try:
+            self._release(keys=[self._key(key)], args=[self._pending(fingerprint)])
+        except Exception as exc:
+            self._unavailable(exc)
+
+
+class IdempotencyKeys:
+    def __init__(self, store, ttl: float = 86400.0, lock_ttl: float = 600.0, wait_timeout: float = 180.0):
+        self.store = store
+        self.ttl = ttl
+        self.lock_ttl = lock_ttl
+        self.wait_timeout = wait_timeout
+        self.outcomes: Dict[str, int] = {"executed": 0, "replayed": 0, "attached": 0, "conflict": 0, "timeout": 0, "unprotected": 0}
+
+    def run(self, scope: str, key: str, payload: Any, fn: Callable[[], Any]) -> Tuple[Any, str]:
+        """Run ``fn`` at most once per (scope, key); returns (result, outcome)."""
+        key = (key or "").strip()
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise HTTPException(status_code=400, detail=f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters")
+        full_key = f"{scope}:{key}"
+        digest = fingerprint(payload)
+        deadline = time.monotonic() + self.wait_timeout
+        waited = False
+        while True:
+            claim = self.store.begin(full_key, digest, self.lock_ttl)
+            if claim is None:
+                return fn(), self._count("unprotected")
+            if claim.state == "conflict":
+                self._count("conflict")
+                raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request payload")
+            if claim.state == "replay":
+                return claim.body, self._count("attached" if waited else "replayed")
+            if claim.state == "pending":
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._count("timeout")
+                    raise HTTPException(
+                        status_code=409,
+                        detail="A request with this Idempotency-Key is still in progress",
+                        headers={"Retry-After": "5"},
+                    )
+                self.store.wait(full_key, remaining)
+                waited = True
+                continue
+            try:
+                result = fn()
+            except BaseException:
+                self.store.release(full_key, digest)
+                raise
+            self.store.complete(full_key, digest, result, self.ttl)
+            return result, self._count("executed")
+
+    def _count(self, outcome: str) -> str:
+        self.outcomes[outcome] += 1
+        return outcome
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "backend": type(self.store).__name__,
+            "ttl": self.ttl,
+            "lockTtl": self.lock_ttl,
+            "waitTimeout": self.wait_timeout,
+            "outcomes": dict(self.outcomes),
+        }
+
+
+def build_idempotency(backend: str, redis_url: Optional[str], ttl: float, lock_ttl: float, wait_timeout: float, max_entries: int) -> Optional[IdempotencyKeys]:
+    """IDEMPOTENCY_BACKEND: ``memory`` (default), ``redis`` or ``off``."""
+    backend = (backend or "memory").strip().lower()
+    if backend == "off":
+        return None
+    if backend == "redis" and redis_url:
+        import redis
+
+        client = redis.Redis.from_url(redis_url, socket_timeout=1.0, socket_connect_timeout=1.0)
+        return IdempotencyKeys(RedisStore(client), ttl, lock_ttl, wait_timeout)
+    if backend != "memory":
+        logger.warning("IDEMPOTENCY_BACKEND=%s needs REDIS_URL; keys are kept per process", backend)
+    return IdempotencyKeys(MemoryStore(max_entries), ttl, lock_ttl, wait_timeout)
@@ -1,29 +1,71 @@
+import base64
+import itertools
+import json
+import logging
+import math
 import os
 import re
 import secrets
+import threading
 import uuid
 import mimetypes
 import time
-from datetime import date
-from typing import Any, Dict, List, Optional
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, time as dt_time, timedelta
+from urllib.parse import quote
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Sequence, Set, Tuple
 
-import httpx
+import anyio
 from dotenv import load_dotenv
-from fastapi import Depends, FastAPI, File, HTTPException, Query, UploadFile
+from fastapi import Depends, FastAPI, File, Header, HTTPException, Query, Request, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, RedirectResponse, Response, StreamingResponse
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from pydantic import BaseModel, Field
-from supabase import Client, create_client
+
+from .assets import DiskAssetCache
+from .bulkhead import BULKHEADS, BulkheadRoute
+from .conversations import ConversationStore, turn_to_api
+from .evaluation import evaluate_cases, summarize
+from .cache import build_cache
+from .idempotency import build_idempotency
+from .memory import DashScopeEmbedder, HashingEmbedder, MemoryIndex
+from .metrics import REGISTRY, MetricsMiddleware, timed
+from .ndjson import DEFAULT_CHUNK_SIZE, NDJSON_TABLES, NdjsonDecoder, NdjsonError, encode_rows, iter_table_rows, upsert_chunk
+from .pg import PostgresGateway
+from .profiling import ProfileStore, ProfilingMiddleware, StackSampler
+from .ratelimit import MemoryBackend, build_rate_limiter
+from .ranking import FeedRanker, parse_timestamp
+from .replies import SentenceCutter, max_tokens_for, reply_length, trim_reply
+from .sampling import TemplateSampler, parse_difficulty_mix
+from .scheduler import PeriodicJob
+from .search import SearchIndex
+from .snapshots import SnapshotPublisher
+from .tracing import STAGES, TraceBuffer, WanTrace
+from .warmup import WarmUp
+
+if TYPE_CHECKING:
+    import httpx
+    from supabase import Client
 
 load_dotenv()
 
+logger = logging.getLogger("wondera")
+
 app = FastAPI(title="Wondera Backend", version="0.1.0")
+# Must be set before any route is declared: sync handlers run in per-class bulkhead pools.
+app.router.route_class = BulkheadRoute
 security = HTTPBasic()
 
-_SUPABASE_CLIENT: Optional[Client] = None
+# supabase and httpx are imported on first use (normally by the warm-up thread): together they
+# are about a third of module import time, which a fresh worker would otherwise pay before binding.
+_SUPABASE_CLIENT: Optional["Client"] = None
+_HTTP_CLIENT: Optional["httpx.Client"] = None
+_CLIENTS_LOCK = threading.Lock()
 
 
-def get_supabase() -> Client:
+def get_supabase() -> "Client":
     global _SUPABASE_CLIENT
     if _SUPABASE_CLIENT is not None:
         return _SUPABASE_CLIENT
@@ -31,11 +73,84 @@ def get_supabase() -> Client:
     key = (os.getenv("SUPABASE_SERVICE_KEY") or os.getenv("SUPABASE_ANON_KEY") or "").strip()
     if not url or not key:
         raise RuntimeError("SUPABASE_URL and SUPABASE_SERVICE_KEY (or SUPABASE_ANON_KEY) are required")
-    _SUPABASE_CLIENT = create_client(url, key)
+    with _CLIENTS_LOCK:
+        if _SUPABASE_CLIENT is None:
+            from supabase import create_client
+
+            _SUPABASE_CLIENT = create_client(url, key)
     return _SUPABASE_CLIENT
 
 
+def get_http_client() -> "httpx.Client":
+    """Process-wide keep-alive client for DashScope and asset downloads (reuses TCP/TLS connections)."""
+    global _HTTP_CLIENT
+    if _HTTP_CLIENT is None:
+        with _CLIENTS_LOCK:
+            if _HTTP_CLIENT is None:
+                import httpx
+
+                _HTTP_CLIENT = httpx.Client(
+                    timeout=60.0,
+                    limits=httpx.Limits(
+                        max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "64")),
+                        max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE", "16")),
+                        keepalive_expiry=60.0,
+                    ),
+                )
+    return _HTTP_CLIENT
+
+
+# DATA_BACKEND=postgres routes the hot reads through a direct asyncpg pool; Supabase stays the fallback.
+DATA_BACKEND = (os.getenv("DATA_BACKEND") or "supabase").strip().lower()
+PG_RETRY_SECONDS = 30.0
+_PG_GATEWAY: Optional[PostgresGateway] = None
+_PG_FAILED_AT = 0.0
+_PG_LOCK = threading.Lock()
+
+
+def get_pg_gateway() -> Optional[PostgresGateway]:
+    global _PG_GATEWAY, _PG_FAILED_AT
+    if DATA_BACKEND != "postgres":
+        return None
+    if _PG_GATEWAY is not None:
+        return _PG_GATEWAY
+    dsn = (os.getenv("DATABASE_URL") or "").strip()
+    if not dsn or time.monotonic() - _PG_FAILED_AT < PG_RETRY_SECONDS:
+        return None
+    with _PG_LOCK:
+        if _PG_GATEWAY is None:
+            try:
+                _PG_GATEWAY = PostgresGateway(
+                    dsn,
+                    min_size=int(os.getenv("PG_POOL_MIN", "2")),
+                    max_size=int(os.getenv("PG_POOL_MAX", "10")),
+                    statement_cache_size=int(os.getenv("PG_STATEMENT_CACHE_SIZE", "100")),
+                ).start()
+            except Exception:
+                _PG_FAILED_AT = time.monotonic()
+                logger.exception("Postgres pool unavailable, falling back to Supabase")
+                return None
+    return _PG_GATEWAY
+
+
+def read_via_postgres(method: str, *args):
+    """Run a hot read on the Postgres gateway; None means "use Supabase instead"."""
+    gateway = get_pg_gateway()
+    if gateway is None:
+        return None
+    try:
+        with timed("postgres", method):
+            return (getattr(gateway, method)(*args),)
+    except Exception:
+        logger.exception("Postgres %s failed, falling back to Supabase", method)
+        return None
+
+
 def ensure_ok(response, context: str = "request"):
+    """Accepts an executed response, or a query builder that is executed (and timed) here."""
+    if hasattr(response, "execute"):
+        with timed("supabase", context):
+            response = response.execute()
     if hasattr(response, "error") and response.error:
         message = getattr(response.error, "message", None) or str(response.error)
         raise HTTPException(status_code=500, detail=f"Supabase {context} failed: {message}")
@@ -46,8 +161,8 @@ def role_to_api(row: Dict[str, Any]) -> Dict[str, Any]:
     return {
         "id": row.get("id"),
         "name": row.get("name"),
-        "avatar": row.get("avatar_url") or row.get("avatar"),
-        "heroImage": row.get("hero_image_url") or row.get("hero_image"),
+        "avatar": edge_asset_url(row.get("avatar_url") or row.get("avatar")),
+        "heroImage": edge_asset_url(row.get("hero_image_url") or row.get("hero_image")),
         "persona": row.get("persona"),
         "mood": row.get("mood"),
         "greeting": row.get("greeting"),
@@ -56,14 +171,28 @@ def role_to_api(row: Dict[str, Any]) -> Dict[str, Any]:
         "description": row.get("description"),
         "tags": row.get("tags") or [],
         "script": row.get("script") or [],
+        "replyMaxChars": row.get("reply_max_chars"),
         "status": row.get("status"),
         "createdAt": row.get("created_at"),
         "updatedAt": row.get("updated_at"),
     }
 
 
-def explore_to_api(row: Dict[str, Any]) -> Dict[str, Any]:
+def role_card_to_api(row: Dict[str, Any]) -> Dict[str, Any]:
     return {
+        "id": row.get("id"),
+        "name": row.get("name"),
+        "avatar": edge_asset_url(row.get("avatar_url") or row.get("avatar")),
+        "heroImage": edge_asset_url(row.get("hero_image_url") or row.get("hero_image")),
+        "title": row.get("title"),
+        "city": row.get("city"),
+        "mood": row.get("mood"),
+        "tags": row.get("tags") or [],
+    }
+
+
+def explore_to_api(row: Dict[str, Any], role_cards: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Any]:
+    data = {
         "id": row.get("id"),
         "type": row.get("type"),
         "postType": row.get("post_type"),
@@ -86,6 +215,12 @@ def explore_to_api(row: Dict[str, Any]) -> Dict[str, Any]:
         "targetRoleId": row.get("target_role_id"),
         "recommendedRoles": row.get("recommended_roles") or [],
     }
+    if role_cards is not None:
+        data["targetRole"] = role_cards.get(row.get("target_role_id") or "")
+        data["recommendedRoleCards"] = [
+            role_cards[role_id] for role_id in (row.get("recommended_roles") or []) if role_id in role_cards
+        ]
+    return data
 
 
 def model_to_dict(model):
@@ -112,21 +247,69 @@ def require_admin(credentials: HTTPBasicCredentials = Depends(security)) -> str:
     return credentials.username
 
 
+def admin_authorization_ok(authorization: Optional[str]) -> bool:
+    """require_admin for a raw Authorization header, for checks made outside FastAPI dependencies."""
+    scheme, _, encoded = (authorization or "").partition(" ")
+    admin = get_admin_credentials()
+    if scheme.lower() != "basic" or not admin["user"] or not admin["password"]:
+        return False
+    try:
+        username, _, password = base64.b64decode(encoded).decode("utf-8").partition(":")
+    except ValueError:
+        return False
+    user_ok = secrets.compare_digest(username, admin["user"])
+    pass_ok = secrets.compare_digest(password, admin["password"])
+    return user_ok and pass_ok
+
+
 def sanitize_filename(name: str) -> str:
     safe = re.sub(r"[^a-zA-Z0-9._-]", "_", name or "upload")
     return safe[:120] or "upload"
 
 
-def build_public_url(bucket: str, path: str) -> str:
+# When set, Storage URLs in API output are rewritten to this API's /assets edge cache.
+# Rows always store origin URLs, so changing the base or the cached buckets needs no data migration.
+ASSET_PUBLIC_BASE = (os.getenv("ASSET_PUBLIC_BASE") or "").strip().rstrip("/")
+
+
+def storage_origin_url(bucket: str, path: str) -> Optional[str]:
+    """Public Supabase Storage URL of an object, or None when Storage is not configured."""
     base = os.getenv("SUPABASE_STORAGE_PUBLIC_URL")
     if base:
         return f"{base.rstrip('/')}/{bucket}/{path}"
     url = os.getenv("SUPABASE_URL", "").rstrip("/")
     if not url:
-        return f"/storage/{bucket}/{path}"
+        return None
     return f"{url}/storage/v1/object/public/{bucket}/{path}"
 
 
+def build_public_url(bucket: str, path: str) -> str:
+    """The URL to store for an uploaded object: always the Storage origin (see edge_asset_url for output)."""
+    return storage_origin_url(bucket, path) or f"/assets/{bucket}/{path}"
+
+
+def edge_asset_url(url: Optional[str]) -> Optional[str]:
+    """Point a stored Storage URL at the /assets route (only with ASSET_PUBLIC_BASE, only for cached buckets)."""
+    if not ASSET_PUBLIC_BASE or not url:
+        return url
+    for bucket in ASSET_CACHE_BUCKETS:
+        prefix = storage_origin_url(bucket, "")
+        if prefix and url.startswith(prefix):
+            return f"{ASSET_PUBLIC_BASE}/assets/{bucket}/{url[len(prefix):]}"
+    return url
+
+
+def parse_id_list(value: Optional[str], max_items: int = 100) -> List[str]:
+    ids: List[str] = []
+    for item in (value or "").split(","):
+        item = item.strip()
+        if item and item not in ids:
+            ids.append(item)
+    if len(ids) > max_items:
+        raise HTTPException(status_code=400, detail=f"At most {max_items} ids per request")
+    return ids
+
+
 def parse_cors_origins(value: Optional[str]) -> List[str]:
     if not value:
         return ["*"]
@@ -139,6 +322,18 @@ app.add_middleware(
     allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-RateLimit-Limit", "X-RateLimit-Remaining", "X-RateLimit-Reset", "X-RateLimit-Cost", "Retry-After", "Idempotent-Replayed"],
+)
+app.add_middleware(MetricsMiddleware)
+
+# Admin requests with `X-Profile: cprofile|sample` (or `?_profile=`) are profiled; the slowest are kept.
+PROFILE_STORE = ProfileStore(int(os.getenv("PROFILE_STORE_SIZE", "20")))
+app.add_middleware(
+    ProfilingMiddleware,
+    store=PROFILE_STORE,
+    sampler=StackSampler(float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5")) / 1000),
+    is_admin=admin_authorization_ok,
+    sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", "0")),
 )
 
 
@@ -155,6 +350,7 @@ class RoleCreate(BaseModel):
     description: Optional[str] = None
     tags: List[str] = Field(default_factory=list)
     script: List[str] = Field(default_factory=list)
+    reply_max_chars: Optional[int] = Field(None, ge=10, le=2000, description="单条回复字数上限，留空用全局设定")
     status: Optional[str] = "published"
 
 
@@ -170,6 +366,7 @@ class RoleUpdate(BaseModel):
     description: Optional[str] = None
     tags: Optional[List[str]] = None
     script: Optional[List[str]] = None
+    reply_max_chars: Optional[int] = Field(None, ge=10, le=2000)
     status: Optional[str] = None
 
 
@@ -236,52 +433,242 @@ class DailyTemplateUpdate(BaseModel):
     target_words: Optional[List[str]] = None
     reward_points: Optional[int] = None
 
+
+BATCH_MAX_ITEMS = 500
+
+
+class RoleBatchUpdate(BaseModel):
+    id: str
+    changes: RoleUpdate
+
+
+class RoleBatchRequest(BaseModel):
+    create: List[RoleCreate] = Field(default_factory=list, max_length=BATCH_MAX_ITEMS)
+    update: List[RoleBatchUpdate] = Field(default_factory=list, max_length=BATCH_MAX_ITEMS)
+
+
+class ExploreItemBatchUpdate(BaseModel):
+    id: str
+    changes: ExploreItemUpdate
+
+
+class ExploreItemBatchRequest(BaseModel):
+    create: List[ExploreItemCreate] = Field(default_factory=list, max_length=BATCH_MAX_ITEMS)
+    update: List[ExploreItemBatchUpdate] = Field(default_factory=list, max_length=BATCH_MAX_ITEMS)
+    delete: List[str] = Field(default_factory=list, max_length=BATCH_MAX_ITEMS)
+
+
+class DailyTemplateBatchUpdate(BaseModel):
+    id: str
+    changes: DailyTemplateUpdate
+
+
+class DailyTemplateBatchRequest(BaseModel):
+    create: List[DailyTemplateCreate] = Field(default_factory=list, max_length=BATCH_MAX_ITEMS)
+    update: List[DailyTemplateBatchUpdate] = Field(default_factory=list, max_length=BATCH_MAX_ITEMS)
+    delete: List[str] = Field(default_factory=list, max_length=BATCH_MAX_ITEMS)
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
 
+WARMUP = WarmUp()
+
+
+@app.get("/ready")
+async def ready():
+    """Readiness: 200 once clients, connections and catalog indexes are warm, 503 until then."""
+    state = WARMUP.snapshot()
+    if not state["ready"]:
+        return JSONResponse(state, status_code=503)
+    return state
+
+
+# ------------------- Metrics -------------------
+
+METRICS_TOKEN = (os.getenv("METRICS_TOKEN") or "").strip()
+
+
+def _bulkhead_gauge(field: str):
+    return lambda: [((name,), pool.snapshot()[field]) for name, pool in BULKHEADS.pools.items()]
+
+
+REGISTRY.gauge("wondera_bulkhead_running", "Sync handlers running per bulkhead.", ("pool",), _bulkhead_gauge("running"))
+REGISTRY.gauge("wondera_bulkhead_waiting", "Sync handlers queued per bulkhead.", ("pool",), _bulkhead_gauge("waiting"))
+REGISTRY.gauge("wondera_bulkhead_rejected", "Requests rejected by a full bulkhead since start.", ("pool",), _bulkhead_gauge("rejected"))
+
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics(authorization: Optional[str] = Header(None)):
+    if METRICS_TOKEN and not secrets.compare_digest(authorization or "", f"Bearer {METRICS_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+# ------------------- Idempotency keys -------------------
+
+# Retries that carry the same Idempotency-Key share one execution: see app/idempotency.py.
+IDEMPOTENCY = build_idempotency(
+    os.getenv("IDEMPOTENCY_BACKEND", "memory"),
+    (os.getenv("REDIS_URL") or "").strip() or None,
+    ttl=float(os.getenv("IDEMPOTENCY_TTL", "86400")),
+    lock_ttl=float(os.getenv("IDEMPOTENCY_LOCK_TTL", "600")),
+    wait_timeout=float(os.getenv("IDEMPOTENCY_WAIT", "180")),
+    max_entries=int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000")),
+)
+
+
+def idempotent(scope: str):
+    """Dependency returning ``run(payload, fn)``, which applies the request's Idempotency-Key to ``fn()``.
+
+    Without the header (or with IDEMPOTENCY_BACKEND=off) ``fn()`` simply runs. With it, a rate-limit
+    charge deferred by ``rate_limited`` is taken only if ``fn()`` actually runs, so replays are free.
+    """
+
+    def dependency(
+        request: Request, response: Response, idempotency_key: Optional[str] = Header(None)
+    ) -> Callable[[BaseModel, Callable[[], Any]], Any]:
+        def run(payload: BaseModel, fn: Callable[[], Any]) -> Any:
+            if IDEMPOTENCY is None or idempotency_key is None:
+                return fn()
+            endpoint = getattr(request.state, "deferred_rate_limit", None)
+
+            def execute() -> Any:
+                if endpoint is not None:
+                    apply_rate_limit(RATE_LIMITER.hit(client_identity(request), endpoint), endpoint, response)
+                return fn()
+
+            result, outcome = IDEMPOTENCY.run(scope, idempotency_key, model_to_dict(payload), execute)
+            if outcome in ("replayed", "attached"):
+                response.headers["Idempotent-Replayed"] = "true"
+            return result
+
+        return run
+
+    return dependency
+
+
+# ------------------- Catalog cache -------------------
+
+# Role rows (role:<id>), explore rows (explore:<id>) and explore list pages (group explore_pages).
+# Writes go through notify_catalog_change, which evicts here and, with Redis, in every other worker.
+CACHE = build_cache(
+    os.getenv("CACHE_BACKEND", "local"),
+    (os.getenv("REDIS_URL") or "").strip() or None,
+    ttl=float(os.getenv("CACHE_TTL", "300")),
+    local_ttl=float(os.getenv("CACHE_LOCAL_TTL", "30")),
+    max_entries=int(os.getenv("CACHE_MAX_ENTRIES", "10000")),
+)
+EXPLORE_PAGES_GROUP = "explore_pages"
+
+
+def fetch_roles_by_ids(role_ids: List[str], include_unpublished: bool = True) -> Dict[str, Dict[str, Any]]:
+    """Cached role rows keyed by id; the misses are fetched with one `in_` query."""
+    if not role_ids:
+        return {}
+    cached = CACHE.get_many([f"role:{role_id}" for role_id in role_ids])
+    rows = {key[len("role:"):]: row for key, row in cached.items()}
+    missing = [role_id for role_id in role_ids if role_id not in rows]
+    if missing:
+        supabase = get_supabase()
+        result = ensure_ok(supabase.table("roles").select("*").in_("id", missing), context="get roles by ids")
+        for row in result or []:
+            rows[row.get("id")] = row
+            CACHE.set(f"role:{row.get('id')}", row)
+    if not include_unpublished:
+        rows = {role_id: row for role_id, row in rows.items() if row.get("status") == "published"}
+    return rows
+
+
+def fetch_role_cards(rows: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Resolve target/recommended roles of explore rows into role cards with a single query."""
+    role_ids: List[str] = []
+    for row in rows:
+        for role_id in [row.get("target_role_id")] + list(row.get("recommended_roles") or []):
+            if role_id and role_id not in role_ids:
+                role_ids.append(role_id)
+    roles = fetch_roles_by_ids(role_ids, include_unpublished=False)
+    return {role_id: role_card_to_api(row) for role_id, row in roles.items()}
+
+
 @app.get("/roles")
 def list_roles(
     include_unpublished: bool = Query(False, description="Include non-published roles"),
     limit: int = Query(100, ge=1, le=500),
     offset: int = Query(0, ge=0),
+    ids: Optional[str] = Query(None, description="Comma-separated role ids to fetch in one request"),
 ):
+    if ids:
+        role_ids = parse_id_list(ids)
+        by_id = fetch_roles_by_ids(role_ids, include_unpublished=include_unpublished)
+        return [role_to_api(by_id[role_id]) for role_id in role_ids if role_id in by_id]
     supabase = get_supabase()
     query = supabase.table("roles").select("*").order("name", desc=False).range(offset, offset + limit - 1)
     if not include_unpublished:
         query = query.eq("status", "published")
-    result = ensure_ok(query.execute(), context="list roles")
+    result = ensure_ok(query, context="list roles")
     return [role_to_api(row) for row in (result or [])]
 
 
+def load_role_row(role_id: str, context: str = "get role") -> Optional[Dict[str, Any]]:
+    def load():
+        direct = read_via_postgres("role_by_id", role_id)
+        if direct is not None:
+            return direct[0]
+        supabase = get_supabase()
+        return ensure_ok(
+            supabase.table("roles").select("*").eq("id", role_id).single(),
+            context=context,
+        )
+
+    return CACHE.get_or_load(f"role:{role_id}", load)
+
+
 @app.get("/roles/{role_id}")
 def get_role(role_id: str):
-    supabase = get_supabase()
-    result = ensure_ok(
-        supabase.table("roles").select("*").eq("id", role_id).single().execute(),
-        context="get role",
-    )
+    result = load_role_row(role_id)
     if not result:
         raise HTTPException(status_code=404, detail="Role not found")
     return role_to_api(result)
 
 
 # Supabase roles 表欄位（與 seed roles.json 一致，不含 status 以免表無此欄時報錯）
-_ROLES_INSERT_KEYS = ("id", "name", "avatar_url", "hero_image_url", "persona", "mood", "greeting", "title", "city", "description", "tags", "script")
+_ROLES_INSERT_KEYS = ("id", "name", "avatar_url", "hero_image_url", "persona", "mood", "greeting", "title", "city", "description", "tags", "script", "reply_max_chars")
 
 
-@app.post("/roles")
-def create_role(payload: RoleCreate):
-    supabase = get_supabase()
-    role_id = payload.id or f"role-{uuid.uuid4().hex[:10]}"
+def role_insert_data(payload: RoleCreate) -> Dict[str, Any]:
     raw = payload.model_dump(exclude_none=True)
     data = {k: raw[k] for k in _ROLES_INSERT_KEYS if k in raw}
-    data["id"] = role_id
+    data["id"] = payload.id or f"role-{uuid.uuid4().hex[:10]}"
     data.setdefault("name", payload.name)
-    result = ensure_ok(supabase.table("roles").insert(data).execute(), context="create role")
+    return data
+
+
+def explore_insert_data(payload: ExploreItemCreate) -> Dict[str, Any]:
+    data = model_to_dict(payload)
+    data["id"] = payload.id or f"explore-{uuid.uuid4().hex[:10]}"
+    return data
+
+
+def template_insert_data(payload: DailyTemplateCreate) -> Dict[str, Any]:
+    data = model_to_dict(payload)
+    data["id"] = payload.id or f"template-{uuid.uuid4().hex[:10]}"
+    return data
+
+
+@app.post("/roles")
+def create_role(payload: RoleCreate, run=Depends(idempotent("create_role"))):
+    return run(payload, lambda: insert_role(payload))
+
+
+def insert_role(payload: RoleCreate) -> Dict[str, Any]:
+    supabase = get_supabase()
+    data = role_insert_data(payload)
+    result = ensure_ok(supabase.table("roles").insert(data), context="create role")
     if not result:
         raise HTTPException(status_code=500, detail="Failed to create role")
+    notify_catalog_change("roles", rows=result)
     return role_to_api(result[0])
 
 
@@ -292,11 +679,12 @@ def update_role(role_id: str, payload: RoleUpdate):
     if not updates:
         raise HTTPException(status_code=400, detail="No updates provided")
     result = ensure_ok(
-        supabase.table("roles").update(updates).eq("id", role_id).execute(),
+        supabase.table("roles").update(updates).eq("id", role_id),
         context="update role",
     )
     if not result:
         raise HTTPException(status_code=404, detail="Role not found")
+    notify_catalog_change("roles", rows=result)
     return role_to_api(result[0])
 
 
@@ -306,40 +694,272 @@ DASHSCOPE_API_KEY = (os.getenv("DASHSCOPE_API_KEY") or os.getenv("BAILIAN_API_KE
 DASHSCOPE_ENDPOINT = (os.getenv("DASHSCOPE_ENDPOINT") or "https://dashscope.aliyuncs.com").strip().rstrip("/")
 CHAT_COMPLETIONS_PATH = "/compatible-mode/v1/chat/completions"
 DEFAULT_CHAT_MODEL = os.getenv("DASHSCOPE_CHAT_MODEL", "qwen-turbo")
+# Reply length the system prompt asks for, in characters.
+REPLY_GUIDELINE = (30, 80)
+# Server-enforced upper bound; a role's reply_max_chars overrides it, 0 disables the default.
+REPLY_MAX_CHARS = int(os.getenv("REPLY_MAX_CHARS", str(REPLY_GUIDELINE[1])))
+REPLY_TOKENS_PER_CHAR = float(os.getenv("REPLY_TOKENS_PER_CHAR", "1.0"))
+REPLY_TOKEN_HEADROOM = float(os.getenv("REPLY_TOKEN_HEADROOM", "1.5"))
+REPLY_STREAM = os.getenv("REPLY_STREAM", "1") != "0"
+REPLY_OUTCOMES = REGISTRY.counter(
+    "wondera_reply_budget_total", "Budgeted chat replies by outcome (within, trimmed, cut).", ("outcome",)
+)
+REPLY_TOKENS = REGISTRY.counter(
+    "wondera_reply_tokens_total",
+    "Completion tokens of budgeted replies: used, discarded (trimmed away) and saved (not generated, estimated).",
+    ("kind",),
+)
+
+
+def reply_budget(role: Dict[str, Any]) -> Optional[int]:
+    value = role.get("reply_max_chars") or REPLY_MAX_CHARS
+    return int(value) if value and int(value) > 0 else None
+
+
+def reply_guideline(role: Dict[str, Any]) -> Tuple[int, int]:
+    budget = reply_budget(role) or REPLY_GUIDELINE[1]
+    return min(REPLY_GUIDELINE[0], budget), budget
 
 
 def build_system_prompt(role: Dict[str, Any]) -> str:
     name = role.get("name") or "角色"
     persona = (role.get("persona") or "").strip()
     greeting = (role.get("greeting") or "").strip()
+    low, high = reply_guideline(role)
     parts = [f"请严格扮演「{name}」，具备以下设定：", persona]
     if greeting:
         parts.append(f"首句/开场示例：{greeting[:200]}")
-    parts.append("回复要求：只用口语化第一人称对话，不写旁白、动作或场景描写；不要使用括号/星号等舞台指令；保持简短，单条回复尽量控制在30-80个汉字。")
+    parts.append(f"回复要求：只用口语化第一人称对话，不写旁白、动作或场景描写；不要使用括号/星号等舞台指令；保持简短，单条回复尽量控制在{low}-{high}个汉字。")
     return "\n\n".join(p for p in parts if p)
 
 
-def call_qwen(system: str, messages: List[Dict[str, str]], model: str = DEFAULT_CHAT_MODEL) -> str:
+def call_qwen(system: str, messages: List[Dict[str, str]], model: str = DEFAULT_CHAT_MODEL, max_chars: Optional[int] = None) -> str:
+    return call_qwen_detailed(system, messages, model, max_chars)["content"]
+
+
+def call_qwen_detailed(
+    system: str,
+    messages: List[Dict[str, str]],
+    model: str = DEFAULT_CHAT_MODEL,
+    max_chars: Optional[int] = None,
+) -> Dict[str, Any]:
+    """The reply plus the upstream ``usage`` block (prompt/completion/total tokens).
+
+    With ``max_chars`` the request carries a derived ``max_tokens`` and the
+    reply is trimmed to whole sentences within the budget. With REPLY_STREAM,
+    the reply is streamed and the stream is closed as soon as the cut point is
+    known.
+    """
     if not DASHSCOPE_API_KEY:
         raise HTTPException(status_code=503, detail="DASHSCOPE_API_KEY (or BAILIAN_API_KEY) not configured")
     url = f"{DASHSCOPE_ENDPOINT}{CHAT_COMPLETIONS_PATH}"
+    headers = {"Authorization": f"Bearer {DASHSCOPE_API_KEY}", "Content-Type": "application/json"}
     payload = {
         "model": model,
         "messages": [{"role": "system", "content": system}] + messages,
         "temperature": 0.7,
         "top_p": 0.8,
     }
-    with httpx.Client(timeout=60.0) as client:
-        resp = client.post(
-            url,
-            headers={"Authorization": f"Bearer {DASHSCOPE_API_KEY}", "Content-Type": "application/json"},
-            json=payload,
-        )
+    max_tokens = 0
+    if max_chars:
+        max_tokens = max_tokens_for(max_chars, REPLY_TOKENS_PER_CHAR, REPLY_TOKEN_HEADROOM)
+        payload["max_tokens"] = max_tokens
+        if REPLY_STREAM:
+            raw, usage, finish_reason, cutter = stream_qwen(url, headers, payload, max_chars)
+            content = cutter.text(truncated=finish_reason == "length")
+            record_reply_budget(raw, content, usage, max_tokens, cut=cutter.cut)
+            return {"content": content, "usage": usage}
+    with timed("dashscope", "chat"):
+        resp = get_http_client().post(url, headers=headers, json=payload)
     if resp.status_code != 200:
         raise HTTPException(status_code=502, detail=f"Qwen API error: {resp.status_code} - {resp.text[:300]}")
     data = resp.json()
-    content = (data.get("choices") or [{}])[0].get("message", {}).get("content", "")
-    return (content or "").strip()
+    choice = (data.get("choices") or [{}])[0]
+    raw = choice.get("message", {}).get("content") or ""
+    usage = data.get("usage") or {}
+    if not max_chars:
+        return {"content": raw.strip(), "usage": usage}
+    content = trim_reply(raw, max_chars, truncated=choice.get("finish_reason") == "length")
+    record_reply_budget(raw, content, usage, max_tokens, cut=False)
+    return {"content": content, "usage": usage}
+
+
+def stream_qwen(url: str, headers: Dict[str, str], payload: Dict[str, Any], max_chars: int):
+    """Read an SSE completion until it ends or the cutter decides; returns (raw text, usage, finish_reason, cutter)."""
+    cutter = SentenceCutter(max_chars)
+    usage: Dict[str, Any] = {}
+    finish_reason = None
+    body = {**payload, "stream": True, "stream_options": {"include_usage": True}}
+    with timed("dashscope", "chat stream"):
+        with get_http_client().stream("POST", url, headers=headers, json=body) as resp:
+            if resp.status_code != 200:
+                resp.read()
+                raise HTTPException(status_code=502, detail=f"Qwen API error: {resp.status_code} - {resp.text[:300]}")
+            for line in resp.iter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                usage = chunk.get("usage") or usage
+                choice = (chunk.get("choices") or [{}])[0]
+                finish_reason = choice.get("finish_reason") or finish_reason
+                # Leaving the block closes the connection, which stops generation upstream.
+                if cutter.feed((choice.get("delta") or {}).get("content") or ""):
+                    break
+    return cutter.buffer, usage, finish_reason, cutter
+
+
+def record_reply_budget(raw: str, content: str, usage: Dict[str, Any], max_tokens: int, cut: bool) -> None:
+    raw_chars = reply_length(raw)
+    used = int(usage.get("completion_tokens") or 0) or int(math.ceil(raw_chars * REPLY_TOKENS_PER_CHAR))
+    REPLY_TOKENS.inc(used, "used")
+    if raw_chars > reply_length(content):
+        REPLY_TOKENS.inc(used * (raw_chars - reply_length(content)) / raw_chars, "discarded")
+    if cut:
+        # What the cut stream could still have generated under max_tokens: an upper bound.
+        REPLY_TOKENS.inc(max(max_tokens - used, 0), "saved")
+        REPLY_OUTCOMES.inc(1, "cut")
+    else:
+        REPLY_OUTCOMES.inc(1, "trimmed" if content != raw.strip() else "within")
+
+
+# ------------------- Rate limits -------------------
+
+# One budget per client shared by the AI endpoints; each call costs its endpoint's units.
+RATE_LIMITER = build_rate_limiter(
+    os.getenv("RATE_LIMIT_BUCKET", "60:0.5"),
+    os.getenv("RATE_LIMIT_WINDOW", ""),
+    os.getenv("RATE_LIMIT_COSTS", "chat:1,image:5,video:20,save:2"),
+    os.getenv("RATE_LIMIT_BACKEND", "memory"),
+    (os.getenv("REDIS_URL") or "").strip() or None,
+)
+RATE_LIMIT_KEY_HEADER = (os.getenv("RATE_LIMIT_KEY_HEADER") or "").strip()
+RATE_LIMIT_TRUST_PROXY = os.getenv("RATE_LIMIT_TRUST_PROXY", "0") == "1"
+RATE_LIMITED = REGISTRY.counter("wondera_rate_limited_total", "Requests rejected by the rate limiter.", ("endpoint",))
+
+
+def client_identity(request: Request) -> str:
+    """The caller's rate-limit key: a gateway-set header if configured, else the client IP."""
+    if RATE_LIMIT_KEY_HEADER:
+        value = (request.headers.get(RATE_LIMIT_KEY_HEADER) or "").strip()
+        if value:
+            return f"key:{value}"
+    if RATE_LIMIT_TRUST_PROXY:
+        forwarded = (request.headers.get("x-forwarded-for") or "").split(",")[0].strip()
+        if forwarded:
+            return f"ip:{forwarded}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+def apply_rate_limit(decision, endpoint: str, response: Response) -> None:
+    if decision is None:
+        return
+    headers = decision.headers()
+    if not decision.allowed:
+        RATE_LIMITED.inc(1.0, endpoint)
+        raise HTTPException(status_code=429, detail="Rate limit exceeded", headers=headers)
+    response.headers.update(headers)
+
+
+def rate_limited(endpoint: str, with_idempotency: bool = False):
+    """Dependency charging ``endpoint``'s cost; admins are not limited.
+
+    On routes that also use ``idempotent(...)`` (pass ``with_idempotency=True``), a request with an
+    Idempotency-Key is charged there instead, and only when it executes.
+    """
+
+    async def check(request: Request, response: Response) -> None:
+        if RATE_LIMITER is None or admin_authorization_ok(request.headers.get("authorization")):
+            return
+        if with_idempotency and IDEMPOTENCY is not None and request.headers.get("idempotency-key") is not None:
+            request.state.deferred_rate_limit = endpoint
+            return
+        if isinstance(RATE_LIMITER.backend, MemoryBackend):
+            decision = RATE_LIMITER.hit(client_identity(request), endpoint)
+        else:
+            decision = await anyio.to_thread.run_sync(RATE_LIMITER.hit, client_identity(request), endpoint)
+        apply_rate_limit(decision, endpoint, response)
+
+    return check
+
+
+# ------------------- Role memory -------------------
+
+
+def build_memory_index() -> Optional[MemoryIndex]:
+    root = (os.getenv("MEMORY_DIR") or "").strip()
+    if not root:
+        return None
+    dim = int(os.getenv("MEMORY_EMBED_DIM", "512"))
+    if os.getenv("MEMORY_EMBEDDER", "hashing").strip().lower() == "dashscope":
+        model = os.getenv("MEMORY_EMBED_MODEL", "text-embedding-v3")
+        embedder = DashScopeEmbedder(DASHSCOPE_API_KEY, DASHSCOPE_ENDPOINT, get_http_client, model, dim)
+    else:
+        embedder = HashingEmbedder(dim)
+    return MemoryIndex(root, embedder, os.getenv("MEMORY_DTYPE", "int8"), int(os.getenv("MEMORY_MAX_OPEN_SHARDS", "128")))
+
+
+MEMORY = build_memory_index()
+MEMORY_TOP_K = int(os.getenv("MEMORY_TOP_K", "4"))
+MEMORY_MIN_SCORE = float(os.getenv("MEMORY_MIN_SCORE", "0.25"))
+# Turns are embedded and written off the request path, one at a time.
+MEMORY_WRITER = ThreadPoolExecutor(max_workers=1, thread_name_prefix="memory-writer")
+
+
+def build_memory_prompt(memories: List[Dict[str, Any]]) -> str:
+    if not memories:
+        return ""
+    lines = "\n".join(f"- {memory['text']}" for memory in memories)
+    return f"你记得和对方之间的这些往事，需要时自然带出，不要逐条复述：\n{lines}"
+
+
+def recall_memories(user_id: Optional[str], role_id: Optional[str], query: str, skip=None) -> List[Dict[str, Any]]:
+    """Top memories for this turn; ``skip(memory)`` drops ones already in the prompt. Failures only log."""
+    if MEMORY is None or not user_id or not role_id:
+        return []
+    try:
+        hits = MEMORY.recall(user_id, role_id, query, k=MEMORY_TOP_K * 2, min_score=MEMORY_MIN_SCORE)
+    except Exception as exc:
+        logger.warning("Memory recall failed for %s/%s: %s", user_id, role_id, exc)
+        return []
+    return [hit for hit in hits if not (skip and skip(hit))][:MEMORY_TOP_K]
+
+
+def remember_exchange(user_id: Optional[str], role_id: Optional[str], message: str, reply: str, extra: Optional[Dict[str, Any]] = None):
+    if MEMORY is None or not user_id or not role_id:
+        return
+
+    def write():
+        try:
+            MEMORY.remember(user_id, role_id, [f"对方说：{message}\n我回答：{reply}"], kind="turn", extra=extra)
+        except Exception:
+            logger.exception("Memory write failed for %s/%s", user_id, role_id)
+
+    MEMORY_WRITER.submit(write)
+
+
+def chat_system_prompt(role: Dict[str, Any], memories: List[Dict[str, Any]]) -> str:
+    return "\n\n".join(part for part in (build_system_prompt(role), build_memory_prompt(memories)) if part)
+
+
+class MemoryFactsRequest(BaseModel):
+    user_id: str
+    role_id: str
+    facts: List[str] = Field(..., min_length=1, max_length=50)
+
+
+@app.post("/memories")
+def add_memory_facts(payload: MemoryFactsRequest):
+    """Store facts about the user (e.g. profile answers) for a role to recall later."""
+    if MEMORY is None:
+        raise HTTPException(status_code=503, detail="Memory is disabled (set MEMORY_DIR)")
+    try:
+        stored = MEMORY.remember(payload.user_id, payload.role_id, payload.facts, kind="fact")
+    except ValueError as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+    return {"stored": stored}
 
 
 class ChatMessage(BaseModel):
@@ -351,34 +971,189 @@ class ChatCompletionRequest(BaseModel):
     role_id: Optional[str] = None
     role: Optional[Dict[str, Any]] = None  # { name, persona, greeting } for admin inline
     messages: List[ChatMessage] = Field(default_factory=list, max_length=30)
+    # Server-side history: send only the new turn; omit conversation_id to start one (messages, if any, seed it).
+    conversation_id: Optional[str] = None
+    message: Optional[str] = Field(None, max_length=4000)
+    user_id: Optional[str] = None
+
+
+CHAT_CONTEXT_TURNS = 20
+CONVERSATIONS = ConversationStore(
+    get_supabase,
+    tail_size=int(os.getenv("CONVERSATION_TAIL_SIZE", "40")),
+    max_hot=int(os.getenv("CONVERSATION_MAX_HOT", "5000")),
+    reload_after=float(os.getenv("CONVERSATION_RELOAD_AFTER", "300")),
+    max_attempts=int(os.getenv("CONVERSATION_MAX_FLUSH_ATTEMPTS", "5")),
+)
+CONVERSATION_FLUSH_JOB = PeriodicJob(
+    "conversation-flush",
+    float(os.getenv("CONVERSATION_FLUSH_INTERVAL", "1.0")),
+    CONVERSATIONS.flush,
+    run_immediately=False,
+)
+
+
+@app.on_event("startup")
+def start_conversation_flush():
+    CONVERSATION_FLUSH_JOB.start()
+
+
+@app.on_event("shutdown")
+def flush_conversations():
+    CONVERSATION_FLUSH_JOB.stop()
+    try:
+        CONVERSATIONS.flush()
+    except Exception:
+        logger.exception("Final conversation flush failed")
+
+
+def chat_role(payload: ChatCompletionRequest, role_id: Optional[str]) -> Dict[str, Any]:
+    """The persona to chat as; a ``role_id`` is always checked, even next to an inline ``role``."""
+    if role_id:
+        # Conversations and memories are stored under role_id, so it must name a real role.
+        row = load_role_row(role_id, context="get role for chat")
+        if not row:
+            raise HTTPException(status_code=404, detail="Role not found")
+        if payload.role:
+            return payload.role
+        return {
+            "name": row.get("name"),
+            "persona": row.get("persona"),
+            "greeting": row.get("greeting"),
+            "reply_max_chars": row.get("reply_max_chars"),
+        }
+    if payload.role:
+        return payload.role
+    raise HTTPException(status_code=400, detail="role_id or role required")
 
 
 @app.post("/chat/completion")
-def chat_completion(payload: ChatCompletionRequest):
+def chat_completion(payload: ChatCompletionRequest, _: None = Depends(rate_limited("chat", with_idempotency=True)), run=Depends(idempotent("chat"))):
+    return run(payload, lambda: complete_chat(payload))
+
+
+def complete_chat(payload: ChatCompletionRequest) -> Dict[str, Any]:
+    if payload.message is not None:
+        return chat_conversation_turn(payload)
     if not payload.messages:
         raise HTTPException(status_code=400, detail="messages required")
-    role: Dict[str, Any]
-    if payload.role:
-        role = payload.role
-    elif payload.role_id:
-        supabase = get_supabase()
-        row = ensure_ok(
-            supabase.table("roles").select("*").eq("id", payload.role_id).single().execute(),
-            context="get role for chat",
-        )
-        if not row:
-            raise HTTPException(status_code=404, detail="Role not found")
-        role = {"name": row.get("name"), "persona": row.get("persona"), "greeting": row.get("greeting")}
-    else:
-        raise HTTPException(status_code=400, detail="role_id or role required")
-    system = build_system_prompt(role)
-    api_messages = [{"role": m.role, "content": (m.content or "").strip()} for m in payload.messages[-20:]]
+    role = chat_role(payload, payload.role_id)
+    api_messages = [{"role": m.role, "content": (m.content or "").strip()} for m in payload.messages[-CHAT_CONTEXT_TURNS:]]
     if not api_messages:
         raise HTTPException(status_code=400, detail="messages required")
-    content = call_qwen(system, api_messages)
+    last_user = next((m["content"] for m in reversed(api_messages) if m["role"] == "user"), "")
+    memories = recall_memories(payload.user_id, payload.role_id, last_user)
+    content = call_qwen(chat_system_prompt(role, memories), api_messages, max_chars=reply_budget(role))
+    if last_user:
+        remember_exchange(payload.user_id, payload.role_id, last_user, content)
     return {"content": content}
 
 
+def chat_conversation_turn(payload: ChatCompletionRequest) -> Dict[str, Any]:
+    message = (payload.message or "").strip()
+    if not message:
+        raise HTTPException(status_code=400, detail="message required")
+    if payload.conversation_id:
+        conversation = CONVERSATIONS.get(payload.conversation_id)
+        if conversation is None:
+            raise HTTPException(status_code=404, detail="Conversation not found")
+        if payload.role_id and conversation.role_id and payload.role_id != conversation.role_id:
+            raise HTTPException(status_code=400, detail="role_id does not match the conversation")
+        role = chat_role(payload, conversation.role_id or payload.role_id)
+    else:
+        role = chat_role(payload, payload.role_id)
+        conversation = CONVERSATIONS.create(payload.role_id, payload.user_id)
+        seed = [(m.role, (m.content or "").strip()) for m in payload.messages if m.role in ("user", "assistant") and (m.content or "").strip()]
+        if seed:
+            CONVERSATIONS.append(conversation, seed)
+    api_messages = CONVERSATIONS.context(conversation, CHAT_CONTEXT_TURNS - 1) + [{"role": "user", "content": message}]
+    user_id = conversation.user_id or payload.user_id
+    role_id = conversation.role_id or payload.role_id
+    in_context_from = conversation.next_seq - CHAT_CONTEXT_TURNS
+    memories = recall_memories(
+        user_id,
+        role_id,
+        message,
+        skip=lambda memory: memory.get("conversationId") == conversation.id and memory.get("seq", -1) >= in_context_from,
+    )
+    content = call_qwen(chat_system_prompt(role, memories), api_messages, max_chars=reply_budget(role))
+    # Both turns are stored only once the reply exists, so a failed call leaves no dangling user turn.
+    rows = CONVERSATIONS.append(conversation, [("user", message), ("assistant", content)])
+    remember_exchange(user_id, role_id, message, content, {"conversationId": conversation.id, "seq": rows[0]["seq"]})
+    return {"content": content, "conversationId": conversation.id}
+
+
+@app.get("/conversations/{conversation_id}/messages")
+def list_conversation_messages(
+    conversation_id: str,
+    limit: int = Query(50, ge=1, le=200),
+    before: Optional[int] = Query(None, ge=0, description="Only turns with seq below this (for paging back)"),
+):
+    conversation = CONVERSATIONS.get(conversation_id)
+    if conversation is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    turns = CONVERSATIONS.history(conversation, limit, before)
+    return {
+        "conversationId": conversation.id,
+        "roleId": conversation.role_id,
+        "messages": [turn_to_api(row) for row in turns],
+    }
+
+
+# ------------------- Persona evaluation -------------------
+
+PERSONA_EVAL_CONCURRENCY = max(int(os.getenv("PERSONA_EVAL_CONCURRENCY", "8")), 1)
+
+
+class PersonaEvalCase(BaseModel):
+    id: Optional[str] = None
+    messages: List[ChatMessage] = Field(..., min_length=1, max_length=30)
+
+
+class PersonaEvalRequest(BaseModel):
+    role: Dict[str, Any]  # persona draft: { name, persona, greeting, reply_max_chars? }
+    cases: List[PersonaEvalCase] = Field(..., min_length=1, max_length=200)
+    concurrency: Optional[int] = Field(None, ge=1, description="Capped at PERSONA_EVAL_CONCURRENCY")
+    model: Optional[str] = None
+
+
+@app.post("/admin/personas/evaluate")
+def admin_evaluate_persona(payload: PersonaEvalRequest, _: str = Depends(require_admin)):
+    """Run test conversations against a persona draft in parallel.
+
+    Streams NDJSON: one ``result`` line per case as it completes, then a
+    ``summary`` line.
+    """
+    if not DASHSCOPE_API_KEY:
+        raise HTTPException(status_code=503, detail="DASHSCOPE_API_KEY (or BAILIAN_API_KEY) not configured")
+    system = build_system_prompt(payload.role)
+    # Replies are not trimmed here: the point is to see how the persona itself behaves.
+    guideline = reply_guideline(payload.role)
+    model = payload.model or DEFAULT_CHAT_MODEL
+    concurrency = min(payload.concurrency or PERSONA_EVAL_CONCURRENCY, PERSONA_EVAL_CONCURRENCY)
+    cases = [
+        {
+            "id": case.id or str(index),
+            "messages": [{"role": m.role, "content": (m.content or "").strip()} for m in case.messages],
+        }
+        for index, case in enumerate(payload.cases)
+    ]
+
+    def complete(messages: List[Dict[str, str]]) -> Dict[str, Any]:
+        return call_qwen_detailed(system, messages, model)
+
+    def lines():
+        started = time.perf_counter()
+        results = []
+        for result in evaluate_cases(cases, complete, guideline, concurrency):
+            results.append(result)
+            yield result
+        yield summarize(results, guideline, time.perf_counter() - started)
+
+    # Each evaluation holds an admin slot while it streams, so its model calls stay within that pool.
+    return StreamingResponse(BULKHEADS.pools["admin"].stream(encode_rows(lines(), batch_size=1)), media_type="application/x-ndjson")
+
+
 # ------------------- Wan 2.2 Image & Video (DashScope) -------------------
 
 WAN_IMAGE_MODEL = (os.getenv("WAN_IMAGE_MODEL") or "wan2.2-t2i-plus").strip() or "wan2.2-t2i-plus"
@@ -388,6 +1163,21 @@ WAN_VIDEO_PATH = "/api/v1/services/aigc/video-generation/video-synthesis"
 WAN_TASK_PATH = "/api/v1/tasks/{task_id}"
 WAN_POLL_ATTEMPTS = int(os.getenv("WAN_POLL_ATTEMPTS", "40"))
 WAN_POLL_INTERVAL = float(os.getenv("WAN_POLL_INTERVAL", "3.0"))
+WAN_STAGE_SECONDS = REGISTRY.histogram(
+    "wondera_wan_stage_seconds",
+    "Time per Wan job stage (submit, queue, run, download, upload).",
+    ("kind", "stage"),
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0),
+)
+
+
+def observe_wan_trace(trace: WanTrace) -> None:
+    for name, ms in trace.stage_ms().items():
+        WAN_STAGE_SECONDS.observe(ms / 1000, trace.kind, name)
+
+
+# Recent Wan jobs with per-stage timings, for /admin/wan/traces.
+WAN_TRACES = TraceBuffer(int(os.getenv("WAN_TRACE_CAPACITY", "500")), on_finish=observe_wan_trace)
 
 
 class WanImageRequest(BaseModel):
@@ -423,33 +1213,41 @@ def get_dashscope_headers(async_mode: bool = False) -> Dict[str, str]:
     return headers
 
 
-def submit_wan_task(path: str, payload: Dict[str, Any]) -> str:
+def submit_wan_task(path: str, payload: Dict[str, Any], trace: Optional[WanTrace] = None) -> str:
     url = f"{DASHSCOPE_ENDPOINT}{path}"
-    with httpx.Client(timeout=60.0) as client:
-        resp = client.post(url, headers=get_dashscope_headers(async_mode=True), json=payload)
+    if trace is not None:
+        trace.begin("submit")
+    with timed("dashscope", "wan submit"):
+        resp = get_http_client().post(url, headers=get_dashscope_headers(async_mode=True), json=payload)
     if resp.status_code not in (200, 202):
         raise HTTPException(status_code=502, detail=f"Wan API error {resp.status_code}: {resp.text[:300]}")
     data = resp.json()
     task_id = (data.get("output") or {}).get("task_id") or data.get("task_id") or (data.get("data") or {}).get("task_id")
     if not task_id:
         raise HTTPException(status_code=502, detail="Wan API did not return task_id")
+    if trace is not None:
+        trace.submitted(task_id)
     return task_id
 
 
-def poll_wan_task(task_id: str) -> Dict[str, Any]:
+def poll_wan_task(task_id: str, trace: Optional[WanTrace] = None) -> Dict[str, Any]:
     url = f"{DASHSCOPE_ENDPOINT}{WAN_TASK_PATH.format(task_id=task_id)}"
     headers = get_dashscope_headers()
     for _ in range(WAN_POLL_ATTEMPTS):
-        with httpx.Client(timeout=30.0) as client:
-            resp = client.get(url, headers=headers)
+        with timed("dashscope", "wan poll"):
+            resp = get_http_client().get(url, headers=headers, timeout=30.0)
         if resp.status_code != 200:
             raise HTTPException(status_code=502, detail=f"Wan task query failed: {resp.status_code} {resp.text[:200]}")
         data = resp.json()
         output = data.get("output") or data
         status = output.get("task_status") or output.get("status")
+        if trace is not None:
+            trace.poll(status)
         if status in ("PENDING", "RUNNING", "QUEUED", None):
             time.sleep(WAN_POLL_INTERVAL)
             continue
+        if trace is not None and status in ("SUCCEEDED", "FAILED", "CANCELED", "TIMEOUT"):
+            trace.upstream_times(output)
         if status == "SUCCEEDED":
             return output.get("result") or output
         if status in ("FAILED", "CANCELED", "TIMEOUT"):
@@ -492,13 +1290,15 @@ def guess_extension(url: str, content_type: Optional[str]) -> str:
     return ext or ".bin"
 
 
-def save_remote_asset(remote_url: str, prefix: str) -> Dict[str, str]:
+def save_remote_asset(remote_url: str, prefix: str, trace: WanTrace) -> Dict[str, str]:
     supabase = get_supabase()
     bucket = os.getenv("SUPABASE_STORAGE_BUCKET", "wondera-assets")
     if not remote_url:
         raise HTTPException(status_code=400, detail="remote_url is required for saving")
     try:
-        resp = httpx.get(remote_url, timeout=120.0)
+        with trace.stage("download") as stage, timed("download", "remote asset"):
+            resp = get_http_client().get(remote_url, timeout=120.0)
+            stage["bytes"] = len(resp.content or b"")
     except Exception as exc:
         raise HTTPException(status_code=502, detail=f"Download asset failed: {exc}") from exc
     if resp.status_code != 200 or not resp.content:
@@ -506,7 +1306,9 @@ def save_remote_asset(remote_url: str, prefix: str) -> Dict[str, str]:
     content_type = resp.headers.get("content-type") or "application/octet-stream"
     ext = guess_extension(remote_url, content_type)
     path = f"{prefix.rstrip('/')}/{uuid.uuid4().hex}{ext}"
-    result = supabase.storage.from_(bucket).upload(path, resp.content, {"content-type": content_type, "x-upsert": "true"})
+    with trace.stage("upload") as stage, timed("storage", "upload"):
+        stage["bytes"] = len(resp.content)
+        result = supabase.storage.from_(bucket).upload(path, resp.content, {"content-type": content_type, "x-upsert": "true"})
     if hasattr(result, "error") and result.error:
         message = getattr(result.error, "message", None) or str(result.error)
         raise HTTPException(status_code=500, detail=f"Upload failed: {message}")
@@ -515,7 +1317,11 @@ def save_remote_asset(remote_url: str, prefix: str) -> Dict[str, str]:
 
 
 @app.post("/ai/wan/image")
-def wan_generate_image(payload: WanImageRequest):
+def wan_generate_image(payload: WanImageRequest, _: None = Depends(rate_limited("image", with_idempotency=True)), run=Depends(idempotent("wan_image"))):
+    return run(payload, lambda: generate_wan_image(payload))
+
+
+def generate_wan_image(payload: WanImageRequest) -> Dict[str, Any]:
     prompt = (payload.prompt or "").strip()
     if not prompt:
         raise HTTPException(status_code=400, detail="prompt is required")
@@ -529,13 +1335,14 @@ def wan_generate_image(payload: WanImageRequest):
         body["input"]["negative_prompt"] = payload.negative_prompt.strip()
     if payload.seed is not None:
         body["parameters"]["seed"] = payload.seed
-    task_id = submit_wan_task(WAN_IMAGE_PATH, body)
-    result = poll_wan_task(task_id)
-    image_url = extract_image_url(result)
-    if not image_url:
-        raise HTTPException(status_code=502, detail="Wan image task did not return image url")
-    owner = sanitize_filename(payload.role_id or "wan")
-    saved = save_remote_asset(image_url, f"roles/{owner}/images") if payload.save else None
+    with WAN_TRACES.record("image", WAN_IMAGE_MODEL, size, save=payload.save) as trace:
+        task_id = submit_wan_task(WAN_IMAGE_PATH, body, trace)
+        result = poll_wan_task(task_id, trace)
+        image_url = extract_image_url(result)
+        if not image_url:
+            raise HTTPException(status_code=502, detail="Wan image task did not return image url")
+        owner = sanitize_filename(payload.role_id or "wan")
+        saved = save_remote_asset(image_url, f"roles/{owner}/images", trace) if payload.save else None
     return {
         "taskId": task_id,
         "status": "SUCCEEDED",
@@ -547,7 +1354,11 @@ def wan_generate_image(payload: WanImageRequest):
 
 
 @app.post("/ai/wan/video-from-image")
-def wan_image_to_video(payload: WanVideoRequest):
+def wan_image_to_video(payload: WanVideoRequest, _: None = Depends(rate_limited("video", with_idempotency=True)), run=Depends(idempotent("wan_video"))):
+    return run(payload, lambda: generate_wan_video(payload))
+
+
+def generate_wan_video(payload: WanVideoRequest) -> Dict[str, Any]:
     img_url = (payload.image_url or "").strip()
     if not img_url:
         raise HTTPException(status_code=400, detail="image_url is required")
@@ -559,13 +1370,14 @@ def wan_image_to_video(payload: WanVideoRequest):
         "input": {"img_url": img_url, "prompt": prompt},
         "parameters": {"resolution": resolution, "duration": duration},
     }
-    task_id = submit_wan_task(WAN_VIDEO_PATH, body)
-    result = poll_wan_task(task_id)
-    video_url = extract_video_url(result)
-    if not video_url:
-        raise HTTPException(status_code=502, detail="Wan video task did not return video url")
-    owner = sanitize_filename(payload.role_id or "wan")
-    saved = save_remote_asset(video_url, f"roles/{owner}/videos") if payload.save else None
+    with WAN_TRACES.record("video", WAN_VIDEO_MODEL, resolution, duration=duration, save=payload.save) as trace:
+        task_id = submit_wan_task(WAN_VIDEO_PATH, body, trace)
+        result = poll_wan_task(task_id, trace)
+        video_url = extract_video_url(result)
+        if not video_url:
+            raise HTTPException(status_code=502, detail="Wan video task did not return video url")
+        owner = sanitize_filename(payload.role_id or "wan")
+        saved = save_remote_asset(video_url, f"roles/{owner}/videos", trace) if payload.save else None
     cover = extract_image_url(result) or result.get("cover_image_url")
     return {
         "taskId": task_id,
@@ -581,76 +1393,946 @@ def wan_image_to_video(payload: WanVideoRequest):
 
 
 @app.post("/ai/wan/save")
-def wan_save_existing_asset(payload: WanAssetSaveRequest):
+def wan_save_existing_asset(payload: WanAssetSaveRequest, _: None = Depends(rate_limited("save"))):
     target = sanitize_filename(payload.role_id or "wan")
     kind = sanitize_filename(payload.kind or "assets")
-    saved = save_remote_asset(payload.url, f"roles/{target}/{kind}")
+    with WAN_TRACES.record("save", None, None) as trace:
+        saved = save_remote_asset(payload.url, f"roles/{target}/{kind}", trace)
     return {"saved": saved}
 
 
+def load_explore_page(item_type: Optional[str], limit: int, offset: int) -> List[Dict[str, Any]]:
+    direct = read_via_postgres("explore_page", item_type, limit, offset)
+    if direct is not None:
+        return direct[0]
+    query = (
+        get_supabase()
+        .table("explore_items")
+        .select("*")
+        .order("created_at", desc=True)
+        .range(offset, offset + limit - 1)
+    )
+    if item_type:
+        query = query.eq("type", item_type)
+    return ensure_ok(query, context="list explore items") or []
+
+
 @app.get("/explore/items")
 def list_explore_items(
     item_type: Optional[str] = Query(None, description="Filter by type: post or world"),
     limit: int = Query(100, ge=1, le=500),
     offset: int = Query(0, ge=0),
+    ids: Optional[str] = Query(None, description="Comma-separated explore item ids to fetch in one request"),
+    expand_roles: bool = Query(False, description="Embed target/recommended role cards"),
+):
+    if ids:
+        item_ids = parse_id_list(ids)
+        query = get_supabase().table("explore_items").select("*").in_("id", item_ids)
+        if item_type:
+            query = query.eq("type", item_type)
+        by_id = {row.get("id"): row for row in ensure_ok(query, context="list explore items") or []}
+        rows = [by_id[item_id] for item_id in item_ids if item_id in by_id]
+    else:
+        rows = CACHE.get_or_load(
+            f"explore:page:{item_type or 'all'}:{limit}:{offset}",
+            lambda: load_explore_page(item_type, limit, offset),
+            group=EXPLORE_PAGES_GROUP,
+        )
+    role_cards = fetch_role_cards(rows) if expand_roles else None
+    return [explore_to_api(row, role_cards) for row in rows]
+
+
+@app.get("/explore/items/{item_id}")
+def get_explore_item(
+    item_id: str,
+    expand_roles: bool = Query(False, description="Embed target/recommended role cards"),
 ):
     supabase = get_supabase()
-    query = (
-        supabase.table("explore_items")
-        .select("*")
-        .order("created_at", desc=True)
-        .range(offset, offset + limit - 1)
+    result = CACHE.get_or_load(
+        f"explore:{item_id}",
+        lambda: ensure_ok(
+            supabase.table("explore_items").select("*").eq("id", item_id).single(),
+            context="get explore item",
+        ),
     )
-    if item_type:
-        query = query.eq("type", item_type)
-    result = ensure_ok(query.execute(), context="list explore items")
-    return [explore_to_api(row) for row in (result or [])]
+    if not result:
+        raise HTTPException(status_code=404, detail="Explore item not found")
+    role_cards = fetch_role_cards([result]) if expand_roles else None
+    return explore_to_api(result, role_cards)
 
 
 @app.get("/explore/posts")
-def list_explore_posts(limit: int = Query(100, ge=1, le=500), offset: int = Query(0, ge=0)):
-    return list_explore_items(item_type="post", limit=limit, offset=offset)
+def list_explore_posts(
+    limit: int = Query(100, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    expand_roles: bool = Query(False, description="Embed target/recommended role cards"),
+):
+    return list_explore_items(item_type="post", limit=limit, offset=offset, ids=None, expand_roles=expand_roles)
 
 
 @app.get("/explore/worlds")
-def list_explore_worlds(limit: int = Query(100, ge=1, le=500), offset: int = Query(0, ge=0)):
-    return list_explore_items(item_type="world", limit=limit, offset=offset)
+def list_explore_worlds(
+    limit: int = Query(100, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    expand_roles: bool = Query(False, description="Embed target/recommended role cards"),
+):
+    return list_explore_items(item_type="world", limit=limit, offset=offset, ids=None, expand_roles=expand_roles)
 
 
 @app.post("/explore/items")
-def create_explore_item(payload: ExploreItemCreate):
+def create_explore_item(payload: ExploreItemCreate, run=Depends(idempotent("create_explore_item"))):
+    return run(payload, lambda: insert_explore_item(payload))
+
+
+def insert_explore_item(payload: ExploreItemCreate) -> Dict[str, Any]:
     supabase = get_supabase()
-    item_id = payload.id or f"explore-{uuid.uuid4().hex[:10]}"
-    data = model_to_dict(payload)
-    data["id"] = item_id
-    result = ensure_ok(supabase.table("explore_items").insert(data).execute(), context="create explore item")
+    data = explore_insert_data(payload)
+    result = ensure_ok(supabase.table("explore_items").insert(data), context="create explore item")
     if not result:
         raise HTTPException(status_code=500, detail="Failed to create explore item")
+    notify_catalog_change("explore_items", rows=result)
     return explore_to_api(result[0])
 
 
-@app.get("/daily-tasks")
-def list_daily_tasks(day_key: str = Query(..., description="YYYY-MM-DD")):
+# ------------------- Asset edge cache -------------------
+
+ASSET_CACHE_BUCKETS = [
+    bucket.strip()
+    for bucket in (os.getenv("ASSET_CACHE_BUCKETS") or os.getenv("SUPABASE_STORAGE_BUCKET", "wondera-assets")).split(",")
+    if bucket.strip()
+]
+ASSET_CACHE_MAX_AGE = int(os.getenv("ASSET_CACHE_MAX_AGE", "86400"))
+
+
+def build_asset_cache() -> Optional[DiskAssetCache]:
+    root = (os.getenv("ASSET_CACHE_DIR") or "").strip()
+    if not root:
+        return None
+    max_bytes = int(float(os.getenv("ASSET_CACHE_MAX_MB", "1024")) * 1024 * 1024)
+    max_object = int(float(os.getenv("ASSET_CACHE_MAX_OBJECT_MB", "0")) * 1024 * 1024) or None
+    return DiskAssetCache(
+        root,
+        max_bytes,
+        lambda bucket, path: storage_origin_url(bucket, quote(path)),
+        get_http_client,
+        max_object_bytes=max_object,
+        workers=int(os.getenv("ASSET_CACHE_FILL_WORKERS", "2")),
+    )
+
+
+ASSET_CACHE = build_asset_cache()
+
+
+@app.get("/assets/{bucket}/{path:path}")
+def get_asset(bucket: str, path: str, request: Request):
+    """Serve a Storage object from the disk cache (Range supported); on a miss redirect to Storage and fill in the background."""
+    if bucket not in ASSET_CACHE_BUCKETS or not path or ".." in path.split("/"):
+        raise HTTPException(status_code=404, detail="Asset not found")
+    entry = ASSET_CACHE.lookup(bucket, path) if ASSET_CACHE else None
+    stat_result = None
+    if entry is not None:
+        try:
+            stat_result = os.stat(entry.file)
+        except OSError:
+            entry = None  # evicted (possibly by another worker) since the lookup
+    if entry is None:
+        origin = storage_origin_url(bucket, quote(path))
+        if origin is None:
+            raise HTTPException(status_code=503, detail="Storage is not configured")
+        if ASSET_CACHE is not None:
+            ASSET_CACHE.request_fill(bucket, path)
+        return RedirectResponse(origin, status_code=307)
+    headers = {
+        "Cache-Control": f"public, max-age={ASSET_CACHE_MAX_AGE}",
+        # Stable validators: FileResponse would derive them from the mtime, which lookups touch for LRU.
+        "ETag": entry.etag,
+        "Last-Modified": entry.last_modified,
+    }
+    if request.headers.get("if-none-match") == entry.etag:
+        return Response(status_code=304, headers=headers)
+    # FileResponse answers Range / If-Range itself and hands the file to the server via pathsend when supported.
+    return FileResponse(entry.file, media_type=entry.content_type, stat_result=stat_result, headers=headers)
+
+
+@app.get("/admin/assets/cache")
+def admin_asset_cache_stats(_: str = Depends(require_admin)):
+    return ASSET_CACHE.stats() if ASSET_CACHE else {"enabled": False}
+
+
+# ------------------- Daily tasks -------------------
+
+DAILY_TASKS_DAYS_AHEAD = int(os.getenv("DAILY_TASKS_DAYS_AHEAD", "3"))
+DAILY_TASKS_PER_DAY = int(os.getenv("DAILY_TASKS_PER_DAY", "3"))
+DAILY_TASKS_SCHEDULER_INTERVAL = float(os.getenv("DAILY_TASKS_SCHEDULER_INTERVAL", "600"))
+DAILY_TASKS_CACHE_TTL = float(os.getenv("DAILY_TASKS_CACHE_TTL", "60"))
+DAILY_TASKS_RECENT_DAYS = int(os.getenv("DAILY_TASKS_RECENT_DAYS", "7"))
+TEMPLATE_INDEX_TTL = float(os.getenv("TEMPLATE_INDEX_TTL", "600"))
+TEMPLATE_SAMPLER = TemplateSampler(parse_difficulty_mix(os.getenv("DAILY_TASKS_DIFFICULTY_MIX", "E:1,M:2,H:1")))
+
+# day_key -> (loaded_at, rows); filled by the scheduler so reads are a dict lookup. Request
+# handlers, the scheduler and the opener job share it, so every access holds the lock. A write
+# to a day is published on the cache invalidation channel, and other workers drop their copy.
+_DAILY_TASKS_CACHE: Dict[str, Any] = {}
+# day_key -> when it was last dropped; a load that started earlier must not put stale rows back.
+_DAILY_TASKS_EVICTED: Dict[str, float] = {}
+_DAILY_TASKS_CACHE_LOCK = threading.Lock()
+_DAILY_TASKS_LOCKS: Dict[str, threading.Lock] = {}
+_DAILY_TASKS_LOCKS_GUARD = threading.Lock()
+DAILY_TASKS_CACHE_KEY = "daily_tasks:"
+
+
+def _daily_tasks_lock(day_key: str) -> threading.Lock:
+    with _DAILY_TASKS_LOCKS_GUARD:
+        return _DAILY_TASKS_LOCKS.setdefault(day_key, threading.Lock())
+
+
+def cache_daily_tasks(day_key: str, rows: List[Dict[str, Any]], loaded_at: Optional[float] = None) -> None:
+    """Cache a day's rows; ``loaded_at`` is when the read started, for rows that may predate an eviction."""
+    now = time.monotonic()
+    with _DAILY_TASKS_CACHE_LOCK:
+        if loaded_at is not None and _DAILY_TASKS_EVICTED.get(day_key, -1.0) >= loaded_at:
+            return
+        _DAILY_TASKS_CACHE[day_key] = (loaded_at if loaded_at is not None else now, rows)
+
+
+def cached_daily_tasks(day_key: str) -> Optional[List[Dict[str, Any]]]:
+    with _DAILY_TASKS_CACHE_LOCK:
+        cached = _DAILY_TASKS_CACHE.get(day_key)
+    if cached and time.monotonic() - cached[0] < DAILY_TASKS_CACHE_TTL:
+        return cached[1]
+    return None
+
+
+def evict_daily_tasks(day_keys: Optional[Sequence[str]] = None) -> None:
+    """Drop cached days (all of them when ``day_keys`` is None)."""
+    now = time.monotonic()
+    with _DAILY_TASKS_CACHE_LOCK:
+        for day_key in list(_DAILY_TASKS_CACHE) if day_keys is None else day_keys:
+            _DAILY_TASKS_CACHE.pop(day_key, None)
+            _DAILY_TASKS_EVICTED[day_key] = now
+
+
+def publish_daily_tasks_change(day_keys: Sequence[str]) -> None:
+    # Other workers evict these days when the message arrives; this worker has already cached the new rows.
+    CACHE.invalidate(keys=[f"{DAILY_TASKS_CACHE_KEY}{day_key}" for day_key in day_keys])
+
+
+def on_daily_tasks_invalidation(keys: List[str], groups: List[str]) -> None:
+    day_keys = [key[len(DAILY_TASKS_CACHE_KEY):] for key in keys if key.startswith(DAILY_TASKS_CACHE_KEY)]
+    if day_keys:
+        evict_daily_tasks(day_keys)
+
+
+CACHE.add_listener(on_daily_tasks_invalidation, evict_daily_tasks)
+
+
+def load_daily_tasks(day_key: str) -> List[Dict[str, Any]]:
+    direct = read_via_postgres("daily_tasks_by_day", day_key)
+    if direct is not None:
+        return direct[0]
     supabase = get_supabase()
     result = ensure_ok(
-        supabase.table("daily_theater_tasks").select("*").eq("day_key", day_key).execute(),
+        supabase.table("daily_theater_tasks").select("*").eq("day_key", day_key),
         context="list daily tasks",
     )
     return result or []
 
 
+def get_template_sampler() -> TemplateSampler:
+    loaded_at = TEMPLATE_SAMPLER.loaded_at
+    if loaded_at is None or time.monotonic() - loaded_at > TEMPLATE_INDEX_TTL:
+        TEMPLATE_SAMPLER.replace_all(fetch_all_rows("daily_theater_templates"), loaded_at=time.monotonic())
+    return TEMPLATE_SAMPLER
+
+
+def recent_template_ids(day_key: str, days: int) -> Set[str]:
+    if days <= 0:
+        return set()
+    start = (date.fromisoformat(day_key) - timedelta(days=days)).isoformat()
+    supabase = get_supabase()
+    rows = ensure_ok(
+        supabase.table("daily_theater_tasks").select("template_id").gte("day_key", start).lt("day_key", day_key),
+        context="load recent daily tasks",
+    )
+    return {row.get("template_id") for row in (rows or []) if row.get("template_id")}
+
+
+def select_daily_templates(day_key: str, count: int) -> List[Dict[str, Any]]:
+    sampler = get_template_sampler()
+    if not len(sampler):
+        raise HTTPException(status_code=400, detail="No daily templates available")
+    return sampler.sample(count, recent=recent_template_ids(day_key, DAILY_TASKS_RECENT_DAYS))
+
+
+def template_to_task(template: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "template_id": template.get("id"),
+        "title": template.get("title"),
+        "description": template.get("description"),
+        "scene": template.get("scene"),
+        "target_role_id": template.get("target_role_id"),
+        "kickoff_prompt": template.get("kickoff_prompt"),
+        "difficulty": template.get("difficulty"),
+        "target_words": template.get("target_words") or [],
+        "reward_points": template.get("reward_points") or 5,
+    }
+
+
+def materialize_daily_tasks(day_key: str, count: int, replace: bool) -> List[Dict[str, Any]]:
+    """Write a day's tasks through the `replace_daily_tasks` RPC.
+
+    The RPC deletes and inserts in one transaction under an advisory lock, so
+    readers never see an empty day. With replace=False an already
+    materialized day is returned untouched, which makes concurrent scheduler
+    runs across workers idempotent.
+    """
+    with _daily_tasks_lock(day_key):
+        if not replace:
+            existing = load_daily_tasks(day_key)
+            if existing:
+                cache_daily_tasks(day_key, existing)
+                return existing
+        tasks = [template_to_task(template) for template in select_daily_templates(day_key, count)]
+        supabase = get_supabase()
+        rows = ensure_ok(
+            supabase.rpc(
+                "replace_daily_tasks",
+                {"p_day_key": day_key, "p_tasks": tasks, "p_replace": replace},
+            ),
+            context="materialize daily tasks",
+        ) or []
+        cache_daily_tasks(day_key, rows)
+        publish_daily_tasks_change([day_key])
+        return rows
+
+
+def schedule_daily_tasks():
+    today = date.today()
+    for offset in range(DAILY_TASKS_DAYS_AHEAD):
+        day_key = (today + timedelta(days=offset)).isoformat()
+        materialize_daily_tasks(day_key, DAILY_TASKS_PER_DAY, replace=False)
+    # Drop days that have rolled into the past.
+    with _DAILY_TASKS_CACHE_LOCK:
+        for day_key in [key for key in _DAILY_TASKS_CACHE if key < today.isoformat()]:
+            _DAILY_TASKS_CACHE.pop(day_key, None)
+        for day_key in [key for key in _DAILY_TASKS_EVICTED if key < today.isoformat()]:
+            _DAILY_TASKS_EVICTED.pop(day_key, None)
+
+
+DAILY_TASKS_JOB = PeriodicJob("daily-tasks-scheduler", DAILY_TASKS_SCHEDULER_INTERVAL, schedule_daily_tasks)
+
+
+@app.on_event("startup")
+def start_daily_tasks_scheduler():
+    if os.getenv("DAILY_TASKS_SCHEDULER", "1") != "0":
+        DAILY_TASKS_JOB.start()
+
+
+@app.get("/daily-tasks")
+def list_daily_tasks(day_key: str = Query(..., description="YYYY-MM-DD")):
+    cached = cached_daily_tasks(day_key)
+    if cached is not None:
+        return cached
+    started = time.monotonic()
+    rows = load_daily_tasks(day_key)
+    cache_daily_tasks(day_key, rows, loaded_at=started)
+    return rows
+
+
 @app.post("/daily-tasks/complete/{task_id}")
 def complete_daily_task(task_id: str):
     supabase = get_supabase()
     result = ensure_ok(
-        supabase.table("daily_theater_tasks").update({"completed": True}).eq("id", task_id).execute(),
+        supabase.table("daily_theater_tasks").update({"completed": True}).eq("id", task_id),
         context="complete daily task",
     )
     if not result:
         raise HTTPException(status_code=404, detail="Task not found")
+    replace_cached_task(result[0])
+    publish_daily_tasks_change([str(result[0].get("day_key"))])
     return result[0]
 
 
+def replace_cached_task(row: Dict[str, Any]) -> None:
+    day_key = str(row.get("day_key"))
+    with _DAILY_TASKS_CACHE_LOCK:
+        cached = _DAILY_TASKS_CACHE.get(day_key)
+        if cached:
+            rows = [row if current.get("id") == row.get("id") else current for current in cached[1]]
+            _DAILY_TASKS_CACHE[day_key] = (cached[0], rows)
+
+
+# Openers: the role's first line for each task, generated ahead of time so
+# opening a task needs no model call. The job fills every upcoming day inside
+# the off-peak window; outside it, only today's tasks that still lack one
+# (e.g. a day regenerated from the admin).
+DAILY_OPENERS_WINDOW = (os.getenv("DAILY_OPENERS_WINDOW", "02:00-06:00") or "").strip()
+DAILY_OPENERS_INTERVAL = float(os.getenv("DAILY_OPENERS_INTERVAL", "900"))
+DAILY_OPENERS_CONCURRENCY = max(int(os.getenv("DAILY_OPENERS_CONCURRENCY", "4")), 1)
+DAILY_OPENERS_ALTERNATES = max(int(os.getenv("DAILY_OPENERS_ALTERNATES", "2")), 0)
+DAILY_OPENERS_CLAIM_TTL = float(os.getenv("DAILY_OPENERS_CLAIM_TTL", "600"))
+# opener_claimed_at of a task nobody is generating for (the column default).
+OPENER_UNCLAIMED = "1970-01-01T00:00:00+00:00"
+
+
+def parse_time_window(spec: str) -> Optional[Tuple[dt_time, dt_time]]:
+    """``HH:MM-HH:MM`` in server local time, may wrap past midnight; empty means no window."""
+    if not spec:
+        return None
+    start, sep, end = spec.partition("-")
+    if not sep:
+        raise ValueError(f"Invalid time window {spec!r}, expected HH:MM-HH:MM")
+    return dt_time.fromisoformat(start.strip()), dt_time.fromisoformat(end.strip())
+
+
+def in_time_window(window: Tuple[dt_time, dt_time], now: dt_time) -> bool:
+    start, end = window
+    if start <= end:
+        return start <= now < end
+    return now >= start or now < end
+
+
+OPENERS_WINDOW = parse_time_window(DAILY_OPENERS_WINDOW)
+
+
+def build_opener_prompt(role: Dict[str, Any], task: Dict[str, Any]) -> str:
+    scene = "；".join(part for part in (task.get("title"), task.get("description"), task.get("scene")) if part)
+    parts = [build_system_prompt(role)]
+    if scene:
+        parts.append(f"今天的情景任务：{scene}")
+    parts.append("由你先开口。根据对方给的开场意图，说出这段对话的第一句话，使用与开场意图相同的语言，只输出这句话本身。")
+    return "\n\n".join(parts)
+
+
+def generate_task_opener(task: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Opener plus up to DAILY_OPENERS_ALTERNATES distinct alternates; None if the task has no role or kickoff."""
+    kickoff = (task.get("kickoff_prompt") or "").strip()
+    role_id = task.get("target_role_id")
+    if not kickoff or not role_id:
+        return None
+    role = load_role_row(role_id, context="get role for opener")
+    if not role:
+        return None
+    system = build_opener_prompt(role, task)
+    messages = [{"role": "user", "content": f"开场意图：{kickoff}"}]
+    lines: List[str] = []
+    for _ in range(1 + DAILY_OPENERS_ALTERNATES):
+        line = call_qwen(system, messages, max_chars=reply_budget(role))
+        if line and line not in lines:
+            lines.append(line)
+    if not lines:
+        return None
+    return {"opener": lines[0], "opener_alternates": lines[1:], "opener_generated_at": datetime.now().astimezone().isoformat()}
+
+
+def claim_daily_openers(tasks: List[Dict[str, Any]], token: str, force: bool) -> List[Dict[str, Any]]:
+    """Lease the tasks to this worker in one conditional update; only the rows returned are ours to generate.
+
+    A lease older than DAILY_OPENERS_CLAIM_TTL seconds belongs to a worker that died mid-call and is taken over.
+    """
+    now = datetime.now().astimezone()
+    builder = (
+        get_supabase()
+        .table("daily_theater_tasks")
+        .update({"opener_claim": token, "opener_claimed_at": now.isoformat()})
+        .in_("id", [task["id"] for task in tasks])
+        .lt("opener_claimed_at", (now - timedelta(seconds=DAILY_OPENERS_CLAIM_TTL)).isoformat())
+    )
+    if not force:
+        builder = builder.is_("opener", "null")
+    return ensure_ok(builder, context="claim daily task openers") or []
+
+
+def fill_daily_openers(day_keys: List[str], force: bool = False) -> Dict[str, int]:
+    """Generate and store openers for the days' tasks, DAILY_OPENERS_CONCURRENCY model calls in flight at most.
+
+    Workers claim tasks before calling the model, so each opener is paid for once however many run this job.
+    """
+    tasks = [row for day_key in day_keys for row in load_daily_tasks(day_key) if force or not row.get("opener")]
+    summary = {"generated": 0, "skipped": 0, "failed": 0}
+    if not tasks:
+        return summary
+    token = uuid.uuid4().hex
+    claimed = claim_daily_openers(tasks, token, force)
+    summary["skipped"] += len(tasks) - len(claimed)
+    if not claimed:
+        return summary
+
+    def release(task: Dict[str, Any]) -> None:
+        get_supabase().table("daily_theater_tasks").update({"opener_claimed_at": OPENER_UNCLAIMED}).eq("id", task["id"]).eq(
+            "opener_claim", token
+        ).execute()
+
+    def fill(task: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        try:
+            fields = generate_task_opener(task)
+        except Exception:
+            release(task)
+            raise
+        if fields is None:
+            release(task)
+            return None
+        result = ensure_ok(
+            get_supabase()
+            .table("daily_theater_tasks")
+            .update({**fields, "opener_claimed_at": OPENER_UNCLAIMED})
+            .eq("id", task["id"])
+            .eq("opener_claim", token),
+            context="store daily task opener",
+        )
+        # No row back means the day was regenerated, or our lease expired and another worker took the task.
+        return result[0] if result else None
+
+    changed_days: Set[str] = set()
+    with ThreadPoolExecutor(max_workers=DAILY_OPENERS_CONCURRENCY, thread_name_prefix="daily-openers") as pool:
+        futures = {pool.submit(fill, task): task for task in claimed}
+        for future in as_completed(futures):
+            try:
+                row = future.result()
+            except Exception as exc:
+                summary["failed"] += 1
+                logger.warning("Opener for daily task %s failed: %s", futures[future].get("id"), exc)
+                continue
+            if row is None:
+                summary["skipped"] += 1
+                continue
+            summary["generated"] += 1
+            replace_cached_task(row)
+            changed_days.add(str(row.get("day_key")))
+    if changed_days:
+        publish_daily_tasks_change(sorted(changed_days))
+    return summary
+
+
+def run_daily_openers():
+    if not DASHSCOPE_API_KEY:
+        return
+    today = date.today()
+    if OPENERS_WINDOW and in_time_window(OPENERS_WINDOW, datetime.now().time()):
+        day_keys = [(today + timedelta(days=offset)).isoformat() for offset in range(DAILY_TASKS_DAYS_AHEAD)]
+    else:
+        day_keys = [today.isoformat()]
+    summary = fill_daily_openers(day_keys)
+    if summary["generated"] or summary["failed"]:
+        logger.info("Daily openers for %s: %s", ", ".join(day_keys), summary)
+
+
+DAILY_OPENERS_JOB = PeriodicJob("daily-openers", DAILY_OPENERS_INTERVAL, run_daily_openers)
+
+
+@app.on_event("startup")
+def start_daily_openers_job():
+    if os.getenv("DAILY_TASKS_SCHEDULER", "1") != "0" and os.getenv("DAILY_OPENERS", "1") != "0":
+        DAILY_OPENERS_JOB.start()
+
+
+# ------------------- Catalog index & search -------------------
+
+SEARCH_INDEX = SearchIndex(
+    field_weights={"name": 3.0, "title": 3.0, "tags": 2.5, "location": 1.5, "city": 1.5, "summary": 1.0, "description": 1.0, "persona": 0.5},
+)
+FEED_RANKER = FeedRanker(
+    explore_to_api,
+    top_k=int(os.getenv("FEED_TOP_K", "1000")),
+    half_life_hours=float(os.getenv("FEED_HALF_LIFE_HOURS", "72")),
+)
+CATALOG_PAGE_SIZE = int(os.getenv("CATALOG_PAGE_SIZE", "1000"))
+# Other workers' writes reach this one through the invalidation channel (CACHE_BACKEND=redis/tiered)
+# and through a periodic delta on updated_at, which also picks up writes made outside the API
+# (e.g. likes and views written straight to explore_items.stats).
+CATALOG_REFRESH_INTERVAL = float(os.getenv("CATALOG_REFRESH_INTERVAL", "60"))
+CATALOG_REBUILD_INTERVAL = float(os.getenv("CATALOG_REBUILD_INTERVAL", "3600"))
+# The delta re-reads this much before the last updated_at seen, for transactions that committed late.
+CATALOG_REFRESH_OVERLAP = timedelta(seconds=30)
+CATALOG_TABLES = {"role": "roles", "explore": "explore_items"}
+_CATALOG_SYNC_LOCK = threading.Lock()
+_CATALOG_SYNC: Dict[str, Any] = {"watermarks": {}, "rebuiltAt": 0.0, "resync": False}
+_CATALOG_PENDING: Dict[str, Set[str]] = {table: set() for table in CATALOG_TABLES.values()}
+
+
+def fetch_all_rows(table: str, page_size: int = CATALOG_PAGE_SIZE) -> List[Dict[str, Any]]:
+    with timed("supabase", f"load all {table}"):
+        return list(iter_table_rows(get_supabase(), table, page_size))
+
+
+def role_search_doc(row: Dict[str, Any]):
+    fields = {key: row.get(key) for key in ("name", "title", "city", "description", "persona")}
+    filters = {"visible": (row.get("status") or "published") == "published"}
+    return ("role", row.get("id"), fields, row.get("tags") or [], filters, role_card_to_api(row))
+
+
+def explore_search_doc(row: Dict[str, Any]):
+    fields = {key: row.get(key) for key in ("title", "summary", "location")}
+    filters = {"visible": True, "type": row.get("type")}
+    return ("explore", row.get("id"), fields, row.get("tags") or [], filters, explore_to_api(row))
+
+
+def apply_catalog_rows(table: str, rows: List[Dict[str, Any]], deleted_ids: Sequence[str] = ()) -> None:
+    """Apply changed and deleted catalog rows to this worker's search index and feed ranker."""
+    kind, to_doc = ("role", role_search_doc) if table == "roles" else ("explore", explore_search_doc)
+    for row in rows:
+        SEARCH_INDEX.upsert(*to_doc(row))
+        if kind == "explore":
+            FEED_RANKER.upsert(row)
+        else:
+            FEED_RANKER.set_role_tags(row.get("id"), row.get("tags") or [])
+    for doc_id in deleted_ids:
+        SEARCH_INDEX.remove(kind, doc_id)
+        if kind == "explore":
+            FEED_RANKER.remove(doc_id)
+        else:
+            FEED_RANKER.set_role_tags(doc_id, None)
+
+
+def notify_catalog_change(table: str, rows: Optional[List[Dict[str, Any]]] = None, deleted_ids: Optional[List[str]] = None):
+    """Apply committed catalog writes to every in-process derived view and evict cached copies in all workers."""
+    if table == "roles":
+        kind = "role"
+    elif table == "explore_items":
+        kind = "explore"
+    else:
+        return
+    changed_ids = [row.get("id") for row in rows or []] + list(deleted_ids or [])
+    CACHE.invalidate(
+        keys=[f"{kind}:{doc_id}" for doc_id in changed_ids if doc_id],
+        groups=[EXPLORE_PAGES_GROUP] if kind == "explore" else [],
+    )
+    apply_catalog_rows(table, rows or [], deleted_ids or [])
+    if SNAPSHOTS is not None:
+        SNAPSHOTS.mark_dirty(snapshot_shards_for(kind, rows or [], [doc_id for doc_id in changed_ids if doc_id]))
+
+
+def latest_updated_at(rows: List[Dict[str, Any]], current: Optional[str] = None) -> Optional[str]:
+    stamps = [row["updated_at"] for row in rows if row.get("updated_at")]
+    if current:
+        stamps.append(current)
+    return max(stamps, key=parse_timestamp) if stamps else None
+
+
+def rebuild_catalog_indexes():
+    started = time.perf_counter()
+    with _CATALOG_SYNC_LOCK:
+        _CATALOG_SYNC["resync"] = False
+    roles = fetch_all_rows("roles")
+    items = fetch_all_rows("explore_items")
+    SEARCH_INDEX.replace_all([role_search_doc(row) for row in roles] + [explore_search_doc(row) for row in items])
+    FEED_RANKER.replace_all(items, roles)
+    with _CATALOG_SYNC_LOCK:
+        _CATALOG_SYNC["watermarks"] = {"roles": latest_updated_at(roles), "explore_items": latest_updated_at(items)}
+        _CATALOG_SYNC["rebuiltAt"] = time.monotonic()
+    logger.info(
+        "Catalog indexes rebuilt: %d roles, %d explore items in %.0f ms",
+        len(roles),
+        len(items),
+        (time.perf_counter() - started) * 1000,
+    )
+
+
+def fetch_rows_changed_since(table: str, since: Optional[str]) -> Optional[List[Dict[str, Any]]]:
+    """Rows updated after ``since`` (minus the overlap); None when there are too many for a delta."""
+    query = get_supabase().table(table).select("*").order("updated_at", desc=False).limit(CATALOG_PAGE_SIZE)
+    if since:
+        moment = datetime.fromisoformat(since.replace("Z", "+00:00")) - CATALOG_REFRESH_OVERLAP
+        query = query.gt("updated_at", moment.isoformat())
+    rows = ensure_ok(query, context=f"load changed {table}") or []
+    return None if len(rows) >= CATALOG_PAGE_SIZE else rows
+
+
+def refresh_catalog_indexes():
+    """Bring this worker's catalog views up to date with writes made by other workers or outside the API.
+
+    Rows whose updated_at moved are re-applied; ids named in invalidation messages are re-fetched
+    so deletes are seen too. A full rebuild runs after a subscriber reconnect, when the delta is
+    too large, and every CATALOG_REBUILD_INTERVAL seconds (deletes without Redis show up then).
+    """
+    if not SEARCH_INDEX.ready:
+        return  # The warm-up build has not finished; it will load everything.
+    with _CATALOG_SYNC_LOCK:
+        pending = {table: set(ids) for table, ids in _CATALOG_PENDING.items()}
+        for ids in _CATALOG_PENDING.values():
+            ids.clear()
+        full = _CATALOG_SYNC["resync"] or time.monotonic() - _CATALOG_SYNC["rebuiltAt"] >= CATALOG_REBUILD_INTERVAL
+        watermarks = dict(_CATALOG_SYNC["watermarks"])
+    try:
+        if not full:
+            deltas = {}
+            for table in CATALOG_TABLES.values():
+                rows = fetch_rows_changed_since(table, watermarks.get(table))
+                if rows is None:
+                    full = True
+                    break
+                deltas[table] = rows
+        if full:
+            rebuild_catalog_indexes()
+            return
+        for table, rows in deltas.items():
+            ids = pending[table] - {row.get("id") for row in rows}
+            if ids:
+                rows = rows + (
+                    ensure_ok(get_supabase().table(table).select("*").in_("id", sorted(ids)), context=f"load invalidated {table}") or []
+                )
+            deleted = sorted(ids - {row.get("id") for row in rows})
+            if rows or deleted:
+                apply_catalog_rows(table, rows, deleted)
+            with _CATALOG_SYNC_LOCK:
+                _CATALOG_SYNC["watermarks"][table] = latest_updated_at(rows, _CATALOG_SYNC["watermarks"].get(table))
+    except Exception:
+        with _CATALOG_SYNC_LOCK:
+            for table, ids in pending.items():
+                _CATALOG_PENDING[table].update(ids)
+        raise
+
+
+CATALOG_REFRESH_JOB = PeriodicJob("catalog-refresh", CATALOG_REFRESH_INTERVAL, refresh_catalog_indexes, run_immediately=False)
+
+
+def on_catalog_invalidation(keys: List[str], groups: List[str]) -> None:
+    # Runs on the cache subscriber thread: record the ids and let the refresh job fetch them.
+    found = False
+    with _CATALOG_SYNC_LOCK:
+        for key in keys:
+            kind, _, doc_id = key.partition(":")
+            if kind in CATALOG_TABLES and doc_id and not doc_id.startswith("page:"):
+                _CATALOG_PENDING[CATALOG_TABLES[kind]].add(doc_id)
+                found = True
+    if found:
+        CATALOG_REFRESH_JOB.trigger()
+
+
+def on_catalog_resync() -> None:
+    with _CATALOG_SYNC_LOCK:
+        _CATALOG_SYNC["resync"] = True
+    CATALOG_REFRESH_JOB.trigger()
+
+
+if CATALOG_REFRESH_INTERVAL > 0:
+    CACHE.add_listener(on_catalog_invalidation, on_catalog_resync)
+
+
+@app.on_event("startup")
+def start_catalog_refresh_job():
+    if CATALOG_REFRESH_INTERVAL > 0:
+        CATALOG_REFRESH_JOB.start()
+
+
+def warm_supabase_connection():
+    # One cheap query opens the pooled HTTP/TLS connection to PostgREST.
+    ensure_ok(get_supabase().table("roles").select("id").limit(1), context="warm-up")
+
+
+def warm_dashscope_connection():
+    if DASHSCOPE_API_KEY:
+        get_http_client().head(DASHSCOPE_ENDPOINT, timeout=5.0)
+
+
+def warm_daily_tasks():
+    day_key = date.today().isoformat()
+    started = time.monotonic()
+    cache_daily_tasks(day_key, load_daily_tasks(day_key), loaded_at=started)
+
+
+@app.on_event("startup")
+def start_warm_up():
+    WARMUP.step("supabase_client", get_supabase)
+    WARMUP.step("supabase_connection", warm_supabase_connection)
+    WARMUP.step("catalog_indexes", rebuild_catalog_indexes)
+    WARMUP.step("http_client", get_http_client)
+    WARMUP.step("cache_invalidation", CACHE.start_subscriber, required=False)
+    WARMUP.step("dashscope_connection", warm_dashscope_connection, required=False)
+    WARMUP.step("postgres_pool", get_pg_gateway, required=False)
+    WARMUP.step("template_index", get_template_sampler, required=False)
+    WARMUP.step("daily_tasks_today", warm_daily_tasks, required=False)
+    WARMUP.start()
+
+
+@app.get("/explore/feed")
+def ranked_explore_feed(
+    item_type: Optional[str] = Query(None, description="Filter by type: post or world"),
+    role_id: Optional[str] = Query(None, description="Boost items linked to / sharing tags with this role"),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+):
+    if item_type not in (None, "post", "world"):
+        raise HTTPException(status_code=400, detail="item_type must be post or world")
+    if not FEED_RANKER.ready:
+        return list_explore_items(item_type=item_type, limit=limit, offset=offset, ids=None, expand_roles=False)
+    return FEED_RANKER.page(item_type or "all", limit=limit, offset=offset, role_id=role_id)
+
+
+@app.get("/search")
+def search_catalog(
+    q: str = Query("", description="Search text; Chinese is matched by character n-grams"),
+    kind: Optional[str] = Query(None, description="role or explore"),
+    item_type: Optional[str] = Query(None, description="Explore type filter: post or world"),
+    tags: Optional[str] = Query(None, description="Comma-separated tags that must all match"),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+):
+    if not SEARCH_INDEX.ready:
+        raise HTTPException(status_code=503, detail="Search index is warming up")
+    if kind not in (None, "role", "explore"):
+        raise HTTPException(status_code=400, detail="kind must be role or explore")
+    if item_type:
+        kind = "explore"
+    filters: Dict[str, Any] = {"visible": True}
+    if item_type:
+        filters["type"] = item_type
+    return SEARCH_INDEX.search(q, kind=kind, tags=parse_id_list(tags), filters=filters, limit=limit, offset=offset)
+
+
+# ------------------- Catalog snapshots -------------------
+
+SNAPSHOT_PREFIX = os.getenv("SNAPSHOT_PREFIX", "catalog")
+SNAPSHOT_ROLE_SHARDS = max(int(os.getenv("SNAPSHOT_ROLE_SHARDS", "4")), 1)
+SNAPSHOT_EXPLORE_PAGES = int(os.getenv("SNAPSHOT_EXPLORE_PAGES", "3"))
+SNAPSHOT_PAGE_SIZE = int(os.getenv("SNAPSHOT_PAGE_SIZE", "20"))
+SNAPSHOT_PUBLIC_BASE = (os.getenv("SNAPSHOT_PUBLIC_BASE") or "").strip().rstrip("/")
+SNAPSHOT_MANIFEST_MAX_AGE = int(os.getenv("SNAPSHOT_MANIFEST_MAX_AGE", "10"))
+EXPLORE_TYPES = ("post", "world")
+# explore shard -> (item ids, referenced role ids) as of its last build here; lets a role write
+# dirty only the explore pages that embed that role. Request threads read it while the
+# publisher rebuilds shards, so both sides go through the lock.
+_SNAPSHOT_EXPLORE_REFS: Dict[str, Tuple[Set[str], Set[str]]] = {}
+_SNAPSHOT_REFS_LOCK = threading.Lock()
+
+
+def role_shard(role_id: str) -> str:
+    return f"roles-{zlib.crc32(role_id.encode('utf-8')) % SNAPSHOT_ROLE_SHARDS}"
+
+
+def explore_shard_names() -> List[str]:
+    return [f"explore-{item_type}-{page}" for item_type in EXPLORE_TYPES for page in range(SNAPSHOT_EXPLORE_PAGES)]
+
+
+def snapshot_shard_names() -> List[str]:
+    return [f"roles-{index}" for index in range(SNAPSHOT_ROLE_SHARDS)] + explore_shard_names()
+
+
+def snapshot_shards_for(kind: str, rows: List[Dict[str, Any]], changed_ids: List[str]) -> Set[str]:
+    shards: Set[str] = set()
+    with _SNAPSHOT_REFS_LOCK:
+        refs = dict(_SNAPSHOT_EXPLORE_REFS)
+    # Shards this worker has not built yet have unknown contents: treat them as affected.
+    unknown = [name for name in explore_shard_names() if name not in refs]
+    if kind == "role":
+        shards.update(role_shard(role_id) for role_id in changed_ids)
+        ids = set(changed_ids)
+        shards.update(name for name, (_, role_ids) in refs.items() if role_ids & ids)
+        return shards | set(unknown)
+    for item_type in {row.get("type") for row in rows if row.get("type") in EXPLORE_TYPES}:
+        shards.update(name for name in explore_shard_names() if name.startswith(f"explore-{item_type}-"))
+    ids = set(changed_ids) - {row.get("id") for row in rows}
+    if ids:
+        # Deletes carry no type; dirty the pages that held the item.
+        shards.update(name for name, (item_ids, _) in refs.items() if item_ids & ids)
+        shards.update(unknown)
+    return shards
+
+
+def build_snapshot_shards(names: Sequence[str]) -> Dict[str, Any]:
+    payloads: Dict[str, Any] = {}
+    role_names = [name for name in names if name.startswith("roles-")]
+    if role_names:
+        roles = sorted(
+            (row for row in fetch_all_rows("roles") if row.get("status") == "published"),
+            key=lambda row: (row.get("name") or "", row.get("id") or ""),
+        )
+        for name in role_names:
+            payloads[name] = [role_to_api(row) for row in roles if role_shard(row.get("id") or "") == name]
+    for name in names:
+        if not name.startswith("explore-"):
+            continue
+        _, item_type, page = name.split("-")
+        rows = load_explore_page(item_type, SNAPSHOT_PAGE_SIZE, int(page) * SNAPSHOT_PAGE_SIZE)
+        role_cards = fetch_role_cards(rows)
+        payloads[name] = [explore_to_api(row, role_cards) for row in rows]
+        item_ids = {row.get("id") for row in rows}
+        role_ids = {role_id for row in rows for role_id in [row.get("target_role_id")] + list(row.get("recommended_roles") or []) if role_id}
+        with _SNAPSHOT_REFS_LOCK:
+            _SNAPSHOT_EXPLORE_REFS[name] = (item_ids, role_ids)
+    return payloads
+
+
+def upload_snapshot_object(path: str, body: bytes, max_age: int) -> None:
+    bucket = os.getenv("SUPABASE_STORAGE_BUCKET", "wondera-assets")
+    with timed("storage", "upload snapshot"):
+        result = get_supabase().storage.from_(bucket).upload(
+            path,
+            body,
+            {"content-type": "application/json", "cache-control": str(max_age), "x-upsert": "true"},
+        )
+    if hasattr(result, "error") and result.error:
+        message = getattr(result.error, "message", None) or str(result.error)
+        raise RuntimeError(f"Snapshot upload failed: {message}")
+
+
+def download_snapshot_object(path: str) -> Optional[bytes]:
+    bucket = os.getenv("SUPABASE_STORAGE_BUCKET", "wondera-assets")
+    try:
+        with timed("storage", "download snapshot"):
+            return get_supabase().storage.from_(bucket).download(path)
+    except Exception as exc:
+        logger.debug("Snapshot object %s not readable: %s", path, exc)
+        return None
+
+
+def snapshot_public_url(path: str) -> str:
+    if SNAPSHOT_PUBLIC_BASE:
+        return f"{SNAPSHOT_PUBLIC_BASE}/{path}"
+    return build_public_url(os.getenv("SUPABASE_STORAGE_BUCKET", "wondera-assets"), path)
+
+
+SNAPSHOTS = (
+    SnapshotPublisher(
+        snapshot_shard_names,
+        build_snapshot_shards,
+        upload_snapshot_object,
+        download_snapshot_object,
+        snapshot_public_url,
+        prefix=SNAPSHOT_PREFIX,
+        debounce=float(os.getenv("SNAPSHOT_DEBOUNCE", "2.0")),
+        manifest_ttl=SNAPSHOT_MANIFEST_MAX_AGE,
+    )
+    if os.getenv("CATALOG_SNAPSHOTS", "0") == "1"
+    else None
+)
+SNAPSHOT_JOB = PeriodicJob("catalog-snapshots", 1.0, SNAPSHOTS.publish if SNAPSHOTS else lambda: None, run_immediately=False)
+
+
+@app.on_event("startup")
+def start_catalog_snapshots():
+    if SNAPSHOTS is None:
+        return
+    # Writes made while no worker was running are picked up; unchanged shards are not re-uploaded.
+    SNAPSHOTS.mark_all()
+    SNAPSHOT_JOB.start()
+
+
+@app.on_event("shutdown")
+def publish_pending_snapshots():
+    if SNAPSHOTS is None:
+        return
+    SNAPSHOT_JOB.stop()
+    try:
+        SNAPSHOTS.publish(force=True)
+    except Exception:
+        logger.exception("Final catalog snapshot publish failed")
+
+
+@app.get("/catalog/manifest")
+def get_catalog_manifest(request: Request):
+    """Where to fetch the published catalog: one content-hashed JSON object per shard."""
+    if SNAPSHOTS is None:
+        raise HTTPException(status_code=404, detail="Catalog snapshots are disabled")
+    manifest = SNAPSHOTS.get_manifest()
+    if manifest is None:
+        raise HTTPException(status_code=503, detail="Catalog snapshot not published yet")
+    headers = {"ETag": SNAPSHOTS.etag, "Cache-Control": f"public, max-age={SNAPSHOT_MANIFEST_MAX_AGE}"}
+    if request.headers.get("if-none-match") == SNAPSHOTS.etag:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(manifest, headers=headers)
+
+
 # ------------------- Admin APIs -------------------
 
 
@@ -662,15 +2344,15 @@ def admin_list_roles(
 ):
     supabase = get_supabase()
     result = ensure_ok(
-        supabase.table("roles").select("*").order("name", desc=False).range(offset, offset + limit - 1).execute(),
+        supabase.table("roles").select("*").order("name", desc=False).range(offset, offset + limit - 1),
         context="admin list roles",
     )
     return [role_to_api(row) for row in (result or [])]
 
 
 @app.post("/admin/roles")
-def admin_create_role(payload: RoleCreate, _: str = Depends(require_admin)):
-    return create_role(payload)
+def admin_create_role(payload: RoleCreate, _: str = Depends(require_admin), run=Depends(idempotent("create_role"))):
+    return run(payload, lambda: insert_role(payload))
 
 
 @app.patch("/admin/roles/{role_id}")
@@ -685,14 +2367,14 @@ def admin_list_explore_items(
     offset: int = Query(0, ge=0),
     _: str = Depends(require_admin),
 ):
-    return list_explore_items(item_type=item_type, limit=limit, offset=offset)
+    return list_explore_items(item_type=item_type, limit=limit, offset=offset, ids=None, expand_roles=False)
 
 
 @app.get("/admin/explore/items/{item_id}")
 def admin_get_explore_item(item_id: str, _: str = Depends(require_admin)):
     supabase = get_supabase()
     result = ensure_ok(
-        supabase.table("explore_items").select("*").eq("id", item_id).single().execute(),
+        supabase.table("explore_items").select("*").eq("id", item_id).single(),
         context="admin get explore item",
     )
     if not result:
@@ -701,8 +2383,8 @@ def admin_get_explore_item(item_id: str, _: str = Depends(require_admin)):
 
 
 @app.post("/admin/explore/items")
-def admin_create_explore_item(payload: ExploreItemCreate, _: str = Depends(require_admin)):
-    return create_explore_item(payload)
+def admin_create_explore_item(payload: ExploreItemCreate, _: str = Depends(require_admin), run=Depends(idempotent("create_explore_item"))):
+    return run(payload, lambda: insert_explore_item(payload))
 
 
 @app.patch("/admin/explore/items/{item_id}")
@@ -712,11 +2394,12 @@ def admin_update_explore_item(item_id: str, payload: ExploreItemUpdate, _: str =
     if not updates:
         raise HTTPException(status_code=400, detail="No updates provided")
     result = ensure_ok(
-        supabase.table("explore_items").update(updates).eq("id", item_id).execute(),
+        supabase.table("explore_items").update(updates).eq("id", item_id),
         context="admin update explore item",
     )
     if not result:
         raise HTTPException(status_code=404, detail="Explore item not found")
+    notify_catalog_change("explore_items", rows=result)
     return explore_to_api(result[0])
 
 
@@ -724,11 +2407,12 @@ def admin_update_explore_item(item_id: str, payload: ExploreItemUpdate, _: str =
 def admin_delete_explore_item(item_id: str, _: str = Depends(require_admin)):
     supabase = get_supabase()
     result = ensure_ok(
-        supabase.table("explore_items").delete().eq("id", item_id).execute(),
+        supabase.table("explore_items").delete().eq("id", item_id),
         context="admin delete explore item",
     )
     if not result:
         raise HTTPException(status_code=404, detail="Explore item not found")
+    notify_catalog_change("explore_items", deleted_ids=[item_id])
     return {"deleted": item_id}
 
 
@@ -740,7 +2424,7 @@ def admin_list_daily_templates(
 ):
     supabase = get_supabase()
     result = ensure_ok(
-        supabase.table("daily_theater_templates").select("*").order("created_at", desc=True).range(offset, offset + limit - 1).execute(),
+        supabase.table("daily_theater_templates").select("*").order("created_at", desc=True).range(offset, offset + limit - 1),
         context="admin list daily templates",
     )
     return result or []
@@ -749,15 +2433,14 @@ def admin_list_daily_templates(
 @app.post("/admin/daily-templates")
 def admin_create_daily_template(payload: DailyTemplateCreate, _: str = Depends(require_admin)):
     supabase = get_supabase()
-    template_id = payload.id or f"template-{uuid.uuid4().hex[:10]}"
-    data = model_to_dict(payload)
-    data["id"] = template_id
+    data = template_insert_data(payload)
     result = ensure_ok(
-        supabase.table("daily_theater_templates").insert(data).execute(),
+        supabase.table("daily_theater_templates").insert(data),
         context="admin create daily template",
     )
     if not result:
         raise HTTPException(status_code=500, detail="Failed to create daily template")
+    TEMPLATE_SAMPLER.upsert(result[0])
     return result[0]
 
 
@@ -770,11 +2453,12 @@ def admin_update_daily_template(
     if not updates:
         raise HTTPException(status_code=400, detail="No updates provided")
     result = ensure_ok(
-        supabase.table("daily_theater_templates").update(updates).eq("id", template_id).execute(),
+        supabase.table("daily_theater_templates").update(updates).eq("id", template_id),
         context="admin update daily template",
     )
     if not result:
         raise HTTPException(status_code=404, detail="Daily template not found")
+    TEMPLATE_SAMPLER.upsert(result[0])
     return result[0]
 
 
@@ -782,14 +2466,154 @@ def admin_update_daily_template(
 def admin_delete_daily_template(template_id: str, _: str = Depends(require_admin)):
     supabase = get_supabase()
     result = ensure_ok(
-        supabase.table("daily_theater_templates").delete().eq("id", template_id).execute(),
+        supabase.table("daily_theater_templates").delete().eq("id", template_id),
         context="admin delete daily template",
     )
     if not result:
         raise HTTPException(status_code=404, detail="Daily template not found")
+    TEMPLATE_SAMPLER.remove(template_id)
     return {"deleted": template_id}
 
 
+# Above this many distinct change sets, updates switch from one `in_` update per
+# change set to a single read-merge-upsert so round trips stay constant.
+BATCH_UPDATE_GROUPS = int(os.getenv("BATCH_UPDATE_GROUPS", "4"))
+
+
+def _batch_error(exc: Exception) -> str:
+    if isinstance(exc, HTTPException):
+        return str(exc.detail)
+    return getattr(exc, "message", None) or str(exc)
+
+
+def apply_admin_batch(
+    table: str,
+    creates: List[Dict[str, Any]],
+    updates: List[Any],
+    deletes: List[str],
+    to_api,
+) -> Dict[str, Any]:
+    """Apply create/update/delete arrays with one PostgREST call per operation kind where possible.
+
+    Returns per-item results; a failed call marks only the items it carried.
+    """
+    supabase = get_supabase()
+    results: List[Dict[str, Any]] = []
+    written: List[Dict[str, Any]] = []
+    deleted: List[str] = []
+
+    def record(op: str, item_id: str, row: Optional[Dict[str, Any]], missing: str):
+        if row is None:
+            results.append({"op": op, "id": item_id, "ok": False, "error": missing})
+        else:
+            results.append({"op": op, "id": item_id, "ok": True, "item": to_api(row)})
+
+    if creates:
+        try:
+            rows = ensure_ok(supabase.table(table).insert(creates), context=f"batch create {table}") or []
+            by_id = {row.get("id"): row for row in rows}
+            written.extend(rows)
+            for data in creates:
+                record("create", data["id"], by_id.get(data["id"]), "Not created")
+        except Exception as exc:
+            results.extend({"op": "create", "id": data["id"], "ok": False, "error": _batch_error(exc)} for data in creates)
+
+    changes_by_id: Dict[str, Dict[str, Any]] = {}
+    for entry in updates:
+        changes = {k: v for k, v in model_to_dict(entry.changes).items() if v is not None}
+        if not changes:
+            results.append({"op": "update", "id": entry.id, "ok": False, "error": "No updates provided"})
+            continue
+        changes_by_id.setdefault(entry.id, {}).update(changes)
+    if changes_by_id:
+        groups: Dict[str, Any] = {}
+        for item_id, changes in changes_by_id.items():
+            key = json.dumps(changes, sort_keys=True, default=str)
+            groups.setdefault(key, (changes, []))[1].append(item_id)
+        by_id: Dict[str, Dict[str, Any]] = {}
+        failed: Dict[str, str] = {}
+        if len(groups) <= BATCH_UPDATE_GROUPS:
+            for changes, ids in groups.values():
+                try:
+                    rows = ensure_ok(
+                        supabase.table(table).update(changes).in_("id", ids),
+                        context=f"batch update {table}",
+                    ) or []
+                    by_id.update((row.get("id"), row) for row in rows)
+                except Exception as exc:
+                    failed.update(dict.fromkeys(ids, _batch_error(exc)))
+        else:
+            ids = list(changes_by_id)
+            try:
+                current = ensure_ok(
+                    supabase.table(table).select("*").in_("id", ids),
+                    context=f"batch load {table}",
+                ) or []
+                merged = [dict(row, **changes_by_id[row["id"]]) for row in current]
+                for row in merged:
+                    row.pop("updated_at", None)
+                if merged:
+                    rows = ensure_ok(supabase.table(table).upsert(merged), context=f"batch update {table}") or []
+                    by_id.update((row.get("id"), row) for row in rows)
+            except Exception as exc:
+                failed.update(dict.fromkeys(ids, _batch_error(exc)))
+        for item_id in changes_by_id:
+            if item_id in failed:
+                results.append({"op": "update", "id": item_id, "ok": False, "error": failed[item_id]})
+            else:
+                record("update", item_id, by_id.get(item_id), "Not found")
+        written.extend(by_id.values())
+
+    if deletes:
+        ids = list(dict.fromkeys(deletes))
+        try:
+            rows = ensure_ok(supabase.table(table).delete().in_("id", ids), context=f"batch delete {table}") or []
+            found = {row.get("id") for row in rows}
+            deleted.extend(found)
+            for item_id in ids:
+                if item_id in found:
+                    results.append({"op": "delete", "id": item_id, "ok": True})
+                else:
+                    results.append({"op": "delete", "id": item_id, "ok": False, "error": "Not found"})
+        except Exception as exc:
+            results.extend({"op": "delete", "id": item_id, "ok": False, "error": _batch_error(exc)} for item_id in ids)
+
+    return {"results": results, "written": written, "deleted": deleted}
+
+
+def _batch_response(outcome: Dict[str, Any]) -> Dict[str, Any]:
+    results = outcome["results"]
+    succeeded = sum(1 for item in results if item["ok"])
+    return {"succeeded": succeeded, "failed": len(results) - succeeded, "results": results}
+
+
+@app.post("/admin/roles/batch")
+def admin_batch_roles(payload: RoleBatchRequest, _: str = Depends(require_admin)):
+    creates = [role_insert_data(item) for item in payload.create]
+    outcome = apply_admin_batch("roles", creates, payload.update, [], role_to_api)
+    notify_catalog_change("roles", rows=outcome["written"])
+    return _batch_response(outcome)
+
+
+@app.post("/admin/explore/items/batch")
+def admin_batch_explore_items(payload: ExploreItemBatchRequest, _: str = Depends(require_admin)):
+    creates = [explore_insert_data(item) for item in payload.create]
+    outcome = apply_admin_batch("explore_items", creates, payload.update, payload.delete, explore_to_api)
+    notify_catalog_change("explore_items", rows=outcome["written"], deleted_ids=outcome["deleted"])
+    return _batch_response(outcome)
+
+
+@app.post("/admin/daily-templates/batch")
+def admin_batch_daily_templates(payload: DailyTemplateBatchRequest, _: str = Depends(require_admin)):
+    creates = [template_insert_data(item) for item in payload.create]
+    outcome = apply_admin_batch("daily_theater_templates", creates, payload.update, payload.delete, lambda row: row)
+    for row in outcome["written"]:
+        TEMPLATE_SAMPLER.upsert(row)
+    for template_id in outcome["deleted"]:
+        TEMPLATE_SAMPLER.remove(template_id)
+    return _batch_response(outcome)
+
+
 @app.get("/admin/daily-tasks")
 def admin_list_daily_tasks(day_key: str = Query(..., description="YYYY-MM-DD"), _: str = Depends(require_admin)):
     return list_daily_tasks(day_key)
@@ -801,45 +2625,203 @@ def admin_generate_daily_tasks(
     count: int = Query(3, ge=1, le=10),
     _: str = Depends(require_admin),
 ):
-    supabase = get_supabase()
-    templates = ensure_ok(
-        supabase.table("daily_theater_templates").select("*").execute(),
-        context="admin load daily templates",
-    )
-    if not templates:
-        raise HTTPException(status_code=400, detail="No daily templates available")
-    # Shuffle and pick
-    shuffled = list(templates)
-    secrets.SystemRandom().shuffle(shuffled)
-    selected = shuffled[: min(count, len(shuffled))]
-    day_key_value = day_key.isoformat()
-    # Remove existing tasks for the day
-    ensure_ok(
-        supabase.table("daily_theater_tasks").delete().eq("day_key", day_key_value).execute(),
-        context="admin clear daily tasks",
+    rows = materialize_daily_tasks(day_key.isoformat(), count, replace=True)
+    # The new tasks have no openers yet; for today the job fills them right away.
+    DAILY_OPENERS_JOB.trigger()
+    return rows
+
+
+@app.post("/admin/daily-tasks/openers")
+def admin_generate_daily_openers(
+    day_key: date = Query(..., description="YYYY-MM-DD"),
+    force: bool = Query(False, description="Regenerate tasks that already have an opener"),
+    _: str = Depends(require_admin),
+):
+    return fill_daily_openers([day_key.isoformat()], force=force)
+
+
+# ------------------- Admin NDJSON export / import -------------------
+
+
+def check_ndjson_table(table: str) -> None:
+    if table not in NDJSON_TABLES:
+        raise HTTPException(status_code=404, detail=f"Unknown table, expected one of: {', '.join(NDJSON_TABLES)}")
+
+
+def import_ndjson_chunk(table: str, rows: List[Dict[str, Any]]) -> int:
+    with timed("supabase", f"import {table}"):
+        written = upsert_chunk(get_supabase(), table, rows)
+    if table == "daily_theater_templates":
+        for row in written:
+            TEMPLATE_SAMPLER.upsert(row)
+    else:
+        notify_catalog_change(table, rows=written)
+    return len(rows)
+
+
+@app.get("/admin/export/{table}")
+def admin_export_table(
+    table: str,
+    page_size: int = Query(CATALOG_PAGE_SIZE, ge=1, le=5000),
+    _: str = Depends(require_admin),
+):
+    check_ndjson_table(table)
+    rows = iter_table_rows(get_supabase(), table, page_size)
+    # Read the first page before answering so a failing query is still a plain 500.
+    first = next(rows, None)
+    body = encode_rows(itertools.chain([first], rows)) if first is not None else iter(())
+    return StreamingResponse(
+        BULKHEADS.pools["admin"].stream(body),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{table}.ndjson"'},
     )
-    payloads = []
-    for template in selected:
-        payloads.append(
-            {
-                "day_key": day_key_value,
-                "template_id": template.get("id"),
-                "title": template.get("title"),
-                "description": template.get("description"),
-                "scene": template.get("scene"),
-                "target_role_id": template.get("target_role_id"),
-                "kickoff_prompt": template.get("kickoff_prompt"),
-                "difficulty": template.get("difficulty"),
-                "target_words": template.get("target_words") or [],
-                "reward_points": template.get("reward_points") or 5,
-                "completed": False,
-            }
+
+
+@app.post("/admin/import/{table}")
+async def admin_import_table(
+    table: str,
+    request: Request,
+    chunk_size: int = Query(DEFAULT_CHUNK_SIZE, ge=1, le=5000),
+    _: str = Depends(require_admin),
+):
+    """Stream an NDJSON body into ``table``; each chunk is upserted on the admin bulkhead as it arrives."""
+    check_ndjson_table(table)
+    pool = BULKHEADS.for_path(request.url.path)
+    decoder = NdjsonDecoder(table)
+    counts = {"read": 0, "upserted": 0, "chunks": 0}
+    pending: List[Dict[str, Any]] = []
+    started = time.perf_counter()
+
+    async def flush():
+        counts["upserted"] += await pool.run(import_ndjson_chunk, table, list(pending))
+        counts["chunks"] += 1
+        pending.clear()
+        logger.info("Import %s: %d rows upserted (%d chunks)", table, counts["upserted"], counts["chunks"])
+
+    try:
+        async for body in request.stream():
+            for row in decoder.feed(body):
+                counts["read"] += 1
+                pending.append(row)
+                if len(pending) >= chunk_size:
+                    await flush()
+        for row in decoder.close():
+            counts["read"] += 1
+            pending.append(row)
+        if pending:
+            await flush()
+    except NdjsonError as exc:
+        raise HTTPException(status_code=400, detail=f"{exc} ({counts['upserted']} rows imported before the error)")
+    return {"table": table, **counts, "seconds": round(time.perf_counter() - started, 3)}
+
+
+@app.get("/admin/profiles")
+def admin_list_profiles(_: str = Depends(require_admin)):
+    return PROFILE_STORE.list()
+
+
+@app.get("/admin/profiles/{profile_id}")
+def admin_get_profile(
+    profile_id: str,
+    format: Optional[str] = Query(None, pattern="^(pstats|text|collapsed)$"),
+    _: str = Depends(require_admin),
+):
+    session = PROFILE_STORE.get(profile_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format is None:
+        return session.summary()
+    if format not in session.summary()["formats"]:
+        raise HTTPException(status_code=400, detail=f"{session.mode} profiles provide: {', '.join(session.summary()['formats'])}")
+    if format == "pstats":
+        return Response(
+            session.pstats_bytes(),
+            media_type="application/octet-stream",
+            headers={"Content-Disposition": f'attachment; filename="{profile_id}.pstats"'},
         )
-    result = ensure_ok(
-        supabase.table("daily_theater_tasks").insert(payloads).execute(),
-        context="admin generate daily tasks",
-    )
-    return result or []
+    body = session.text() if format == "text" else session.collapsed()
+    return PlainTextResponse(body)
+
+
+@app.get("/admin/cache")
+def admin_cache_stats(_: str = Depends(require_admin)):
+    return CACHE.stats()
+
+
+@app.get("/admin/catalog/snapshots")
+def admin_snapshot_stats(_: str = Depends(require_admin)):
+    return SNAPSHOTS.stats() if SNAPSHOTS else {"enabled": False}
+
+
+@app.post("/admin/catalog/snapshots/publish")
+def admin_publish_snapshots(full: bool = Query(False, description="Rebuild every shard"), _: str = Depends(require_admin)):
+    if SNAPSHOTS is None:
+        raise HTTPException(status_code=404, detail="Catalog snapshots are disabled")
+    if full:
+        SNAPSHOTS.mark_all()
+    return SNAPSHOTS.publish(force=True) or SNAPSHOTS.get_manifest()
+
+
+@app.get("/admin/conversations")
+def admin_conversation_stats(_: str = Depends(require_admin)):
+    return {**CONVERSATIONS.snapshot(), "lastFlushError": CONVERSATION_FLUSH_JOB.last_error}
+
+
+@app.get("/admin/memories/search")
+def admin_search_memories(
+    user_id: str = Query(...),
+    role_id: str = Query(...),
+    q: str = Query(..., min_length=1),
+    k: int = Query(10, ge=1, le=100),
+    _: str = Depends(require_admin),
+):
+    if MEMORY is None:
+        raise HTTPException(status_code=503, detail="Memory is disabled (set MEMORY_DIR)")
+    return {"stats": MEMORY.stats(), "memories": MEMORY.recall(user_id, role_id, q, k=k)}
+
+
+@app.get("/admin/rate-limits")
+def admin_rate_limit_stats(_: str = Depends(require_admin)):
+    return RATE_LIMITER.snapshot() if RATE_LIMITER else {"enabled": False}
+
+
+@app.get("/admin/idempotency")
+def admin_idempotency_stats(_: str = Depends(require_admin)):
+    return IDEMPOTENCY.snapshot() if IDEMPOTENCY else {"enabled": False}
+
+
+@app.get("/admin/wan/traces")
+def admin_wan_traces(
+    kind: Optional[str] = Query(None, description="image, video or save"),
+    model: Optional[str] = Query(None),
+    resolution: Optional[str] = Query(None, description="Image size (1280*720) or video resolution (720P)"),
+    status: Optional[str] = Query(None, description="ok or error"),
+    limit: int = Query(50, ge=1, le=1000),
+    _: str = Depends(require_admin),
+):
+    traces = WAN_TRACES.query(kind, model, resolution, status, limit)
+    return {"buffer": WAN_TRACES.stats(), "traces": [trace.to_api() for trace in traces]}
+
+
+@app.get("/admin/wan/traces/summary")
+def admin_wan_trace_summary(
+    kind: Optional[str] = Query(None, description="image, video or save"),
+    model: Optional[str] = Query(None),
+    resolution: Optional[str] = Query(None),
+    _: str = Depends(require_admin),
+):
+    traces = WAN_TRACES.query(kind, model, resolution)
+    return {
+        "buffer": WAN_TRACES.stats(),
+        "pollInterval": WAN_POLL_INTERVAL,
+        "stages": list(STAGES),
+        "groups": WAN_TRACES.summary(traces),
+    }
+
+
+@app.get("/admin/bulkheads")
+def admin_bulkhead_stats(_: str = Depends(require_admin)):
+    return BULKHEADS.snapshot()
 
 
 @app.post("/admin/upload")
@@ -852,11 +2834,12 @@ def admin_upload_asset(file: UploadFile = File(...), _: str = Depends(require_ad
     filename = sanitize_filename(file.filename or "upload")
     path = f"admin/{uuid.uuid4().hex}-{filename}"
     content_type = file.content_type or "application/octet-stream"
-    result = supabase.storage.from_(bucket).upload(
-        path,
-        content,
-        {"content-type": content_type, "x-upsert": "true"},
-    )
+    with timed("storage", "upload"):
+        result = supabase.storage.from_(bucket).upload(
+            path,
+            content,
+            {"content-type": content_type, "x-upsert": "true"},
+        )
     if hasattr(result, "error") and result.error:
         message = getattr(result.error, "message", None) or str(result.error)
         raise HTTPException(status_code=500, detail=f"Upload failed: {message}")
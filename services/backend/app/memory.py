@@ -0,0 +1,328 @@
+"""Long-term role memory: per (user, role) vector shards on disk.
+
+Each shard is a directory of flat files that are memory-mapped with NumPy:
+
+* ``vectors.bin``: one row per memory. With ``int8`` (the default) every row
+  is quantized symmetrically and has its own float32 scale in ``scales.bin``.
+  With ``float16`` rows are stored as they are.
+* ``offsets.bin`` / ``records.bin``: an int64 offset table into
+  concatenated UTF-8 JSON records (text, kind, timestamps, source turn).
+* ``meta.json``: dim, dtype, embedder name and the committed row count. It is
+  rewritten atomically after the data files, so a torn append is ignored.
+
+Several worker processes can share a shard. Appends take an ``flock`` on the
+shard, and readers pick up rows that other processes committed when
+``meta.json`` changes. Reads never create a shard: recalling for a
+(user, role) pair with no memories touches nothing on disk.
+
+Search is exact: a chunked float32 matrix-vector product over all rows, then
+``argpartition`` for the top k. Vectors are L2-normalized, so scores are cosine
+similarities. The embedder is pluggable. ``HashingEmbedder`` is deterministic
+and offline, for tests and benchmarks. ``DashScopeEmbedder`` calls the hosted
+text-embedding model.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .metrics import timed
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process use only
+    fcntl = None
+
+DTYPES = {"int8": np.int8, "float16": np.float16}
+INITIAL_CAPACITY = 256
+SEARCH_CHUNK = 2048  # rows per float32 block; small enough to stay in cache
+_LATIN_RE = re.compile(r"[a-z0-9]+")
+_CJK_RE = re.compile(r"[㐀-鿿豈-﫿]+")
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32, copy=False)
+
+
+class HashingEmbedder:
+    """Feature hashing of Latin words and CJK unigrams/bigrams; deterministic across processes."""
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+        self.name = f"hashing:{dim}"
+
+    def _features(self, text: str) -> Dict[str, float]:
+        counts: Dict[str, float] = {}
+        lowered = (text or "").lower()
+        for word in _LATIN_RE.findall(lowered):
+            counts[word] = counts.get(word, 0.0) + 1.0
+        for run in _CJK_RE.findall(lowered):
+            for index, char in enumerate(run):
+                counts[char] = counts.get(char, 0.0) + 1.0
+                if index + 1 < len(run):
+                    bigram = run[index:index + 2]
+                    counts[bigram] = counts.get(bigram, 0.0) + 1.5
+        return counts
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, count in self._features(text).items():
+                digest = zlib.crc32(feature.encode("utf-8"))
+                out[row, digest % self.dim] += (1.0 + np.log(count)) * (1.0 if digest & 0x80000000 else -1.0)
+        return normalize(out)
+
+
+class DashScopeEmbedder:
+    """OpenAI-compatible embeddings endpoint of DashScope (``text-embedding-v3`` and later)."""
+
+    batch_size = 10
+
+    def __init__(self, api_key: str, endpoint: str, http_client: Callable[[], Any], model: str = "text-embedding-v3", dim: int = 512):
+        self.api_key = api_key
+        self.url = f"{endpoint.rstrip('/')}/compatible-mode/v1/embeddings"
+        self.http_client = http_client
+        self.model = model
+        self.dim = dim
+        self.name = f"dashscope:{model}:{dim}"
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        rows: List[List[float]] = []
+        for start in range(0, len(texts), self.batch_size):
+            payload = {"model": self.model, "input": list(texts[start:start + self.batch_size]), "dimensions": self.dim, "encoding_format": "float"}
+            with timed("dashscope", "embed"):
+                resp = self.http_client().post(self.url, headers={"Authorization": f"Bearer {self.api_key}"}, json=payload, timeout=20.0)
+            if resp.status_code != 200:
+                raise RuntimeError(f"Embedding API error: {resp.status_code} - {resp.text[:300]}")
+            data = sorted(resp.json().get("data") or [], key=lambda item: item.get("index", 0))
+            rows.extend(item["embedding"] for item in data)
+        return normalize(np.asarray(rows, dtype=np.float32).reshape(len(texts), self.dim))
+
+
+class MemoryShard:
+    def __init__(self, path: Path, dim: int, dtype: str, embedder: str):
+        if dtype not in DTYPES:
+            raise ValueError(f"dtype must be one of {sorted(DTYPES)}")
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.dim = dim
+        self.dtype = dtype
+        self.embedder = embedder
+        self.count = 0
+        self.capacity = 0
+        self._meta_mtime = 0
+        self.lock = threading.Lock()
+        meta_path = self.path / "meta.json"
+        with self._process_lock():
+            if meta_path.exists():
+                meta = json.loads(meta_path.read_text("utf-8"))
+                if (meta["dim"], meta["dtype"], meta["embedder"]) != (dim, dtype, embedder):
+                    raise ValueError(f"{self.path} was built with {meta['embedder']}/{meta['dtype']}/{meta['dim']}, not {embedder}/{dtype}/{dim}")
+                self.count = int(meta["count"])
+            else:
+                self._write_meta()
+            (self.path / "records.bin").touch()
+        self._records = open(self.path / "records.bin", "r+b")
+        self._map(max(INITIAL_CAPACITY, self.count))
+
+    def _file(self, name: str, dtype, shape: Tuple[int, ...]) -> np.memmap:
+        file_path = self.path / name
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        with open(file_path, "a+b") as handle:
+            if os.fstat(handle.fileno()).st_size < size:
+                handle.truncate(size)
+        return np.memmap(file_path, dtype=dtype, mode="r+", shape=shape)
+
+    def _map(self, capacity: int) -> None:
+        self.vectors = self._file("vectors.bin", DTYPES[self.dtype], (capacity, self.dim))
+        self.scales = self._file("scales.bin", np.float32, (capacity,)) if self.dtype == "int8" else None
+        self.offsets = self._file("offsets.bin", np.int64, (capacity + 1,))
+        self.capacity = capacity
+
+    def _write_meta(self) -> None:
+        meta = {"dim": self.dim, "dtype": self.dtype, "embedder": self.embedder, "count": self.count}
+        tmp = self.path / f"meta.json.{os.getpid()}.tmp"
+        tmp.write_text(json.dumps(meta), "utf-8")
+        os.replace(tmp, self.path / "meta.json")
+        self._meta_mtime = os.stat(self.path / "meta.json").st_mtime_ns
+
+    def _refresh_locked(self) -> None:
+        """Adopt rows committed by other processes since we last looked."""
+        meta_path = self.path / "meta.json"
+        mtime = os.stat(meta_path).st_mtime_ns
+        if mtime == self._meta_mtime:
+            return
+        count = int(json.loads(meta_path.read_text("utf-8"))["count"])
+        self._meta_mtime = mtime
+        if count > self.capacity:
+            self._map(count)
+        self.count = max(self.count, count)
+
+    def refresh(self) -> int:
+        """Committed row count, including rows other processes appended."""
+        with self.lock:
+            self._refresh_locked()
+            return self.count
+
+    @contextmanager
+    def _process_lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(self.path / "lock", "a") as handle:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+    def append(self, vectors: np.ndarray, records: Sequence[Dict[str, Any]]) -> None:
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        if len(vectors) != len(records):
+            raise ValueError("vectors and records differ in length")
+        if not len(vectors):
+            return
+        with self.lock, self._process_lock():
+            self._refresh_locked()
+            start, end = self.count, self.count + len(vectors)
+            if end > self.capacity:
+                capacity = self.capacity
+                while capacity < end:
+                    capacity *= 2
+                self.flush()
+                self._map(capacity)
+            if self.dtype == "int8":
+                scales = np.abs(vectors).max(axis=1) / 127.0
+                scales[scales == 0] = 1.0
+                self.vectors[start:end] = np.round(vectors / scales[:, None]).astype(np.int8)
+                self.scales[start:end] = scales
+            else:
+                self.vectors[start:end] = vectors.astype(np.float16)
+            blobs = [json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8") for record in records]
+            base = int(self.offsets[start])
+            self._records.seek(base)
+            self._records.truncate(base)  # drop bytes of an append that never committed
+            self._records.write(b"".join(blobs))
+            self._records.flush()
+            self.offsets[start + 1:end + 1] = base + np.cumsum([len(blob) for blob in blobs])
+            self.count = end
+            self.flush()
+            self._write_meta()
+
+    def flush(self) -> None:
+        for mapped in (self.vectors, self.scales, self.offsets):
+            if mapped is not None:
+                mapped.flush()
+
+    def search(self, query: np.ndarray, k: int) -> List[Tuple[float, int]]:
+        query = np.asarray(query, dtype=np.float32).reshape(self.dim)
+        with self.lock:
+            self._refresh_locked()
+            count = self.count
+            if count == 0 or k <= 0:
+                return []
+            scores = np.empty(count, dtype=np.float32)
+            for start in range(0, count, SEARCH_CHUNK):
+                end = min(start + SEARCH_CHUNK, count)
+                scores[start:end] = self.vectors[start:end].astype(np.float32) @ query
+                if self.scales is not None:
+                    scores[start:end] *= self.scales[start:end]
+        k = min(k, count)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[index]), int(index)) for index in top]
+
+    def record(self, index: int) -> Dict[str, Any]:
+        with self.lock:
+            start, end = int(self.offsets[index]), int(self.offsets[index + 1])
+            self._records.seek(start)
+            blob = self._records.read(end - start)
+        return json.loads(blob)
+
+    def close(self) -> None:
+        with self.lock:
+            self.flush()
+            self._records.close()
+            self.vectors = self.scales = self.offsets = None
+
+
+def _path_part(value: str) -> str:
+    safe = re.sub(r"[^A-Za-z0-9_-]", "_", value)[:48]
+    return f"{safe}-{hashlib.sha1(value.encode('utf-8')).hexdigest()[:10]}"
+
+
+class MemoryIndex:
+    """Opens shards on demand under ``root/<user>/<role>``, keeping at most ``max_open`` mapped."""
+
+    def __init__(self, root: str, embedder, dtype: str = "int8", max_open: int = 128):
+        self.root = Path(root)
+        self.embedder = embedder
+        self.dtype = dtype
+        self.max_open = max_open
+        self._shards: "OrderedDict[Tuple[str, str], MemoryShard]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def shard(self, user_id: str, role_id: str, create: bool = True) -> Optional[MemoryShard]:
+        """The open shard for (user, role); with ``create=False``, None if nothing was ever stored for it."""
+        key = (user_id, role_id)
+        path = self.root / _path_part(user_id) / _path_part(role_id)
+        with self._lock:
+            shard = self._shards.get(key)
+            if shard is not None:
+                self._shards.move_to_end(key)
+                return shard
+            if not create and not (path / "meta.json").exists():
+                return None
+            shard = MemoryShard(path, self.embedder.dim, self.dtype, self.embedder.name)
+            self._shards[key] = shard
+            while len(self._shards) > self.max_open:
+                # Not closed: a request may still hold it; the maps go when the last reference does.
+                _, evicted = self._shards.popitem(last=False)
+                evicted.flush()
+            return shard
+
+    def remember(self, user_id: str, role_id: str, texts: Sequence[str], kind: str = "turn", extra: Optional[Dict[str, Any]] = None) -> int:
+        texts = [text.strip() for text in texts if text and text.strip()]
+        if not texts:
+            return 0
+        vectors = self.embedder.embed(texts)
+        now = time.time()
+        records = [{"text": text, "kind": kind, "at": now, **(extra or {})} for text in texts]
+        self.shard(user_id, role_id).append(vectors, records)
+        return len(texts)
+
+    def recall(self, user_id: str, role_id: str, query: str, k: int = 4, min_score: float = 0.0) -> List[Dict[str, Any]]:
+        if not (query or "").strip():
+            return []
+        # user_id comes from clients: reading must not create directories for unseen pairs.
+        shard = self.shard(user_id, role_id, create=False)
+        if shard is None or shard.refresh() == 0:
+            return []
+        vector = self.embedder.embed([query])[0]
+        hits = []
+        for score, index in shard.search(vector, k):
+            if score < min_score:
+                break
+            hits.append({**shard.record(index), "score": round(score, 4)})
+        return hits
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            shards = list(self._shards.values())
+        return {
+            "embedder": self.embedder.name,
+            "dtype": self.dtype,
+            "openShards": len(shards),
+            "openMemories": sum(shard.count for shard in shards),
+        }
@@ -0,0 +1,225 @@
+"""In-process metrics: latency histograms, Prometheus text output and Server-Timing.
+
+``MetricsMiddleware`` times every HTTP request by route template and status,
+and opens a per-request segment table in a context variable. ``timed()`` blocks
+around upstream calls (Supabase, DashScope, storage) add to that table. The
+table is copied into the thread that runs a sync handler, so those calls are
+counted too. When the response starts, the table becomes a ``Server-Timing``
+header. The header lists each upstream segment, ``app`` (the remainder, i.e.
+our own CPU and waits) and ``total``.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = len(self.buckets)
+        for position, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = position
+                break
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0.0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def count(self, *labels: str) -> int:
+        series = self._series.get(labels)
+        return int(sum(series[:-1])) if series else 0
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = [(labels, list(series)) for labels, series in self._series.items()]
+        for labels, series in items:
+            cumulative = 0.0
+            for bound, hits in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += hits
+                le = f'le="{_number(bound)}"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {_number(cumulative)}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(series[-1])}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {_number(cumulative)}"
+
+
+class Gauge:
+    """Read at scrape time from ``collect()``, which returns (label values, value) pairs."""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str], collect: Callable[[], Iterable[Tuple[Sequence[str], float]]]):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} gauge"
+        for labels, value in self.collect():
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def _register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def gauge(self, name: str, help_text: str, labelnames: Sequence[str], collect) -> Gauge:
+        return self._register(Gauge(name, help_text, labelnames, collect))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        lines.append("")
+        return "\n".join(lines)
+
+
+REGISTRY = MetricsRegistry()
+REQUEST_SECONDS = REGISTRY.histogram(
+    "wondera_http_request_duration_seconds",
+    "HTTP request latency by route template and status.",
+    ("method", "route", "status"),
+)
+UPSTREAM_SECONDS = REGISTRY.histogram(
+    "wondera_upstream_duration_seconds",
+    "Latency of calls to upstream services.",
+    ("upstream", "op"),
+)
+UPSTREAM_ERRORS = REGISTRY.counter(
+    "wondera_upstream_errors_total",
+    "Upstream calls that raised.",
+    ("upstream", "op"),
+)
+
+# upstream -> [seconds, calls] for the request being served
+_SEGMENTS: ContextVar[Optional[Dict[str, List[float]]]] = ContextVar("wondera_request_segments", default=None)
+
+
+@contextmanager
+def timed(upstream: str, op: str = ""):
+    started = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        UPSTREAM_SECONDS.observe(elapsed, upstream, op)
+        if failed:
+            UPSTREAM_ERRORS.inc(1.0, upstream, op)
+        segments = _SEGMENTS.get()
+        if segments is not None:
+            entry = segments.setdefault(upstream, [0.0, 0])
+            entry[0] += elapsed
+            entry[1] += 1
+
+
+def server_timing(segments: Dict[str, List[float]], total: float) -> str:
+    parts = []
+    upstream_total = 0.0
+    for name, (seconds, calls) in segments.items():
+        upstream_total += seconds
+        parts.append(f'{name};dur={seconds * 1000:.1f};desc="{int(calls)} call{"s" if calls != 1 else ""}"')
+    parts.append(f"app;dur={max(total - upstream_total, 0.0) * 1000:.1f}")
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, so streaming responses are timed to their last byte."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        segments: Dict[str, List[float]] = {}
+        token = _SEGMENTS.set(segments)
+        started = time.perf_counter()
+        status = [500]
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                header = server_timing(segments, time.perf_counter() - started)
+                message["headers"] = list(message.get("headers") or []) + [(b"server-timing", header.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _SEGMENTS.reset(token)
+            # The router stores the matched route in the scope; unmatched paths share one label.
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            REQUEST_SECONDS.observe(time.perf_counter() - started, scope.get("method", ""), route, str(status[0]))
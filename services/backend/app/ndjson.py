@@ -0,0 +1,142 @@
+"""Streaming NDJSON export/import for catalog tables.
+
+Reads are keyset-paged (``id > last_id``), so every page costs the same no
+matter how deep into the table it is. Imports parse line by line and upsert in
+fixed-size chunks. Memory is bounded by one page or chunk, never the table.
+Shared by the admin endpoints and ``seed/ndjson_io.py``.
+"""
+import json
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+# Tables that may be exported/imported, with their keyset/conflict column.
+NDJSON_TABLES = {
+    "roles": "id",
+    "explore_items": "id",
+    "daily_theater_templates": "id",
+}
+DEFAULT_PAGE_SIZE = 1000
+DEFAULT_CHUNK_SIZE = 500
+MAX_LINE_BYTES = 4 * 1024 * 1024
+
+
+class NdjsonError(ValueError):
+    def __init__(self, message: str, line: int):
+        super().__init__(f"line {line}: {message}")
+        self.line = line
+
+
+def iter_table_rows(client, table: str, page_size: int = DEFAULT_PAGE_SIZE, columns: str = "*") -> Iterator[Dict[str, Any]]:
+    """Yield every row of ``table`` ordered by its key, one keyset page at a time."""
+    key = NDJSON_TABLES.get(table, "id")
+    last = None
+    while True:
+        query = client.table(table).select(columns).order(key, desc=False).limit(page_size)
+        if last is not None:
+            query = query.gt(key, last)
+        page = query.execute().data or []
+        yield from page
+        if len(page) < page_size:
+            return
+        last = page[-1][key]
+
+
+def encode_rows(rows: Iterable[Dict[str, Any]], batch_size: int = 100) -> Iterator[bytes]:
+    """Serialize rows as NDJSON, emitting one bytes chunk per ``batch_size`` rows."""
+    lines: List[str] = []
+    for row in rows:
+        lines.append(json.dumps(row, ensure_ascii=False, separators=(",", ":"), default=str))
+        if len(lines) >= batch_size:
+            lines.append("")
+            yield "\n".join(lines).encode("utf-8")
+            lines = []
+    if lines:
+        lines.append("")
+        yield "\n".join(lines).encode("utf-8")
+
+
+class NdjsonDecoder:
+    """Incremental decoder: feed arbitrary byte chunks, get back complete rows."""
+
+    def __init__(self, table: str, max_line_bytes: int = MAX_LINE_BYTES):
+        self.key = NDJSON_TABLES.get(table, "id")
+        self.max_line_bytes = max_line_bytes
+        self.line = 0
+        self._pending = bytearray()
+
+    def _parse(self, raw: bytes) -> Optional[Dict[str, Any]]:
+        self.line += 1
+        raw = raw.strip()
+        if not raw:
+            return None
+        try:
+            row = json.loads(raw)
+        except ValueError as exc:
+            raise NdjsonError(f"invalid JSON ({exc})", self.line) from None
+        if not isinstance(row, dict):
+            raise NdjsonError("expected a JSON object", self.line)
+        if not row.get(self.key):
+            raise NdjsonError(f"missing {self.key!r}", self.line)
+        return row
+
+    def feed(self, chunk: bytes) -> List[Dict[str, Any]]:
+        rows = []
+        self._pending += chunk
+        start = 0
+        while True:
+            end = self._pending.find(b"\n", start)
+            if end < 0:
+                break
+            row = self._parse(bytes(self._pending[start:end]))
+            if row is not None:
+                rows.append(row)
+            start = end + 1
+        del self._pending[:start]
+        if len(self._pending) > self.max_line_bytes:
+            raise NdjsonError(f"line longer than {self.max_line_bytes} bytes", self.line + 1)
+        return rows
+
+    def close(self) -> List[Dict[str, Any]]:
+        row = self._parse(bytes(self._pending)) if self._pending else None
+        self._pending.clear()
+        return [row] if row is not None else []
+
+
+def iter_ndjson(table: str, chunks: Iterable[bytes], max_line_bytes: int = MAX_LINE_BYTES) -> Iterator[Dict[str, Any]]:
+    decoder = NdjsonDecoder(table, max_line_bytes)
+    for chunk in chunks:
+        yield from decoder.feed(chunk)
+    yield from decoder.close()
+
+
+def upsert_chunk(client, table: str, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    key = NDJSON_TABLES.get(table, "id")
+    return client.table(table).upsert(rows, on_conflict=key).execute().data or []
+
+
+def import_rows(
+    client,
+    table: str,
+    rows: Iterable[Dict[str, Any]],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    on_chunk: Optional[Callable[[List[Dict[str, Any]], Dict[str, int]], None]] = None,
+) -> Dict[str, int]:
+    """Upsert ``rows`` in chunks; ``on_chunk(written, counts)`` runs after each one."""
+    counts = {"read": 0, "upserted": 0, "chunks": 0}
+    chunk: List[Dict[str, Any]] = []
+
+    def flush():
+        written = upsert_chunk(client, table, chunk)
+        counts["upserted"] += len(chunk)
+        counts["chunks"] += 1
+        if on_chunk:
+            on_chunk(written, counts)
+        chunk.clear()
+
+    for row in rows:
+        counts["read"] += 1
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk:
+        flush()
+    return counts
@@ -0,0 +1,124 @@
+"""Optional direct-Postgres access for the hot read paths.
+
+Handlers stay synchronous: the asyncpg pool lives on its own event loop in a
+daemon thread and callers block on ``run_coroutine_threadsafe``. asyncpg keeps
+a per-connection cache of server-side prepared statements keyed by SQL text;
+every new pool connection runs the hot queries once so the first real request
+does not pay for parsing and planning.
+"""
+import asyncio
+import json
+import threading
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+HOT_QUERIES = {
+    "role_by_id": "select * from public.roles where id = $1",
+    "explore_page": "select * from public.explore_items order by created_at desc limit $1 offset $2",
+    "explore_page_by_type": "select * from public.explore_items where type = $1 order by created_at desc limit $2 offset $3",
+    "daily_tasks_by_day": "select * from public.daily_theater_tasks where day_key = $1",
+}
+
+_WARM_ARGS = {
+    "role_by_id": ("",),
+    "explore_page": (0, 0),
+    "explore_page_by_type": ("post", 0, 0),
+    "daily_tasks_by_day": (date(1970, 1, 1),),
+}
+
+
+def _jsonable(value: Any) -> Any:
+    # Match the shapes PostgREST returns so API mappers see identical rows.
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, UUID):
+        return str(value)
+    return value
+
+
+def record_to_dict(record) -> Dict[str, Any]:
+    return {key: _jsonable(value) for key, value in record.items()}
+
+
+class PostgresGateway:
+    def __init__(
+        self,
+        dsn: str,
+        min_size: int = 2,
+        max_size: int = 10,
+        statement_cache_size: int = 100,
+        timeout: float = 10.0,
+    ):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.statement_cache_size = statement_cache_size
+        self.timeout = timeout
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pool = None
+
+    def start(self) -> "PostgresGateway":
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever, name="pg-gateway", daemon=True)
+        thread.start()
+        self._loop = loop
+        try:
+            self._pool = self._run(self._create_pool())
+        except Exception:
+            loop.call_soon_threadsafe(loop.stop)
+            raise
+        return self
+
+    async def _create_pool(self):
+        import asyncpg
+
+        return await asyncpg.create_pool(
+            self.dsn,
+            min_size=self.min_size,
+            max_size=self.max_size,
+            statement_cache_size=self.statement_cache_size,
+            command_timeout=self.timeout,
+            init=self._init_connection,
+        )
+
+    async def _init_connection(self, conn) -> None:
+        for type_name in ("json", "jsonb"):
+            await conn.set_type_codec(type_name, encoder=json.dumps, decoder=json.loads, schema="pg_catalog")
+        if self.statement_cache_size:
+            for name, sql in HOT_QUERIES.items():
+                await conn.fetch(sql, *_WARM_ARGS[name])
+
+    def _run(self, coro):
+        if self._loop is None:
+            raise RuntimeError("PostgresGateway is not started")
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result(self.timeout)
+
+    async def _fetch(self, name: str, *args) -> List[Dict[str, Any]]:
+        async with self._pool.acquire() as conn:
+            records = await conn.fetch(HOT_QUERIES[name], *args)
+        return [record_to_dict(record) for record in records]
+
+    def fetch(self, name: str, *args) -> List[Dict[str, Any]]:
+        return self._run(self._fetch(name, *args))
+
+    def role_by_id(self, role_id: str) -> Optional[Dict[str, Any]]:
+        rows = self.fetch("role_by_id", role_id)
+        return rows[0] if rows else None
+
+    def explore_page(self, item_type: Optional[str], limit: int, offset: int) -> List[Dict[str, Any]]:
+        if item_type:
+            return self.fetch("explore_page_by_type", item_type, limit, offset)
+        return self.fetch("explore_page", limit, offset)
+
+    def daily_tasks_by_day(self, day_key: str) -> List[Dict[str, Any]]:
+        return self.fetch("daily_tasks_by_day", date.fromisoformat(day_key))
+
+    def close(self) -> None:
+        if self._loop is None:
+            return
+        if self._pool is not None:
+            self._run(self._pool.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loop = None
+        self._pool = None
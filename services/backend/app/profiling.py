@@ -0,0 +1,280 @@
+"""Opt-in per-request profiling.
+
+An admin request asks for a profile with ``X-Profile: cprofile|sample`` (or
+``?_profile=...``). There are two modes:
+
+* ``cprofile``: deterministic. The sync handler runs under ``cProfile`` in its
+  bulkhead worker thread. That covers role mapping, upstream waits and anything
+  else the handler body calls. Artifacts are pstats dumps and a text summary.
+* ``sample``: a shared sampler thread snapshots the event-loop thread and the
+  handler's worker thread every few milliseconds. This also covers request
+  validation and response encoding. The loop thread is shared, so concurrent
+  requests can appear in the samples. Artifacts are collapsed stacks, ready for
+  flamegraph.pl or speedscope.
+
+Finished sessions go into a ``ProfileStore`` that keeps the slowest N.
+"""
+import collections
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional
+
+MODES = ("cprofile", "sample")
+_ACTIVE: ContextVar[Optional["ProfileSession"]] = ContextVar("wondera_profile_session", default=None)
+
+
+def active_session() -> Optional["ProfileSession"]:
+    return _ACTIVE.get()
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class ProfileSession:
+    def __init__(self, mode: str, method: str, path: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.mode = mode
+        self.method = method
+        self.path = path
+        self.route: Optional[str] = None
+        self.status: Optional[int] = None
+        self.duration = 0.0
+        self.created_at = time.time()
+        self.threads: Dict[int, int] = {}  # thread ident -> refcount
+        self.samples: collections.Counter = collections.Counter()
+        self.sample_count = 0
+        self.stats: Optional[pstats.Stats] = None
+        self._lock = threading.Lock()
+
+    def add_thread(self, ident: int) -> None:
+        with self._lock:
+            self.threads[ident] = self.threads.get(ident, 0) + 1
+
+    def remove_thread(self, ident: int) -> None:
+        with self._lock:
+            remaining = self.threads.get(ident, 0) - 1
+            if remaining > 0:
+                self.threads[ident] = remaining
+            else:
+                self.threads.pop(ident, None)
+
+    def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run a handler in the current (worker) thread under this session's profiler."""
+        if self.mode == "cprofile":
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Python 3.12+ allows one cProfile per interpreter; a concurrent request runs unprofiled.
+                return func(*args, **kwargs)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profiler.disable()
+                with self._lock:
+                    if self.stats is None:
+                        self.stats = pstats.Stats(profiler)
+                    else:
+                        self.stats.add(profiler)
+        ident = threading.get_ident()
+        self.add_thread(ident)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.remove_thread(ident)
+
+    def sample(self, frames: Dict[int, Any]) -> None:
+        with self._lock:
+            idents = list(self.threads)
+        for ident in idents:
+            frame = frames.get(ident)
+            stack: List[str] = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            if stack:
+                stack.reverse()
+                self.samples[";".join(stack)] += 1
+                self.sample_count += 1
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "mode": self.mode,
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "status": self.status,
+            "durationMs": round(self.duration * 1000, 2),
+            "samples": self.sample_count,
+            "createdAt": self.created_at,
+            "formats": ["pstats", "text"] if self.mode == "cprofile" else ["collapsed"],
+        }
+
+    def pstats_bytes(self) -> bytes:
+        # Same layout as Stats.dump_stats, so `python -m pstats <file>` and snakeviz can read it.
+        return marshal.dumps(self.stats.stats) if self.stats else b""
+
+    def text(self, limit: int = 40) -> str:
+        if self.stats is None:
+            return ""
+        stream = io.StringIO()
+        stats = pstats.Stats(stream=stream)
+        stats.add(self.stats)
+        stats.sort_stats("cumulative").print_stats(limit)
+        return stream.getvalue()
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+class StackSampler:
+    """One daemon thread samples every attached session; it sleeps while none are attached."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._sessions: List[ProfileSession] = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def attach(self, session: ProfileSession) -> None:
+        with self._lock:
+            self._sessions.append(session)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="profile-sampler", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def detach(self, session: ProfileSession) -> None:
+        with self._lock:
+            if session in self._sessions:
+                self._sessions.remove(session)
+
+    def _loop(self) -> None:
+        while True:
+            with self._lock:
+                sessions = list(self._sessions)
+            if not sessions:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            frames = sys._current_frames()
+            for session in sessions:
+                session.sample(frames)
+            del frames
+            time.sleep(self.interval)
+
+
+class ProfileStore:
+    """Keeps the slowest ``capacity`` finished sessions."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._sessions: Dict[str, ProfileSession] = {}
+        self._lock = threading.Lock()
+
+    def add(self, session: ProfileSession) -> None:
+        if self.capacity <= 0:
+            return
+        with self._lock:
+            if len(self._sessions) >= self.capacity:
+                fastest = min(self._sessions.values(), key=lambda item: item.duration)
+                if fastest.duration >= session.duration:
+                    return
+                self._sessions.pop(fastest.id)
+            self._sessions[session.id] = session
+
+    def get(self, session_id: str) -> Optional[ProfileSession]:
+        return self._sessions.get(session_id)
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            sessions = sorted(self._sessions.values(), key=lambda item: item.duration, reverse=True)
+        return [session.summary() for session in sessions]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._sessions.clear()
+
+
+def _requested_mode(scope) -> Optional[str]:
+    value = None
+    for name, raw in scope.get("headers") or []:
+        if name == b"x-profile":
+            value = raw.decode("latin-1")
+            break
+    if value is None and b"_profile=" in scope.get("query_string", b""):
+        for pair in scope["query_string"].decode("latin-1").split("&"):
+            key, _, raw = pair.partition("=")
+            if key == "_profile":
+                value = raw
+                break
+    if value is None:
+        return None
+    value = value.strip().lower()
+    if value in MODES:
+        return value
+    return "cprofile" if value in ("1", "true", "yes") else None
+
+
+class ProfilingMiddleware:
+    """Starts a session for admin requests that ask for one, or for a random ``sample_rate`` share of traffic."""
+
+    def __init__(self, app, store: ProfileStore, sampler: StackSampler, is_admin: Callable[[Optional[str]], bool], sample_rate: float = 0.0):
+        self.app = app
+        self.store = store
+        self.sampler = sampler
+        self.is_admin = is_admin
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        mode = _requested_mode(scope)
+        if mode is not None:
+            authorization = next((raw.decode("latin-1") for name, raw in scope.get("headers") or [] if name == b"authorization"), None)
+            if not self.is_admin(authorization):
+                mode = None
+        if mode is None and self.sample_rate > 0 and random.random() < self.sample_rate:
+            mode = "sample"
+        if mode is None:
+            await self.app(scope, receive, send)
+            return
+
+        session = ProfileSession(mode, scope.get("method", ""), scope.get("path", ""))
+        token = _ACTIVE.set(session)
+        loop_thread = threading.get_ident()
+        if mode == "sample":
+            session.add_thread(loop_thread)
+            self.sampler.attach(session)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                session.status = message["status"]
+                message["headers"] = list(message.get("headers") or []) + [(b"x-profile-id", session.id.encode("latin-1"))]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            session.duration = time.perf_counter() - started
+            _ACTIVE.reset(token)
+            if mode == "sample":
+                self.sampler.detach(session)
+                session.remove_thread(loop_thread)
+            session.route = getattr(scope.get("route"), "path", None)
+            self.store.add(session)
@@ -0,0 +1,210 @@
+"""Precomputed, incrementally maintained ranking for the explore feed.
+
+The base score is ``log1p(weighted stats) + decay * created_at``. Subtracting
+``decay * now`` from every item would give an exponentially decayed score, but
+it shifts all items equally, so the order is time-invariant and an item only
+needs rescoring when its own stats change.
+"""
+import bisect
+import heapq
+import math
+import threading
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_STAT_WEIGHTS = {"likes": 1.0, "collects": 3.0, "comments": 2.0, "shares": 3.0, "views": 0.05}
+FEED_TYPES = ("all", "post", "world")
+_EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def parse_timestamp(value: Any) -> float:
+    """Seconds since the ranking epoch for an ISO timestamp (0 when missing)."""
+    if not value:
+        return 0.0
+    if isinstance(value, datetime):
+        moment = value
+    else:
+        try:
+            moment = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+        except ValueError:
+            return 0.0
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return (moment - _EPOCH).total_seconds()
+
+
+class _Entry:
+    __slots__ = ("score", "type", "tags", "target_role_id", "recommended_roles", "payload")
+
+    def __init__(self, score: float, row: Dict[str, Any], payload: Dict[str, Any]):
+        self.score = score
+        self.type = row.get("type")
+        self.tags = frozenset(row.get("tags") or [])
+        self.target_role_id = row.get("target_role_id")
+        self.recommended_roles = frozenset(row.get("recommended_roles") or [])
+        self.payload = payload
+
+
+class FeedRanker:
+    """Keeps a top-K list per feed type and serves ranked pages from memory.
+
+    ``to_payload`` turns a DB row into the API payload stored with the entry,
+    so serving a page is a slice and never touches the database.
+    """
+
+    def __init__(
+        self,
+        to_payload: Callable[[Dict[str, Any]], Dict[str, Any]],
+        top_k: int = 1000,
+        half_life_hours: float = 72.0,
+        stat_weights: Optional[Dict[str, float]] = None,
+        target_boost: float = 2.0,
+        recommended_boost: float = 1.0,
+        tag_boost: float = 1.5,
+    ):
+        self.to_payload = to_payload
+        self.top_k = top_k
+        self.decay = math.log(2) / (half_life_hours * 3600.0)
+        self.stat_weights = stat_weights or DEFAULT_STAT_WEIGHTS
+        self.target_boost = target_boost
+        self.recommended_boost = recommended_boost
+        self.tag_boost = tag_boost
+        self._lock = threading.RLock()
+        self._entries: Dict[str, _Entry] = {}
+        self._role_tags: Dict[str, frozenset] = {}
+        self._top: Dict[str, List[Tuple[float, str]]] = {feed: [] for feed in FEED_TYPES}
+        self._sizes: Dict[str, int] = {feed: 0 for feed in FEED_TYPES}
+        self._dirty = set(FEED_TYPES)
+        self.ready = False
+
+    def score(self, row: Dict[str, Any]) -> float:
+        stats = row.get("stats") or {}
+        engagement = 0.0
+        for key, weight in self.stat_weights.items():
+            try:
+                engagement += weight * max(float(stats.get(key) or 0), 0.0)
+            except (TypeError, ValueError):
+                continue
+        return math.log1p(engagement) + self.decay * parse_timestamp(row.get("created_at"))
+
+    def _feeds_for(self, entry: _Entry) -> Tuple[str, ...]:
+        return ("all", entry.type) if entry.type in FEED_TYPES else ("all",)
+
+    def _drop_locked(self, item_id: str) -> Dict[str, Tuple[float, str]]:
+        """Remove an entry; returns the cut (last key) of each full top-K list it was taken out of."""
+        entry = self._entries.pop(item_id, None)
+        cuts: Dict[str, Tuple[float, str]] = {}
+        if entry is None:
+            return cuts
+        for feed in self._feeds_for(entry):
+            self._sizes[feed] -= 1
+            if feed in self._dirty:
+                continue
+            ranked = self._top[feed]
+            position = bisect.bisect_left(ranked, (-entry.score, item_id))
+            if position < len(ranked) and ranked[position][1] == item_id:
+                if len(ranked) >= self.top_k:
+                    cuts[feed] = ranked[-1]
+                del ranked[position]
+        return cuts
+
+    def _add_locked(self, item_id: str, entry: _Entry, cuts: Optional[Dict[str, Tuple[float, str]]] = None) -> None:
+        self._entries[item_id] = entry
+        for feed in self._feeds_for(entry):
+            self._sizes[feed] += 1
+            if feed in self._dirty:
+                continue
+            ranked = self._top[feed]
+            key = (-entry.score, item_id)
+            cut = (cuts or {}).get(feed)
+            if cut is not None and key > cut:
+                # It fell below the old cut; an entry outside the list may outrank it now.
+                continue
+            if len(ranked) < self.top_k:
+                bisect.insort(ranked, key)
+            elif key < ranked[-1]:
+                bisect.insort(ranked, key)
+                ranked.pop()
+
+    def _settle_locked(self) -> None:
+        for feed in FEED_TYPES:
+            if feed not in self._dirty and len(self._top[feed]) < min(self.top_k, self._sizes[feed]):
+                # The list lost a member and entries below the cut exist; one of them moves up, refill lazily.
+                self._dirty.add(feed)
+
+    def _refresh_locked(self, feed: str) -> List[Tuple[float, str]]:
+        if feed in self._dirty:
+            candidates = (
+                (-entry.score, item_id)
+                for item_id, entry in self._entries.items()
+                if feed == "all" or entry.type == feed
+            )
+            self._top[feed] = heapq.nsmallest(self.top_k, candidates)
+            self._dirty.discard(feed)
+        return self._top[feed]
+
+    def upsert(self, row: Dict[str, Any]) -> None:
+        item_id = row.get("id")
+        if not item_id:
+            return
+        entry = _Entry(self.score(row), row, self.to_payload(row))
+        with self._lock:
+            self._add_locked(item_id, entry, self._drop_locked(item_id))
+            self._settle_locked()
+
+    def remove(self, item_id: str) -> None:
+        with self._lock:
+            self._drop_locked(item_id)
+            self._settle_locked()
+
+    def set_role_tags(self, role_id: str, tags: Optional[Iterable[str]]) -> None:
+        with self._lock:
+            if tags is None:
+                self._role_tags.pop(role_id, None)
+            else:
+                self._role_tags[role_id] = frozenset(tags)
+
+    def replace_all(self, rows: Iterable[Dict[str, Any]], roles: Iterable[Dict[str, Any]]) -> None:
+        entries = {}
+        for row in rows:
+            if row.get("id"):
+                entries[row["id"]] = _Entry(self.score(row), row, self.to_payload(row))
+        role_tags = {role["id"]: frozenset(role.get("tags") or []) for role in roles if role.get("id")}
+        with self._lock:
+            self._entries = entries
+            self._role_tags = role_tags
+            self._top = {feed: [] for feed in FEED_TYPES}
+            self._sizes = {feed: sum(1 for entry in entries.values() if feed in self._feeds_for(entry)) for feed in FEED_TYPES}
+            self._dirty = set(FEED_TYPES)
+            for feed in FEED_TYPES:
+                self._refresh_locked(feed)
+            self.ready = True
+
+    def _affinity(self, entry: _Entry, role_id: str, role_tags: frozenset) -> float:
+        boost = 0.0
+        if entry.target_role_id == role_id:
+            boost += self.target_boost
+        elif role_id in entry.recommended_roles:
+            boost += self.recommended_boost
+        if role_tags and entry.tags:
+            boost += self.tag_boost * len(entry.tags & role_tags) / len(entry.tags | role_tags)
+        return boost
+
+    def page(self, feed: str = "all", limit: int = 20, offset: int = 0, role_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Ranked page for a feed; ``role_id`` re-ranks the top-K by tag/role affinity."""
+        with self._lock:
+            ranked = self._refresh_locked(feed)
+            if offset + limit > len(ranked) and len(ranked) >= self.top_k:
+                # Deep pages fall outside the precomputed cut; rank them on demand.
+                ranked = sorted(
+                    (-entry.score, item_id)
+                    for item_id, entry in self._entries.items()
+                    if feed == "all" or entry.type == feed
+                )
+            if role_id:
+                role_tags = self._role_tags.get(role_id, frozenset())
+                ranked = sorted(
+                    ranked,
+                    key=lambda pair: (pair[0] - self._affinity(self._entries[pair[1]], role_id, role_tags), pair[1]),
+                )
+            return [self._entries[item_id].payload for _, item_id in ranked[offset : offset + limit]]
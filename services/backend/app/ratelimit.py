@@ -0,0 +1,335 @@
+"""Per-client rate limits and quotas for the AI endpoints.
+
+A ``RateLimiter`` holds one or more rules and charges each request a cost in
+units. The cost depends on the endpoint: a video costs far more than a chat
+turn. There are two kinds of rule:
+
+* ``TokenBucket(capacity, refill_rate)`` allows bursts of up to ``capacity``
+  units and refills ``refill_rate`` units per second.
+* ``SlidingWindow(limit, period)`` allows ``limit`` units in any ``period``
+  seconds. It is a sliding-window counter: the previous fixed window is
+  weighted by how much of it still overlaps the sliding one, so it needs O(1)
+  state per client.
+
+A request passes only if every rule has room. Units are then taken from all of
+them at once, and a denied request consumes nothing. ``MemoryBackend`` keeps
+state in process, and ``RedisBackend`` shares it between workers with one Lua
+script call per request. Redis errors fail open: the request is allowed and
+the error is logged.
+"""
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+logger = logging.getLogger("wondera")
+
+
+class TokenBucket:
+    kind = "bucket"
+
+    def __init__(self, capacity: float, refill_rate: float):
+        if capacity <= 0 or refill_rate <= 0:
+            raise ValueError("Token bucket capacity and refill rate must be positive")
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.limit = capacity
+        self.name = f"bucket:{capacity:g}:{refill_rate:g}"
+
+    def params(self) -> Tuple[float, float]:
+        return self.capacity, self.refill_rate
+
+
+class SlidingWindow:
+    kind = "window"
+
+    def __init__(self, limit: float, period: float):
+        if limit <= 0 or period <= 0:
+            raise ValueError("Sliding window limit and period must be positive")
+        self.limit = limit
+        self.period = period
+        self.name = f"window:{limit:g}:{period:g}"
+
+    def params(self) -> Tuple[float, float]:
+        return self.limit, self.period
+
+
+Rule = Union[TokenBucket, SlidingWindow]
+
+
+def _take(kind: str, a: float, b: float, state: Optional[List[float]], now: float, cost: float):
+    """One rule's step -> (fits, new state, remaining after taking, remaining now, reset after, retry after).
+
+    Mirrors ``_TAKE_SCRIPT``; the two must stay in step.
+    """
+    if kind == "bucket":
+        capacity, rate = a, b
+        tokens, updated = (state[0], state[1]) if state else (capacity, now)
+        tokens = min(capacity, tokens + max(0.0, now - updated) * rate)
+        fits = tokens >= cost
+        after = tokens - cost if fits else tokens
+        retry = 0.0 if fits else (cost - tokens) / rate
+        return fits, [after, now, 0.0], after, tokens, (capacity - after) / rate, retry
+    limit, period = a, b
+    index = math.floor(now / period)
+    window, current, previous = (state[0], state[1], state[2]) if state else (index, 0.0, 0.0)
+    if index == window + 1:
+        previous, current = current, 0.0
+    elif index > window + 1:
+        previous, current = 0.0, 0.0
+    elapsed = now / period - index
+    used = previous * (1 - elapsed) + current
+    fits = used + cost <= limit
+    if fits:
+        retry = 0.0
+    elif current + cost <= limit and previous > 0:
+        # Wait for enough of the previous window to slide out.
+        retry = (1 - (limit - current - cost) / previous - elapsed) * period
+    elif current > 0:
+        # Wait for the next window, then for enough of this one to slide out.
+        retry = (1 - elapsed) * period + max(0.0, 1 - (limit - cost) / current) * period
+    else:
+        retry = (1 - elapsed) * period
+    after = limit - used - cost if fits else limit - used
+    return fits, [index, current + cost if fits else current, previous], after, limit - used, (1 - elapsed) * period, max(retry, 0.0)
+
+
+class Decision:
+    __slots__ = ("allowed", "cost", "limit", "remaining", "reset_after", "retry_after")
+
+    def __init__(self, allowed: bool, cost: float, limit: float, remaining: float, reset_after: float, retry_after: float):
+        self.allowed = allowed
+        self.cost = cost
+        self.limit = limit
+        self.remaining = remaining
+        self.reset_after = reset_after
+        self.retry_after = retry_after
+
+    def headers(self) -> Dict[str, str]:
+        headers = {
+            "X-RateLimit-Limit": f"{self.limit:g}",
+            "X-RateLimit-Remaining": str(max(int(self.remaining), 0)),
+            "X-RateLimit-Reset": str(math.ceil(self.reset_after)),
+            "X-RateLimit-Cost": f"{self.cost:g}",
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(max(math.ceil(self.retry_after), 1))
+        return headers
+
+
+def _decide(results: Sequence[tuple], limits: Sequence[float], cost: float) -> Decision:
+    """Combine per-rule (fits, remaining after, remaining now, reset, retry); headers report the tightest rule."""
+    allowed = all(result[0] for result in results)
+    if not allowed:
+        retry = max(result[4] for result in results if not result[0])
+    else:
+        retry = 0.0
+    remaining = [result[1] if allowed else result[2] for result in results]
+    tightest = min(range(len(results)), key=lambda index: remaining[index])
+    return Decision(allowed, cost, limits[tightest], remaining[tightest], results[tightest][3], retry)
+
+
+class MemoryBackend:
+    """State per (client, rule) in an LRU map; evicting an idle client only resets it to a full budget."""
+
+    def __init__(self, max_clients: int = 100000):
+        self.max_clients = max_clients
+        self._states: "OrderedDict[str, List[Optional[List[float]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rules: Sequence[Rule], cost: float) -> Decision:
+        now = time.time()
+        with self._lock:
+            states = self._states.get(key)
+            if states is None:
+                states = self._states[key] = [None] * len(rules)
+                if len(self._states) > self.max_clients:
+                    self._states.popitem(last=False)
+            else:
+                self._states.move_to_end(key)
+            steps = [_take(rule.kind, *rule.params(), states[index], now, cost) for index, rule in enumerate(rules)]
+            if all(step[0] for step in steps):
+                for index, step in enumerate(steps):
+                    states[index] = step[1]
+        return _decide([(step[0], step[2], step[3], step[4], step[5]) for step in steps], [rule.limit for rule in rules], cost)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._states.clear()
+
+
+# KEYS: one hash per rule. ARGV: cost, then kind, a, b per rule.
+# Returns allowed, then remaining-after, remaining-now, reset and retry per rule, all in milli-units/ms
+# (Lua numbers become integers on the way back to the client).
+_TAKE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local cost = tonumber(ARGV[1])
+local all_fit = true
+local out = {}
+local writes = {}
+for i, key in ipairs(KEYS) do
+  local kind = ARGV[i * 3 - 1]
+  local a = tonumber(ARGV[i * 3])
+  local b = tonumber(ARGV[i * 3 + 1])
+  local s = redis.call('HMGET', key, 'x', 'y', 'z')
+  local fits, after, before, reset, retry, x, y, z, ttl
+  if kind == 'bucket' then
+    local tokens = tonumber(s[1]) or a
+    local updated = tonumber(s[2]) or now
+    tokens = math.min(a, tokens + math.max(0, now - updated) * b)
+    fits = tokens >= cost
+    if fits then after = tokens - cost; retry = 0 else after = tokens; retry = (cost - tokens) / b end
+    before = tokens
+    reset = (a - after) / b
+    x, y, z = after, now, 0
+    ttl = math.floor(a / b) + 1
+  else
+    local index = math.floor(now / b)
+    local window = tonumber(s[1]) or index
+    local current = tonumber(s[2]) or 0
+    local previous = tonumber(s[3]) or 0
+    if index == window + 1 then previous = current; current = 0
+    elseif index > window + 1 then previous = 0; current = 0 end
+    local elapsed = now / b - index
+    local used = previous * (1 - elapsed) + current
+    fits = used + cost <= a
+    if fits then retry = 0
+    elseif current + cost <= a and previous > 0 then retry = (1 - (a - current - cost) / previous - elapsed) * b
+    elseif current > 0 then retry = (1 - elapsed) * b + math.max(0, 1 - (a - cost) / current) * b
+    else retry = (1 - elapsed) * b end
+    if fits then after = a - used - cost; x, y, z = index, current + cost, previous
+    else after = a - used end
+    before = a - used
+    reset = (1 - elapsed) * b
+    ttl = math.floor(b * 2) + 1
+  end
+  if not fits then all_fit = false end
+  out[#out + 1] = fits and 1 or 0
+  out[#out + 1] = math.floor(after * 1000)
+  out[#out + 1] = math.floor(before * 1000)
+  out[#out + 1] = math.ceil(reset * 1000)
+  out[#out + 1] = math.ceil(math.max(retry, 0) * 1000)
+  writes[i] = {x, y, z, ttl}
+end
+if all_fit then
+  for i, key in ipairs(KEYS) do
+    local w = writes[i]
+    redis.call('HSET', key, 'x', w[1], 'y', w[2], 'z', w[3])
+    redis.call('EXPIRE', key, w[4])
+  end
+end
+return out
+"""
+
+
+class RedisBackend:
+    def __init__(self, client, namespace: str = "wondera:ratelimit", retry_after: float = 5.0):
+        self.client = client
+        self.namespace = namespace
+        self.retry_after = retry_after
+        self._script = client.register_script(_TAKE_SCRIPT)
+        self._down_until = 0.0
+
+    def take(self, key: str, rules: Sequence[Rule], cost: float) -> Optional[Decision]:
+        """None when Redis is unavailable; the caller lets the request through."""
+        if time.monotonic() < self._down_until:
+            return None
+        args: List[float] = [cost]
+        for rule in rules:
+            args.extend((rule.kind, *rule.params()))
+        try:
+            raw = self._script(keys=[f"{self.namespace}:{key}:{rule.name}" for rule in rules], args=args)
+        except Exception as exc:
+            self._down_until = time.monotonic() + self.retry_after
+            logger.warning("Rate limiter Redis unavailable for %.0fs, allowing requests: %s", self.retry_after, exc)
+            return None
+        values = [int(value) for value in raw]
+        results = []
+        for offset in range(0, len(values), 5):
+            fits, after, before, reset, retry = values[offset:offset + 5]
+            results.append((bool(fits), after / 1000, before / 1000, reset / 1000, retry / 1000))
+        return _decide(results, [rule.limit for rule in rules], cost)
+
+
+class RateLimiter:
+    def __init__(self, rules: Sequence[Rule], backend, costs: Dict[str, float]):
+        if not rules:
+            raise ValueError("RateLimiter needs at least one rule")
+        for endpoint, cost in costs.items():
+            for rule in rules:
+                if cost > rule.limit:
+                    raise ValueError(f"Cost {cost:g} of {endpoint} exceeds {rule.name}; it could never be allowed")
+        self.rules = list(rules)
+        self.backend = backend
+        self.costs = dict(costs)
+        self.allowed = 0
+        self.denied = 0
+
+    def cost(self, endpoint: str) -> float:
+        return self.costs.get(endpoint, 1.0)
+
+    def hit(self, client: str, endpoint: str) -> Optional[Decision]:
+        decision = self.backend.take(client, self.rules, self.cost(endpoint))
+        if decision is not None:
+            if decision.allowed:
+                self.allowed += 1
+            else:
+                self.denied += 1
+        return decision
+
+    def snapshot(self) -> Dict[str, object]:
+        return {
+            "backend": type(self.backend).__name__,
+            "rules": [rule.name for rule in self.rules],
+            "costs": self.costs,
+            "allowed": self.allowed,
+            "denied": self.denied,
+        }
+
+
+def parse_pair(raw: str, name: str) -> Optional[Tuple[float, float]]:
+    """``"60:1"`` -> (60.0, 1.0); empty disables the rule."""
+    raw = (raw or "").strip()
+    if not raw:
+        return None
+    first, sep, second = raw.partition(":")
+    try:
+        if not sep:
+            raise ValueError
+        return float(first), float(second)
+    except ValueError:
+        raise ValueError(f"{name} must look like <amount>:<number>, got {raw!r}") from None
+
+
+def parse_costs(raw: str) -> Dict[str, float]:
+    """``"chat:1,image:5"`` -> {"chat": 1.0, "image": 5.0}."""
+    costs: Dict[str, float] = {}
+    for part in (raw or "").split(","):
+        name, _, value = part.strip().partition(":")
+        if name.strip():
+            costs[name.strip()] = float(value)
+    return costs
+
+
+def build_rate_limiter(bucket: str, window: str, costs: str, backend: str, redis_url: Optional[str]) -> Optional[RateLimiter]:
+    rules: List[Rule] = []
+    pair = parse_pair(bucket, "RATE_LIMIT_BUCKET")
+    if pair:
+        rules.append(TokenBucket(*pair))
+    pair = parse_pair(window, "RATE_LIMIT_WINDOW")
+    if pair:
+        rules.append(SlidingWindow(*pair))
+    if not rules:
+        return None
+    backend = (backend or "memory").strip().lower()
+    if backend == "redis" and redis_url:
+        import redis
+
+        client = redis.Redis.from_url(redis_url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        return RateLimiter(rules, RedisBackend(client), parse_costs(costs))
+    if backend != "memory":
+        logger.warning("RATE_LIMIT_BACKEND=%s needs REDIS_URL; limiting per process", backend)
+    return RateLimiter(rules, MemoryBackend(), parse_costs(costs))
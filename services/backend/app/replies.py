@@ -0,0 +1,89 @@
+"""Reply-length budget for chat completions.
+
+The system prompt asks for short replies, but only request parameters
+actually bind the model. For a budget of N characters:
+
+* ``max_tokens_for`` caps generation a little above N, so the sentence that
+  crosses the budget can still finish;
+* ``trim_reply`` cuts a finished reply back to whole sentences within N. It
+  never cuts mid-sentence and always keeps the first sentence. It also drops
+  the unfinished fragment a ``max_tokens`` stop leaves behind;
+* ``SentenceCutter`` applies the same rule to a streamed reply and reports
+  when the outcome is decided, so the caller can close the upstream stream
+  instead of paying for text that would be trimmed anyway.
+
+Lengths count characters without whitespace, the unit of the prompt's
+"30-80 个汉字" guideline.
+"""
+import math
+import re
+from typing import List
+
+_WHITESPACE = re.compile(r"\s+")
+# A sentence ends after CJK/!? terminators (plus closing quotes), an ASCII period
+# followed by whitespace, or a line break (clients show each line as a bubble).
+_BOUNDARY = re.compile(r"(?:[。！？!?…～~]+|\.(?=\s))[\"'”’」』）)]*|\n+")
+
+
+def reply_length(content: str) -> int:
+    """Characters in a reply, not counting whitespace."""
+    return len(_WHITESPACE.sub("", content or ""))
+
+
+def max_tokens_for(max_chars: int, tokens_per_char: float = 1.0, headroom: float = 1.5, floor: int = 32) -> int:
+    return max(int(math.ceil(max_chars * tokens_per_char * headroom)), floor)
+
+
+def sentence_ends(text: str, final: bool = True) -> List[int]:
+    """End offsets of complete sentences; with ``final`` a trailing ASCII period also counts."""
+    ends = [match.end() for match in _BOUNDARY.finditer(text)]
+    stripped = text.rstrip()
+    if final and stripped.endswith(".") and (not ends or ends[-1] < len(stripped)):
+        ends.append(len(stripped))
+    return ends
+
+
+def _within(text: str, ends: List[int], max_chars: int) -> str:
+    keep = None
+    for end in ends:
+        if reply_length(text[:end]) > max_chars:
+            break
+        keep = end
+    if keep is None:
+        keep = ends[0]
+    return text[:keep].strip()
+
+
+def trim_reply(text: str, max_chars: int, truncated: bool = False) -> str:
+    """Whole sentences of ``text`` within ``max_chars``; ``truncated`` means the model was cut off by max_tokens."""
+    text = (text or "").strip()
+    ends = sentence_ends(text)
+    if truncated and ends and ends[-1] < len(text):
+        text = text[:ends[-1]].strip()
+    if reply_length(text) <= max_chars or not ends:
+        return text
+    return _within(text, ends, max_chars)
+
+
+class SentenceCutter:
+    """Accumulates streamed deltas; ``feed`` returns True once more text cannot change the result."""
+
+    def __init__(self, max_chars: int):
+        self.max_chars = max_chars
+        self.buffer = ""
+        self.cut = False
+
+    def feed(self, delta: str) -> bool:
+        self.buffer += delta or ""
+        if reply_length(self.buffer) <= self.max_chars:
+            return False
+        # Over budget: the sentence in progress would be trimmed, unless it is the first one.
+        if sentence_ends(self.buffer.strip(), final=False):
+            self.cut = True
+        return self.cut
+
+    def text(self, truncated: bool = False) -> str:
+        if self.cut:
+            text = self.buffer.strip()
+            return _within(text, sentence_ends(text, final=False), self.max_chars)
+        return trim_reply(self.buffer, self.max_chars, truncated)
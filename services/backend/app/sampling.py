@@ -0,0 +1,131 @@
+"""Cached template index and weighted sampler for daily tasks.
+
+Templates are bucketed by difficulty, then by target role. A pick draws a
+difficulty from the configured mix, then a role not yet used that day, then
+probes random templates in that cell while skipping recent repeats. The work
+per pick depends on the number of difficulties and roles, not on catalog size.
+"""
+import random
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+_PROBES = 8
+
+
+def parse_difficulty_mix(value: Optional[str]) -> Dict[str, float]:
+    """Parse "E:1,M:2,H:1" into {"E": 1.0, "M": 2.0, "H": 1.0}."""
+    mix: Dict[str, float] = {}
+    for part in (value or "").split(","):
+        name, _, weight = part.partition(":")
+        if name.strip():
+            try:
+                mix[name.strip()] = max(float(weight or 1), 0.0)
+            except ValueError:
+                continue
+    return mix
+
+
+class TemplateSampler:
+    def __init__(self, difficulty_mix: Optional[Dict[str, float]] = None, default_weight: float = 1.0):
+        self.difficulty_mix = difficulty_mix or {}
+        self.default_weight = default_weight
+        self._lock = threading.Lock()
+        self._templates: Dict[str, Dict[str, Any]] = {}
+        # difficulty -> role -> template ids
+        self._cells: Dict[str, Dict[str, List[str]]] = {}
+        self.loaded_at: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._templates)
+
+    @staticmethod
+    def _cell_key(template: Dict[str, Any]):
+        return template.get("difficulty") or "", template.get("target_role_id") or ""
+
+    def _add_locked(self, template: Dict[str, Any]) -> None:
+        difficulty, role = self._cell_key(template)
+        self._templates[template["id"]] = template
+        self._cells.setdefault(difficulty, {}).setdefault(role, []).append(template["id"])
+
+    def _remove_locked(self, template_id: str) -> None:
+        template = self._templates.pop(template_id, None)
+        if template is None:
+            return
+        difficulty, role = self._cell_key(template)
+        roles = self._cells.get(difficulty, {})
+        ids = roles.get(role, [])
+        if template_id in ids:
+            # Swap-remove keeps deletes O(1) apart from the index lookup.
+            position = ids.index(template_id)
+            ids[position] = ids[-1]
+            ids.pop()
+        if not ids:
+            roles.pop(role, None)
+        if not roles:
+            self._cells.pop(difficulty, None)
+
+    def replace_all(self, templates: Iterable[Dict[str, Any]], loaded_at: Optional[float] = None) -> None:
+        with self._lock:
+            self._templates = {}
+            self._cells = {}
+            for template in templates:
+                if template.get("id"):
+                    self._add_locked(template)
+            self.loaded_at = loaded_at
+
+    def upsert(self, template: Dict[str, Any]) -> None:
+        if not template.get("id"):
+            return
+        with self._lock:
+            self._remove_locked(template["id"])
+            self._add_locked(template)
+
+    def remove(self, template_id: str) -> None:
+        with self._lock:
+            self._remove_locked(template_id)
+
+    def _weight(self, difficulty: str) -> float:
+        return self.difficulty_mix.get(difficulty, self.default_weight)
+
+    def _probe(self, ids: List[str], blocked: Set[str], rng: random.Random) -> Optional[str]:
+        for _ in range(min(_PROBES, len(ids))):
+            candidate = ids[rng.randrange(len(ids))]
+            if candidate not in blocked:
+                return candidate
+        if len(ids) <= _PROBES * 4:
+            # Small cells: an exact pass is as cheap as more probes.
+            free = [candidate for candidate in ids if candidate not in blocked]
+            return rng.choice(free) if free else None
+        return None
+
+    def sample(self, count: int, recent: Optional[Set[str]] = None, rng: Optional[random.Random] = None) -> List[Dict[str, Any]]:
+        """Pick up to ``count`` templates; recent repeats are avoided while enough remain."""
+        rng = rng or random.SystemRandom()
+        picked: List[str] = []
+        with self._lock:
+            for avoid_recent in (True, False):
+                blocked = set(picked) | (set(recent or ()) if avoid_recent else set())
+                used_roles = {self._cell_key(self._templates[template_id])[1] for template_id in picked}
+                exhausted: Set[tuple] = set()
+                while len(picked) < count:
+                    difficulties = [
+                        d
+                        for d, roles in self._cells.items()
+                        if self._weight(d) > 0 and any((d, r) not in exhausted for r in roles)
+                    ]
+                    if not difficulties:
+                        break
+                    difficulty = rng.choices(difficulties, weights=[self._weight(d) for d in difficulties])[0]
+                    roles = [r for r in self._cells[difficulty] if (difficulty, r) not in exhausted]
+                    fresh_roles = [r for r in roles if r not in used_roles] or roles
+                    role = rng.choice(fresh_roles)
+                    choice = self._probe(self._cells[difficulty][role], blocked, rng)
+                    if choice is None:
+                        exhausted.add((difficulty, role))
+                        continue
+                    picked.append(choice)
+                    blocked.add(choice)
+                    used_roles.add(role)
+                if len(picked) >= count:
+                    break
+            return [self._templates[template_id] for template_id in picked]
@@ -0,0 +1,53 @@
+"""Background periodic jobs run on daemon threads inside the API process."""
+import logging
+import threading
+from typing import Callable, Optional
+
+logger = logging.getLogger("wondera")
+
+
+class PeriodicJob:
+    """Calls ``fn`` every ``interval`` seconds until stopped.
+
+    Exceptions are logged and the job keeps running; ``trigger`` wakes the
+    loop early (e.g. right after an admin write).
+    """
+
+    def __init__(self, name: str, interval: float, fn: Callable[[], None], run_immediately: bool = True):
+        self.name = name
+        self.interval = interval
+        self.fn = fn
+        self.run_immediately = run_immediately
+        self.last_error: Optional[str] = None
+        self.runs = 0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "PeriodicJob":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+            self._thread.start()
+        return self
+
+    def trigger(self) -> None:
+        self._wake.set()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+
+    def _loop(self) -> None:
+        if not self.run_immediately:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+        while not self._stop.is_set():
+            try:
+                self.fn()
+                self.last_error = None
+            except Exception as exc:
+                self.last_error = str(exc)
+                logger.exception("Job %s failed", self.name)
+            self.runs += 1
+            self._wake.wait(self.interval)
+            self._wake.clear()
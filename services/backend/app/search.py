@@ -0,0 +1,235 @@
+"""In-process inverted index over roles and explore items.
+
+Latin text is split into lowercase words; CJK runs are indexed as character
+unigrams plus bigrams so that both single-character and phrase queries match
+without a segmenter.
+"""
+import heapq
+import math
+import re
+import threading
+from collections import Counter
+from itertools import chain
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+_TOKEN_RE = re.compile(r"[0-9a-z]+|[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+")
+_CJK_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]")
+
+DocKey = Tuple[str, str]
+
+
+def _is_cjk(chunk: str) -> bool:
+    return bool(_CJK_RE.match(chunk))
+
+
+def tokenize(text: Optional[str], for_query: bool = False) -> List[str]:
+    """Split text into index terms.
+
+    Indexing emits unigrams and bigrams for CJK runs. Queries only need the
+    bigrams (or the unigram for a one-character run), which keeps AND matching
+    close to phrase matching for Chinese.
+    """
+    tokens: List[str] = []
+    for chunk in _TOKEN_RE.findall((text or "").lower()):
+        if not _is_cjk(chunk):
+            tokens.append(chunk)
+            continue
+        if len(chunk) == 1:
+            tokens.append(chunk)
+            continue
+        if not for_query:
+            tokens.extend(chunk)
+        tokens.extend(chunk[i : i + 2] for i in range(len(chunk) - 1))
+    return tokens
+
+
+class _Doc:
+    __slots__ = ("terms", "tags", "filters", "payload")
+
+    def __init__(self, terms: Dict[str, float], tags: Tuple[str, ...], filters: Dict[str, Any], payload: Dict[str, Any]):
+        self.terms = terms
+        self.tags = tags
+        self.filters = filters
+        self.payload = payload
+
+
+class SearchIndex:
+    """Thread-safe inverted index with weighted fields and tag facets.
+
+    Documents are keyed by ``(kind, id)``. ``fields`` maps field name to text;
+    each field contributes its term frequencies multiplied by the field weight.
+    Kinds, filter values and tags keep their own key sets so that narrowing and
+    faceting are set operations rather than per-document Python loops.
+    """
+
+    def __init__(self, field_weights: Optional[Dict[str, float]] = None):
+        self.field_weights = field_weights or {}
+        self._lock = threading.RLock()
+        self._reset()
+        self.ready = False
+
+    def _reset(self) -> None:
+        self._docs: Dict[DocKey, _Doc] = {}
+        self._postings: Dict[str, Dict[DocKey, float]] = {}
+        self._kinds: Dict[str, Set[DocKey]] = {}
+        self._filter_sets: Dict[Tuple[str, Any], Set[DocKey]] = {}
+        self._tag_sets: Dict[str, Set[DocKey]] = {}
+        self._doc_tags: Dict[DocKey, Tuple[str, ...]] = {}
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def _build_doc(
+        self,
+        fields: Dict[str, Any],
+        tags: Iterable[str],
+        filters: Optional[Dict[str, Any]],
+        payload: Dict[str, Any],
+    ) -> _Doc:
+        terms: Dict[str, float] = {}
+        tag_list = tuple(dict.fromkeys(str(tag) for tag in (tags or []) if tag))
+        for name, text in list(fields.items()) + [("tags", " ".join(tag_list))]:
+            weight = self.field_weights.get(name, 1.0)
+            for term, count in Counter(tokenize(text)).items():
+                terms[term] = terms.get(term, 0.0) + weight * (1.0 + math.log(count))
+        return _Doc(terms, tag_list, dict(filters or {}), payload)
+
+    def _remove_locked(self, key: DocKey) -> None:
+        doc = self._docs.pop(key, None)
+        if doc is None:
+            return
+        for term in doc.terms:
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            posting.pop(key, None)
+            if not posting:
+                del self._postings[term]
+        self._discard(self._kinds, key[0], key)
+        for item in doc.filters.items():
+            self._discard(self._filter_sets, item, key)
+        for tag in doc.tags:
+            self._discard(self._tag_sets, tag, key)
+        self._doc_tags.pop(key, None)
+
+    @staticmethod
+    def _discard(sets: Dict[Any, Set[DocKey]], name: Any, key: DocKey) -> None:
+        members = sets.get(name)
+        if members is None:
+            return
+        members.discard(key)
+        if not members:
+            del sets[name]
+
+    def _add_locked(self, key: DocKey, doc: _Doc) -> None:
+        self._docs[key] = doc
+        for term, weight in doc.terms.items():
+            self._postings.setdefault(term, {})[key] = weight
+        self._kinds.setdefault(key[0], set()).add(key)
+        for item in doc.filters.items():
+            self._filter_sets.setdefault(item, set()).add(key)
+        for tag in doc.tags:
+            self._tag_sets.setdefault(tag, set()).add(key)
+        self._doc_tags[key] = doc.tags
+
+    def upsert(
+        self,
+        kind: str,
+        doc_id: str,
+        fields: Dict[str, Any],
+        tags: Iterable[str] = (),
+        filters: Optional[Dict[str, Any]] = None,
+        payload: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        doc = self._build_doc(fields, tags, filters, payload or {})
+        key = (kind, doc_id)
+        with self._lock:
+            self._remove_locked(key)
+            self._add_locked(key, doc)
+
+    def remove(self, kind: str, doc_id: str) -> None:
+        with self._lock:
+            self._remove_locked((kind, doc_id))
+
+    def replace_all(self, docs: Iterable[Tuple[str, str, Dict[str, Any], Iterable[str], Dict[str, Any], Dict[str, Any]]]) -> None:
+        """Rebuild from scratch into a fresh index, then swap it in."""
+        fresh = SearchIndex(self.field_weights)
+        for kind, doc_id, fields, tags, filters, payload in docs:
+            fresh._add_locked((kind, doc_id), fresh._build_doc(fields, tags, filters, payload))
+        with self._lock:
+            self._docs = fresh._docs
+            self._postings = fresh._postings
+            self._kinds = fresh._kinds
+            self._filter_sets = fresh._filter_sets
+            self._tag_sets = fresh._tag_sets
+            self._doc_tags = fresh._doc_tags
+            self.ready = True
+
+    def search(
+        self,
+        query: str,
+        kind: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        limit: int = 20,
+        offset: int = 0,
+        facet_size: int = 20,
+    ) -> Dict[str, Any]:
+        terms = list(dict.fromkeys(tokenize(query, for_query=True)))
+        empty: Dict[str, Any] = {"total": 0, "items": [], "facets": {"tags": {}}}
+        with self._lock:
+            postings: List[Dict[DocKey, float]] = []
+            if terms:
+                for term in terms:
+                    posting = self._postings.get(term)
+                    if not posting:
+                        return empty
+                    postings.append(posting)
+                postings.sort(key=len)
+                matched = set(postings[0])
+                for posting in postings[1:]:
+                    matched &= posting.keys()
+            else:
+                matched = set(self._docs)
+            narrowing: List[Set[DocKey]] = []
+            if kind:
+                narrowing.append(self._kinds.get(kind, set()))
+            for item in (filters or {}).items():
+                if item[1] is not None:
+                    narrowing.append(self._filter_sets.get(item, set()))
+            for tag in tags or []:
+                if tag:
+                    narrowing.append(self._tag_sets.get(tag, set()))
+            for members in sorted(narrowing, key=len):
+                matched &= members
+                if not matched:
+                    return empty
+
+            if len(self._tag_sets) * 4 < len(matched):
+                # Broad queries: a few C-level intersections beat walking every match.
+                overlaps = ((tag, len(members & matched)) for tag, members in self._tag_sets.items())
+                tag_counts = Counter({tag: count for tag, count in overlaps if count})
+            else:
+                tag_counts = Counter(chain.from_iterable(map(self._doc_tags.__getitem__, matched)))
+            wanted = offset + limit
+            if not postings:
+                top = sorted(matched)[:wanted]
+                scores = dict.fromkeys(top, 0.0)
+            elif len(postings) == 1:
+                top = heapq.nlargest(wanted, matched, key=postings[0].__getitem__)
+                scores = {key: postings[0][key] for key in top}
+            else:
+                total_docs = max(len(self._docs), 1)
+                idf = [math.log(1.0 + total_docs / len(posting)) for posting in postings]
+                all_scores = {key: sum(p[key] * w for p, w in zip(postings, idf)) for key in matched}
+                top = heapq.nlargest(wanted, all_scores, key=all_scores.__getitem__)
+                scores = all_scores
+            items = [
+                {"kind": key[0], "id": key[1], "score": round(scores[key], 4), "item": self._docs[key].payload}
+                for key in top[offset:]
+            ]
+        return {
+            "total": len(matched),
+            "items": items,
+            "facets": {"tags": dict(tag_counts.most_common(facet_size))},
+        }
@@ -0,0 +1,176 @@
+"""Versioned static snapshots of the published catalog.
+
+The catalog is split into named shards, such as groups of roles and the first
+explore pages. Each shard is serialized as compact JSON and uploaded under a
+content-hashed name, ``<prefix>/<shard>.<sha256[:16]>.json``. Objects never
+change once written, so a CDN can cache them indefinitely. ``manifest.json``
+lists the current object of every shard. Its ``version`` grows with each
+publish that changes something.
+
+Catalog writes only mark shards dirty. ``publish()`` runs from a periodic job
+and waits until no write has arrived for ``debounce`` seconds, so a batch
+import produces one publish. It rebuilds the dirty shards and uploads only
+those whose hash changed.
+
+The manifest is merged, not overwritten: ``publish()`` reads the stored
+manifest back and keeps other workers' entries for shards it did not rebuild.
+Concurrent publishes from several workers can therefore only collide within a
+window of a few milliseconds.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set
+
+logger = logging.getLogger("wondera")
+
+
+def encode_snapshot(payload: Any) -> bytes:
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"), sort_keys=True, default=str).encode("utf-8")
+
+
+class SnapshotPublisher:
+    def __init__(
+        self,
+        shard_names: Callable[[], List[str]],
+        build: Callable[[Sequence[str]], Dict[str, Any]],
+        upload: Callable[[str, bytes, int], None],
+        download: Callable[[str], Optional[bytes]],
+        public_url: Callable[[str], str],
+        prefix: str = "catalog",
+        debounce: float = 2.0,
+        manifest_ttl: float = 10.0,
+    ):
+        self.shard_names = shard_names
+        self.build = build
+        self.upload = upload
+        self.download = download
+        self.public_url = public_url
+        self.prefix = prefix.strip("/")
+        self.debounce = debounce
+        self.manifest_ttl = manifest_ttl
+        self.manifest: Optional[Dict[str, Any]] = None
+        self.etag: Optional[str] = None
+        self._manifest_checked = 0.0
+        self._dirty: Set[str] = set()
+        self._last_mark = 0.0
+        self._lock = threading.Lock()
+        self._publish_lock = threading.Lock()
+        self._manifest_lock = threading.Lock()
+        self.publishes = 0
+        self.uploads = 0
+        self.last_publish_ms: Optional[float] = None
+
+    @property
+    def manifest_path(self) -> str:
+        return f"{self.prefix}/manifest.json"
+
+    def mark_dirty(self, shards: Iterable[str]) -> None:
+        shards = set(shards)
+        if not shards:
+            return
+        with self._lock:
+            self._dirty |= shards
+            self._last_mark = time.monotonic()
+
+    def mark_all(self) -> None:
+        self.mark_dirty(self.shard_names())
+
+    def publish(self, force: bool = False) -> Optional[Dict[str, Any]]:
+        """Rebuild dirty shards once writes have been quiet for ``debounce`` seconds (or now with ``force``)."""
+        with self._publish_lock:
+            with self._lock:
+                if not self._dirty:
+                    return None
+                if not force and time.monotonic() - self._last_mark < self.debounce:
+                    return None
+                shards, self._dirty = self._dirty, set()
+            try:
+                return self._publish(shards)
+            except Exception:
+                with self._lock:
+                    self._dirty |= shards
+                raise
+
+    def _publish(self, shards: Set[str]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        names = self.shard_names()
+        stored = self._read_manifest() or self.manifest or {"version": 0, "shards": {}}
+        current = {name: entry for name, entry in (stored.get("shards") or {}).items() if name in names}
+        # Shards the stored manifest lacks (first publish, new shard layout) are built too.
+        todo = sorted({name for name in shards if name in names} | {name for name in names if name not in current})
+        payloads = self.build(todo)
+        changed = len(current) != len(stored.get("shards") or {})
+        for name in todo:
+            body = encode_snapshot(payloads.get(name, []))
+            digest = hashlib.sha256(body).hexdigest()[:16]
+            if (current.get(name) or {}).get("hash") == digest:
+                continue
+            path = f"{self.prefix}/{name}.{digest}.json"
+            self.upload(path, body, 31536000)
+            self.uploads += 1
+            payload = payloads.get(name)
+            current[name] = {
+                "url": self.public_url(path),
+                "hash": digest,
+                "bytes": len(body),
+                "count": len(payload) if isinstance(payload, list) else None,
+            }
+            changed = True
+        manifest = stored
+        if changed:
+            manifest = {
+                "version": int(stored.get("version") or 0) + 1,
+                "generatedAt": datetime.now(timezone.utc).isoformat(),
+                "shards": dict(sorted(current.items())),
+            }
+            self.upload(self.manifest_path, encode_snapshot(manifest), int(self.manifest_ttl))
+            self.publishes += 1
+        self._set_manifest(manifest)
+        self.last_publish_ms = round((time.perf_counter() - started) * 1000, 1)
+        if changed:
+            logger.info("Catalog snapshot v%s published (%d shard(s) rebuilt) in %.0f ms", manifest["version"], len(todo), self.last_publish_ms)
+        return manifest
+
+    def _read_manifest(self) -> Optional[Dict[str, Any]]:
+        raw = self.download(self.manifest_path)
+        if not raw:
+            return None
+        try:
+            return json.loads(raw)
+        except ValueError:
+            logger.warning("Ignoring unreadable catalog manifest")
+            return None
+
+    def _set_manifest(self, manifest: Dict[str, Any]) -> None:
+        self.manifest = manifest
+        self.etag = '"%s"' % hashlib.sha256(encode_snapshot(manifest)).hexdigest()[:16]
+        self._manifest_checked = time.monotonic()
+
+    def get_manifest(self) -> Optional[Dict[str, Any]]:
+        """Current manifest; re-read from storage every ``manifest_ttl`` seconds to pick up other workers' publishes."""
+        if self.manifest is not None and time.monotonic() - self._manifest_checked < self.manifest_ttl:
+            return self.manifest
+        with self._manifest_lock:
+            if self.manifest is None or time.monotonic() - self._manifest_checked >= self.manifest_ttl:
+                stored = self._read_manifest()
+                if stored is not None and int(stored.get("version") or 0) >= int((self.manifest or {}).get("version") or 0):
+                    self._set_manifest(stored)
+                else:
+                    self._manifest_checked = time.monotonic()
+        return self.manifest
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            dirty = sorted(self._dirty)
+        return {
+            "version": (self.manifest or {}).get("version"),
+            "shards": len((self.manifest or {}).get("shards") or {}),
+            "dirty": dirty,
+            "publishes": self.publishes,
+            "uploads": self.uploads,
+            "lastPublishMs": self.last_publish_ms,
+        }
@@ -0,0 +1,258 @@
+"""Per-stage traces of Wan generation jobs, kept in a bounded ring buffer.
+
+A Wan request runs through these stages:
+
+* ``submit``: the async task is created;
+* ``queue``: DashScope reports the task as PENDING;
+* ``run``: the task is RUNNING;
+* ``download``: ``save_remote_asset`` fetches the result;
+* ``upload``: the result is stored in Supabase Storage.
+
+``queue`` and ``run`` are measured from our polls, so each boundary is only
+accurate to one poll interval. Each stage records how many polls it took.
+When DashScope returns ``submit_time``, ``scheduled_time`` and ``end_time``,
+the trace also keeps its own exact queue and run times (``upstream``). The gap
+between those and the observed times is the cost of the poll interval.
+
+``TraceBuffer.summary`` groups traces by model and resolution and reports
+percentiles per stage. Those figures set the polling interval, the Wan
+concurrency limits and the quota to ask for.
+"""
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+QUEUED_STATUSES = ("PENDING", "QUEUED", None)
+STAGES = ("submit", "queue", "run", "download", "upload")
+
+
+def _upstream_time(value: Any) -> Optional[datetime]:
+    # DashScope reports task times as "2025-01-08 16:14:44.723" (Beijing time); only differences are used.
+    if not value:
+        return None
+    for fmt in ("%Y-%m-%d %H:%M:%S.%f", "%Y-%m-%d %H:%M:%S"):
+        try:
+            return datetime.strptime(str(value), fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def _ms_between(start: Optional[datetime], end: Optional[datetime]) -> Optional[float]:
+    if start is None or end is None:
+        return None
+    return round((end - start).total_seconds() * 1000, 1)
+
+
+class WanTrace:
+    def __init__(self, kind: str, model: Optional[str], resolution: Optional[str], params: Optional[Dict[str, Any]] = None):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.model = model
+        self.resolution = resolution
+        self.params = params or {}
+        self.task_id: Optional[str] = None
+        self.started_at = datetime.now(timezone.utc)
+        self._started = time.perf_counter()
+        self.total_ms: Optional[float] = None
+        self.stages: List[Dict[str, Any]] = []
+        self.upstream: Dict[str, Optional[float]] = {}
+        self.polls = 0
+        self.status = "running"
+        self.error: Optional[str] = None
+        self._open: Optional[Dict[str, Any]] = None
+
+    def _offset_ms(self, now: Optional[float] = None) -> float:
+        return round(((now or time.perf_counter()) - self._started) * 1000, 1)
+
+    def begin(self, name: str, now: Optional[float] = None) -> Dict[str, Any]:
+        self.end(now)
+        now = now or time.perf_counter()
+        stage = {"name": name, "startMs": self._offset_ms(now), "ms": None, "_t": now}
+        self.stages.append(stage)
+        self._open = stage
+        return stage
+
+    def end(self, now: Optional[float] = None) -> None:
+        stage, self._open = self._open, None
+        if stage is not None:
+            stage["ms"] = round(((now or time.perf_counter()) - stage.pop("_t")) * 1000, 1)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[Dict[str, Any]]:
+        """Time a stage; the yielded dict takes extra fields such as ``bytes``."""
+        stage = self.begin(name)
+        try:
+            yield stage
+        finally:
+            if self._open is stage:
+                self.end()
+
+    def submitted(self, task_id: str) -> None:
+        """Close ``submit`` and start ``queue``: the task waits from now until a poll sees it running."""
+        self.task_id = task_id
+        stage = self.begin("queue")
+        stage["polls"] = 0
+
+    def poll(self, status: Optional[str]) -> None:
+        now = time.perf_counter()
+        self.polls += 1
+        phase = "queue" if status in QUEUED_STATUSES else "run" if status == "RUNNING" else None
+        current = self._open["name"] if self._open is not None else None
+        if phase != current:
+            if phase is None:
+                self.end(now)
+            else:
+                self.begin(phase, now)["polls"] = 0
+        if self._open is not None and "polls" in self._open:
+            self._open["polls"] += 1
+        elif phase is None and self.stages:
+            # The poll that saw the task finish belongs to the stage it ended.
+            self.stages[-1]["polls"] = self.stages[-1].get("polls", 0) + 1
+
+    def upstream_times(self, output: Dict[str, Any]) -> None:
+        submit = _upstream_time(output.get("submit_time"))
+        scheduled = _upstream_time(output.get("scheduled_time"))
+        end = _upstream_time(output.get("end_time"))
+        self.upstream = {"queueMs": _ms_between(submit, scheduled), "runMs": _ms_between(scheduled, end)}
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        self.end()
+        self.total_ms = self._offset_ms()
+        if error is None:
+            self.status = "ok"
+        else:
+            self.status = "error"
+            self.error = str(getattr(error, "detail", None) or error)[:300]
+
+    def stage_ms(self) -> Dict[str, float]:
+        """Total time per stage name (a task can go back from running to queued)."""
+        totals: Dict[str, float] = {}
+        for stage in self.stages:
+            if stage.get("ms") is not None:
+                totals[stage["name"]] = totals.get(stage["name"], 0.0) + stage["ms"]
+        return totals
+
+    def to_api(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "model": self.model,
+            "resolution": self.resolution,
+            "params": self.params,
+            "taskId": self.task_id,
+            "status": self.status,
+            "error": self.error,
+            "startedAt": self.started_at.isoformat(),
+            "totalMs": self.total_ms,
+            "polls": self.polls,
+            "stages": [{key: value for key, value in stage.items() if key != "_t"} for stage in self.stages],
+            "upstream": self.upstream or None,
+        }
+
+
+def _percentile(ordered: List[float], pct: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def _distribution(values: List[float]) -> Optional[Dict[str, float]]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return {
+        "count": len(ordered),
+        "mean": round(sum(ordered) / len(ordered), 1),
+        "p50": _percentile(ordered, 0.5),
+        "p95": _percentile(ordered, 0.95),
+        "max": ordered[-1],
+    }
+
+
+class TraceBuffer:
+    def __init__(self, capacity: int = 500, on_finish: Optional[Callable[[WanTrace], None]] = None):
+        self.capacity = capacity
+        self.on_finish = on_finish
+        self._traces: "deque[WanTrace]" = deque(maxlen=max(capacity, 1))
+        self._lock = threading.Lock()
+        self.recorded = 0
+
+    @contextmanager
+    def record(self, kind: str, model: Optional[str], resolution: Optional[str], **params: Any) -> Iterator[WanTrace]:
+        """Trace one job; it enters the buffer when the block exits, failed or not."""
+        trace = WanTrace(kind, model, resolution, params)
+        try:
+            yield trace
+        except BaseException as exc:
+            trace.finish(exc)
+            self.add(trace)
+            raise
+        trace.finish()
+        self.add(trace)
+
+    def add(self, trace: WanTrace) -> None:
+        if self.on_finish is not None:
+            self.on_finish(trace)
+        if self.capacity <= 0:
+            return
+        with self._lock:
+            self._traces.append(trace)
+            self.recorded += 1
+
+    def query(
+        self,
+        kind: Optional[str] = None,
+        model: Optional[str] = None,
+        resolution: Optional[str] = None,
+        status: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> List[WanTrace]:
+        """Matching traces, newest first."""
+        with self._lock:
+            traces = list(self._traces)
+        matched = [
+            trace
+            for trace in reversed(traces)
+            if (kind is None or trace.kind == kind)
+            and (model is None or trace.model == model)
+            and (resolution is None or trace.resolution == resolution)
+            and (status is None or trace.status == status)
+        ]
+        return matched[:limit] if limit else matched
+
+    @staticmethod
+    def summary(traces: List[WanTrace]) -> List[Dict[str, Any]]:
+        groups: Dict[Tuple[str, str, str], List[WanTrace]] = {}
+        for trace in traces:
+            groups.setdefault((trace.kind, trace.model or "", trace.resolution or ""), []).append(trace)
+        rows = []
+        for (kind, model, resolution), members in sorted(groups.items()):
+            ok = [trace for trace in members if trace.status == "ok"]
+            per_stage = [trace.stage_ms() for trace in ok]
+            stages = {}
+            for name in STAGES:
+                stages[name] = _distribution([totals[name] for totals in per_stage if name in totals])
+            downloads = [stage.get("bytes") for trace in ok for stage in trace.stages if stage["name"] == "download" and stage.get("bytes")]
+            rows.append({
+                "kind": kind,
+                "model": model or None,
+                "resolution": resolution or None,
+                "jobs": len(members),
+                "errors": len(members) - len(ok),
+                "totalMs": _distribution([trace.total_ms for trace in ok if trace.total_ms is not None]),
+                "stages": {name: dist for name, dist in stages.items() if dist is not None},
+                "polls": _distribution([float(trace.polls) for trace in ok if trace.polls]),
+                "upstream": {
+                    "queueMs": _distribution([trace.upstream["queueMs"] for trace in ok if trace.upstream.get("queueMs") is not None]),
+                    "runMs": _distribution([trace.upstream["runMs"] for trace in ok if trace.upstream.get("runMs") is not None]),
+                },
+                "downloadBytes": _distribution([float(size) for size in downloads]),
+            })
+        return rows
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"capacity": self.capacity, "size": len(self._traces), "recorded": self.recorded}
@@ -0,0 +1,76 @@
+"""Startup warm-up phase and the state behind ``/ready``.
+
+Steps run in order on a background thread, so the server accepts connections
+(``/health``) at once while clients, connections and caches fill. Required
+steps are retried with backoff until they succeed. The process reports ready
+only when all of them have. Optional steps run once, and a failure is only
+recorded.
+"""
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger("wondera")
+
+
+class WarmUp:
+    def __init__(self, retry_initial: float = 1.0, retry_max: float = 30.0):
+        self.retry_initial = retry_initial
+        self.retry_max = retry_max
+        self._steps: List[Dict[str, Any]] = []
+        self._thread: Optional[threading.Thread] = None
+        self._started_at: Optional[float] = None
+        self._finished_at: Optional[float] = None
+
+    def step(self, name: str, fn: Callable[[], Any], required: bool = True) -> None:
+        self._steps.append({"name": name, "fn": fn, "required": required, "state": "pending", "attempts": 0, "ms": None, "error": None})
+
+    @property
+    def ready(self) -> bool:
+        return all(step["state"] == "ok" for step in self._steps if step["required"])
+
+    def start(self) -> "WarmUp":
+        if self._thread is None:
+            self._started_at = time.monotonic()
+            self._thread = threading.Thread(target=self._run, name="warm-up", daemon=True)
+            self._thread.start()
+        return self
+
+    def _attempt(self, step: Dict[str, Any]) -> bool:
+        step["attempts"] += 1
+        started = time.perf_counter()
+        try:
+            step["fn"]()
+        except Exception as exc:
+            step["state"] = "failed"
+            step["error"] = str(exc)[:300]
+            logger.warning("Warm-up step %s failed (attempt %d): %s", step["name"], step["attempts"], exc)
+            return False
+        finally:
+            step["ms"] = round((time.perf_counter() - started) * 1000, 1)
+        step["state"] = "ok"
+        step["error"] = None
+        return True
+
+    def _run(self) -> None:
+        for step in self._steps:
+            delay = self.retry_initial
+            while not self._attempt(step) and step["required"]:
+                time.sleep(delay)
+                delay = min(delay * 2, self.retry_max)
+        self._finished_at = time.monotonic()
+        logger.info("Warm-up finished in %.0f ms", (self._finished_at - self._started_at) * 1000)
+
+    def snapshot(self) -> Dict[str, Any]:
+        elapsed = None
+        if self._started_at is not None:
+            elapsed = round(((self._finished_at or time.monotonic()) - self._started_at) * 1000, 1)
+        return {
+            "ready": self.ready,
+            "warmUpMs": elapsed,
+            "steps": {
+                step["name"]: {key: step[key] for key in ("state", "required", "attempts", "ms", "error")}
+                for step in self._steps
+            },
+        }
@@ -0,0 +1,68 @@
+"""
+seeds.js 擷取基準測試：以真實 seeds.js 的角色物件為範本，複製成數千個角色，量測單趟掃描的耗時。
+在 services/backend 執行：python bench/bench_extract_roles.py [--roles 5000] [--repeat 3]
+"""
+import argparse
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "seed"))
+
+from extract_mobile_roles import MOBILE_SEEDS, ROLE_SEEDS_RE, JsLiteralScanner, extract_roles  # noqa: E402
+
+
+def role_blocks(content: str):
+    """回傳 roleSeeds 裡每個角色物件的原始文字（沿用掃描器取得邊界）。"""
+    scanner = JsLiteralScanner(content, ROLE_SEEDS_RE.search(content).end())
+    scanner.skip()
+    scanner.pos += 1  # [
+    blocks = []
+    while scanner.skip() == "{":
+        start = scanner.pos
+        scanner.object()
+        blocks.append(content[start : scanner.pos])
+        if scanner.skip() == ",":
+            scanner.pos += 1
+    return blocks
+
+
+def make_seeds(blocks, count: int) -> str:
+    parts = ["export const roleSeeds = [\n"]
+    for i in range(count):
+        block = blocks[i % len(blocks)]
+        # 換掉角色與對話 id，讓每個角色都是唯一的
+        block = re.sub(r"id: '([\w-]+)'", lambda m: f"id: '{m.group(1)}-{i}'", block)
+        parts.append("  ")
+        parts.append(block)
+        parts.append(",\n")
+    parts.append("];\n")
+    return "".join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--roles", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    blocks = role_blocks(MOBILE_SEEDS.read_text(encoding="utf-8"))
+    for count in args.roles:
+        content = make_seeds(blocks, count)
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            roles = extract_roles(content)
+            timings.append(time.perf_counter() - started)
+        assert len(roles) == count, (len(roles), count)
+        best = min(timings)
+        size_mb = len(content.encode("utf-8")) / 1e6
+        print(
+            f"{count:>6} roles ({size_mb:.1f} MB): best={best * 1000:.0f}ms "
+            f"({size_mb / best:.1f} MB/s, {count / best:,.0f} roles/s)"
+        )
+
+
+if __name__ == "__main__":
+    main()
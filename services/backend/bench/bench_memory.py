@@ -0,0 +1,102 @@
+"""
+角色長期記憶基準測試：在單一 (user, role) 分片寫入 10⁵–10⁶ 筆合成向量，量測寫入速度、檢索延遲、
+量化後 recall@k（以 float32 精確結果為準）與磁碟佔用；另量測本地雜湊嵌入器的吞吐量。
+在 services/backend 執行：python bench/bench_memory.py [--sizes 100000 1000000] [--dtypes int8 float16] [--dim 512]
+"""
+import argparse
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.memory import HashingEmbedder, MemoryShard, normalize  # noqa: E402
+
+CHUNK = 50_000
+WORDS = ["咖啡", "下雨", "周末", "电影", "猫", "加班", "旅行", "火锅", "考试", "生日", "walk", "music", "London", "coffee", "exam", "movie"]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def clustered(rng: np.random.Generator, centers: np.ndarray, count: int) -> np.ndarray:
+    picks = rng.integers(0, len(centers), size=count)
+    return normalize(centers[picks] + 0.6 * rng.standard_normal((count, centers.shape[1])).astype(np.float32))
+
+
+def run(size: int, dtype: str, dim: int, queries: int, k: int, seed: int):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((2000, dim)).astype(np.float32)
+    query_vectors = clustered(rng, centers, queries)
+    truth_scores = np.full((queries, k), -np.inf, dtype=np.float32)
+    truth_ids = np.zeros((queries, k), dtype=np.int64)
+    workdir = Path(tempfile.mkdtemp(prefix="wondera-memory-"))
+    try:
+        shard = MemoryShard(workdir, dim, dtype, f"bench:{dim}")
+        ingest = 0.0
+        for start in range(0, size, CHUNK):
+            vectors = clustered(rng, centers, min(CHUNK, size - start))
+            # Exact float32 top-k, merged chunk by chunk.
+            scores = query_vectors @ vectors.T
+            merged_scores = np.concatenate([truth_scores, scores], axis=1)
+            merged_ids = np.concatenate([truth_ids, np.broadcast_to(np.arange(start, start + len(vectors)), scores.shape)], axis=1)
+            order = np.argsort(-merged_scores, axis=1)[:, :k]
+            truth_scores = np.take_along_axis(merged_scores, order, axis=1)
+            truth_ids = np.take_along_axis(merged_ids, order, axis=1)
+            records = [{"i": start + offset} for offset in range(len(vectors))]
+            began = time.perf_counter()
+            shard.append(vectors, records)
+            ingest += time.perf_counter() - began
+
+        latencies, recalls = [], []
+        for index, query in enumerate(query_vectors):
+            began = time.perf_counter()
+            hits = shard.search(query, k)
+            latencies.append((time.perf_counter() - began) * 1000)
+            recalls.append(len({hit for _, hit in hits} & set(truth_ids[index].tolist())) / k)
+        disk = sum(path.stat().st_size for path in workdir.iterdir()) / 1e6
+        print(
+            f"{size:>8} {dtype:>7}: ingest {size / ingest:,.0f} rows/s, disk {disk:.0f} MB, "
+            f"search p50={statistics.median(latencies):.1f}ms p95={percentile(latencies, 0.95):.1f}ms, "
+            f"recall@{k}={statistics.fmean(recalls):.3f}"
+        )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_embedder(dim: int, count: int, seed: int):
+    rng = random.Random(seed)
+    texts = ["".join(rng.choice(WORDS) for _ in range(12)) for _ in range(count)]
+    embedder = HashingEmbedder(dim)
+    began = time.perf_counter()
+    embedder.embed(texts)
+    elapsed = time.perf_counter() - began
+    print(f"hashing embedder: {count / elapsed:,.0f} texts/s ({elapsed * 1e6 / count:.0f} µs/text)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--dtypes", nargs="+", default=["int8", "float16"])
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    bench_embedder(args.dim, 5000, args.seed)
+    for size in args.sizes:
+        for dtype in args.dtypes:
+            run(size, dtype, args.dim, args.queries, args.k, args.seed)
+
+
+if __name__ == "__main__":
+    main()
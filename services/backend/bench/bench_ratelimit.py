@@ -0,0 +1,70 @@
+"""
+限流器基準測試：量測每次判定的延遲（目標記憶體後端 < 50 µs）。
+在 services/backend 執行：python bench/bench_ratelimit.py [--clients 10000] [--calls 200000] [--redis redis://localhost:6379/0]
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.ratelimit import MemoryBackend, RateLimiter, RedisBackend, SlidingWindow, TokenBucket  # noqa: E402
+
+COSTS = {"chat": 1, "image": 5, "video": 20, "save": 2}
+ENDPOINTS = ["chat"] * 90 + ["image"] * 6 + ["save"] * 3 + ["video"]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def run(label: str, limiter: RateLimiter, clients: int, calls: int, rng: random.Random):
+    keys = [f"ip:10.0.{i // 256}.{i % 256}" for i in range(clients)]
+    plan = [(rng.choice(keys), rng.choice(ENDPOINTS)) for _ in range(calls)]
+    latencies = []
+    denied = 0
+    started = time.perf_counter()
+    for key, endpoint in plan:
+        before = time.perf_counter()
+        decision = limiter.hit(key, endpoint)
+        latencies.append((time.perf_counter() - before) * 1e6)
+        if decision is not None and not decision.allowed:
+            denied += 1
+    elapsed = time.perf_counter() - started
+    print(
+        f"{label:>22}: p50={statistics.median(latencies):.1f}µs p99={percentile(latencies, 0.99):.1f}µs "
+        f"mean={statistics.fmean(latencies):.1f}µs ({calls / elapsed:.0f} calls/s, {denied} denied)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=10_000)
+    parser.add_argument("--calls", type=int, default=200_000)
+    parser.add_argument("--redis", default=None, help="Also benchmark the Redis backend at this URL")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    rule_sets = (
+        ("bucket", [TokenBucket(60, 0.5)]),
+        ("bucket+window", [TokenBucket(60, 0.5), SlidingWindow(1000, 86400)]),
+    )
+    for label, rules in rule_sets:
+        run(f"memory {label}", RateLimiter(rules, MemoryBackend(), COSTS), args.clients, args.calls, rng)
+    if args.redis:
+        import redis
+
+        client = redis.Redis.from_url(args.redis)
+        for label, rules in rule_sets:
+            client.delete(*client.keys("wondera:bench:*") or ["wondera:bench:none"])
+            backend = RedisBackend(client, namespace="wondera:bench")
+            run(f"redis {label}", RateLimiter(rules, backend, COSTS), args.clients, min(args.calls, 20_000), rng)
+
+
+if __name__ == "__main__":
+    main()
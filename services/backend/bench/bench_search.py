@@ -0,0 +1,84 @@
+"""
+搜尋索引基準測試：建立 10 萬筆合成探索內容與角色，量測建索引時間與查詢延遲。
+在 services/backend 執行：python bench/bench_search.py [--items 100000] [--queries 500]
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.search import SearchIndex  # noqa: E402
+
+CJK_WORDS = ["北京", "大学", "篮球", "咖啡", "夜市", "伦敦", "塔桥", "威尼斯", "运河", "雨天", "散步", "图书馆", "约会", "旅行", "美食", "校园", "电影", "音乐", "海边", "日落"]
+LATIN_WORDS = ["walk", "river", "winter", "market", "night", "tower", "bridge", "canal", "coffee", "library", "study", "music", "sunset", "travel", "food", "campus"]
+CITIES = ["Beijing", "London", "Venice", "Shanghai", "Paris", "Tokyo", "上海", "杭州"]
+TAGS = ["walk", "river", "winter", "food", "romance", "study", "sports", "night", "art", "music", "旅行", "美食", "校园", "夜景"]
+
+
+def make_docs(count: int, rng: random.Random):
+    for i in range(count):
+        title = "".join(rng.sample(CJK_WORDS, 2)) + " " + " ".join(rng.sample(LATIN_WORDS, 2))
+        summary = "，".join(rng.sample(CJK_WORDS, 4)) + " " + " ".join(rng.sample(LATIN_WORDS, 4))
+        tags = rng.sample(TAGS, 3)
+        kind = "role" if i % 20 == 0 else "explore"
+        fields = {"title": title, "summary": summary, "location": rng.choice(CITIES)}
+        filters = {"visible": True, "type": rng.choice(["post", "world"])}
+        yield kind, f"{kind}-{i}", fields, tags, filters, {"id": f"{kind}-{i}", "title": title}
+
+
+def make_queries(count: int, rng: random.Random):
+    queries = []
+    for _ in range(count):
+        shape = rng.random()
+        if shape < 0.4:
+            queries.append(rng.choice(CJK_WORDS))
+        elif shape < 0.7:
+            queries.append(rng.choice(LATIN_WORDS))
+        elif shape < 0.9:
+            queries.append(rng.choice(CJK_WORDS) + rng.choice(CJK_WORDS))
+        else:
+            queries.append(f"{rng.choice(CJK_WORDS)} {rng.choice(LATIN_WORDS)}")
+    return queries
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    index = SearchIndex(field_weights={"title": 3.0, "tags": 2.5, "location": 1.5, "summary": 1.0})
+    started = time.perf_counter()
+    index.replace_all(make_docs(args.items, rng))
+    print(f"build: {len(index)} docs in {time.perf_counter() - started:.2f}s")
+
+    started = time.perf_counter()
+    for i in range(1000):
+        index.upsert("explore", f"explore-{i + 1}", {"title": "更新 updated"}, ["walk"], {"visible": True}, {})
+    print(f"incremental upsert: {(time.perf_counter() - started) * 1000 / 1000:.3f} ms/doc")
+
+    for label, kwargs in (("plain", {}), ("tag filter", {"tags": ["food"]}), ("kind+type", {"kind": "explore", "filters": {"type": "post"}})):
+        latencies = []
+        for query in make_queries(args.queries, rng):
+            started = time.perf_counter()
+            index.search(query, limit=20, **kwargs)
+            latencies.append((time.perf_counter() - started) * 1000)
+        print(
+            f"{label:>10}: p50={statistics.median(latencies):.2f}ms "
+            f"p95={percentile(latencies, 0.95):.2f}ms max={max(latencies):.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,9 @@
 從 apps/mobile/src/data/seeds.js 擷取 roleSeeds 的 persona、greeting、script 等，
 寫出 roles_from_mobile.json 供 seed_supabase 使用。
 在專案根目錄或 services/backend/seed 執行：python extract_mobile_roles.py
+
+seeds.js 只走訪一次：JsLiteralScanner 依位置索引解析物件/陣列/字串常值，
+不切片複製整份檔案，也不需要預先列出角色 id。
 """
 import json
 import re
@@ -10,163 +13,225 @@ from pathlib import Path
 ROOT = Path(__file__).resolve().parents[3]  # repo root (seed -> backend -> services -> repo)
 MOBILE_SEEDS = ROOT / "apps" / "mobile" / "src" / "data" / "seeds.js"
 OUT_JSON = Path(__file__).resolve().parents[0] / "roles_from_mobile.json"
-ROLE_IDS = ["antoine", "edward", "kieran"]
-
-
-def find_template_literal_end(text: str, start: int) -> int:
-    """從 start 開始，找到 persona: ` 之後的結束反引號（未轉義）的位置。"""
-    i = start
-    while i < len(text):
-        if text[i] == "\\":
-            i += 2
-            continue
-        if text[i] == "`":
-            return i
-        i += 1
-    return -1
-
-
-def find_single_quoted_end(text: str, start: int) -> int:
-    """從 start 開始（在開頭 ' 之後），找到結束的單引號（未轉義）。"""
-    i = start
-    while i < len(text):
-        if text[i] == "\\":
-            i += 2
-            continue
-        if text[i] == "'":
-            return i
-        i += 1
-    return -1
-
-
-def extract_script_array(text: str, start: int) -> tuple[list, int]:
-    """從 script: [ 開始，回傳 (script 字串列表, 結束 ] 的下一格索引)。"""
-    bracket = text.index("[", start)
-    depth = 1
-    i = bracket + 1
-    current = ""
-    in_string = None
-    escape = False
-    result = []
-    while i < len(text) and depth > 0:
-        c = text[i]
-        if escape:
-            if in_string == "'":
-                current += c
-            escape = False
-            i += 1
-            continue
-        if c == "\\" and in_string:
-            escape = True
-            if in_string == "'":
-                current += c
-            i += 1
-            continue
-        if in_string == "'":
-            if c == "'":
-                result.append(current)
-                current = ""
-                in_string = None
-            else:
-                current += c
-            i += 1
-            continue
-        if c == "'" and depth == 1:
-            in_string = "'"
-            i += 1
-            continue
-        if c == "[":
-            depth += 1
-            i += 1
-            continue
-        if c == "]":
-            depth -= 1
-            if depth == 0:
-                return result, i + 1
-            i += 1
-            continue
-        i += 1
-    return result, i
-
-
-def extract_one_role(content: str, role_id: str) -> dict | None:
-    """從 seeds.js 內容擷取單一角色的 persona, greeting, script, mood, title, city, description, tags。"""
-    pattern = rf"\bid\s*:\s*['\"]{re.escape(role_id)}['\"]"
-    m = re.search(pattern, content)
-    if not m:
-        return None
-    start = m.start()
-    # 往後找 persona: `
-    persona_m = re.search(r"\bpersona\s*:\s*`", content[start:])
-    if not persona_m:
-        return None
-    persona_start = start + persona_m.end()
-    persona_end = find_template_literal_end(content, persona_start)
-    if persona_end == -1:
-        return None
-    persona = content[persona_start:persona_end]
-
-    # greeting: '...'
-    greeting_m = re.search(r"\bgreeting\s*:\s*'", content[persona_end:])
-    if not greeting_m:
-        greeting = ""
-    else:
-        g_start = persona_end + greeting_m.end()
-        g_end = find_single_quoted_end(content, g_start)
-        greeting = content[g_start:g_end].replace("\\n", "\n").replace("\\'", "'") if g_end != -1 else ""
-
-    # script: [ ... ]
-    script_m = re.search(r"\bscript\s*:\s*\[", content[persona_end:])
-    script = []
-    if script_m:
-        script, _ = extract_script_array(content, persona_end + script_m.start())
-
-    # mood, title, city, description, tags（簡短字串或陣列）
-    def field_re(name: str, kind: str = "str") -> str | list:
-        if kind == "str":
-            pat = rf"\b{re.escape(name)}\s*:\s*['\"]([^'\"]*)['\"]"
+
+ROLE_SEEDS_RE = re.compile(r"\bexport\s+const\s+roleSeeds\s*=\s*")
+# 空白與註解
+_SKIP_RE = re.compile(r"(?:\s+|//[^\n]*|/\*.*?\*/)*", re.DOTALL)
+_IDENT_RE = re.compile(r"[A-Za-z_$][\w$]*")
+_NUMBER_RE = re.compile(r"-?(?:0[xX][0-9a-fA-F]+|(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)")
+# 每種引號只需停在反斜線或結束引號上，其餘整段一次取出
+_STRING_STOP_RE = {quote: re.compile(r"[\\%s]" % quote) for quote in ("'", '"', "`")}
+_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f", "v": "\v", "0": "\0"}
+_KEYWORDS = {"true": True, "false": False, "null": None, "undefined": None}
+_VALUE_END = ",}];"
+
+
+def _number(token: str):
+    if token.lstrip("-")[:2].lower() == "0x":
+        return int(token, 16)
+    if any(char in token for char in ".eE"):
+        return float(token)
+    return int(token)
+
+
+class JsLiteralScanner:
+    """JS 常值的單趟掃描器：物件、陣列、字串、數字、true/false/null。
+
+    無法靜態求值的運算式（如 Date.now() - 1000）會被跳過並回傳 None。
+    """
+
+    def __init__(self, text: str, pos: int = 0):
+        self.text = text
+        self.pos = pos
+
+    def error(self, message: str) -> ValueError:
+        line = self.text.count("\n", 0, self.pos) + 1
+        return ValueError(f"{message} at line {line}")
+
+    def skip(self) -> str:
+        """跳過空白與註解，回傳下一個字元（檔尾為空字串）。"""
+        self.pos = _SKIP_RE.match(self.text, self.pos).end()
+        return self.text[self.pos] if self.pos < len(self.text) else ""
+
+    def value(self):
+        char = self.skip()
+        start = self.pos
+        if char == "{":
+            return self.object()
+        if char == "[":
+            return self.array()
+        if char in _STRING_STOP_RE:
+            result = self.string()
         else:
-            pat = rf"\b{re.escape(name)}\s*:\s*\[(.*?)\]"
-        mm = re.search(pat, content[persona_end:persona_end + 2000], re.DOTALL)
-        if not mm:
-            return "" if kind == "str" else []
-        if kind == "str":
-            return mm.group(1).strip()
-        inner = mm.group(1)
-        tags = re.findall(r"['\"]([^'\"]*)['\"]", inner)
-        return tags
-
-    mood = field_re("mood")
-    title = field_re("title")
-    city = field_re("city")
-    description = field_re("description")
-    tags = field_re("tags", "list")
+            match = _IDENT_RE.match(self.text, self.pos) or _NUMBER_RE.match(self.text, self.pos)
+            if not match:
+                raise self.error(f"Unexpected {char!r}")
+            self.pos = match.end()
+            token = match.group()
+            if token in _KEYWORDS:
+                result = _KEYWORDS[token]
+            elif not _IDENT_RE.match(token):
+                result = _number(token)
+            else:
+                result = None  # 變數參照
+        if self.skip() not in _VALUE_END:
+            # 常值後面還接著運算子/呼叫：整段視為運算式
+            self.pos = start
+            self.skip_expression()
+            return None
+        return result
+
+    def string(self) -> str:
+        text = self.text
+        quote = text[self.pos]
+        stop = _STRING_STOP_RE[quote]
+        parts = []
+        pos = self.pos + 1
+        while True:
+            match = stop.search(text, pos)
+            if match is None:
+                self.pos = pos
+                raise self.error("Unterminated string")
+            parts.append(text[pos:match.start()])
+            if match.group() == quote:
+                self.pos = match.end()
+                return "".join(parts)
+            pos = self._escape(match.end(), parts)
+
+    def _escape(self, pos: int, parts: list) -> int:
+        char = self.text[pos : pos + 1]
+        if char == "u":
+            if self.text[pos + 1 : pos + 2] == "{":
+                end = self.text.index("}", pos)
+                parts.append(chr(int(self.text[pos + 2 : end], 16)))
+                return end + 1
+            parts.append(chr(int(self.text[pos + 1 : pos + 5], 16)))
+            return pos + 5
+        if char == "x":
+            parts.append(chr(int(self.text[pos + 1 : pos + 3], 16)))
+            return pos + 3
+        if char == "\r" and self.text[pos + 1 : pos + 2] == "\n":
+            return pos + 2  # 行接續
+        if char == "\n":
+            return pos + 1
+        parts.append(_ESCAPES.get(char, char))
+        return pos + 1
+
+    def array(self) -> list:
+        self.pos += 1
+        items = []
+        while True:
+            char = self.skip()
+            if char == "]":
+                self.pos += 1
+                return items
+            if not char:
+                raise self.error("Unterminated array")
+            items.append(self.value())
+            if self.skip() == ",":
+                self.pos += 1
+
+    def object(self) -> dict:
+        self.pos += 1
+        result = {}
+        while True:
+            char = self.skip()
+            if char == "}":
+                self.pos += 1
+                return result
+            if not char:
+                raise self.error("Unterminated object")
+            if self.text.startswith("...", self.pos):
+                self.pos += 3
+                self.skip_expression()
+            else:
+                key = self.key()
+                if self.skip() == ":":
+                    self.pos += 1
+                    result[key] = self.value()
+                else:
+                    result[key] = None  # 簡寫屬性 { foo }
+            if self.skip() == ",":
+                self.pos += 1
+
+    def key(self) -> str:
+        char = self.text[self.pos]
+        if char in _STRING_STOP_RE:
+            return self.string()
+        match = _IDENT_RE.match(self.text, self.pos) or _NUMBER_RE.match(self.text, self.pos)
+        if not match:
+            raise self.error(f"Unexpected {char!r} in object key")
+        self.pos = match.end()
+        return match.group()
+
+    def skip_expression(self) -> None:
+        """跳到同層的下一個 , } ] ; 為止，略過其中的括號與字串。"""
+        depth = 0
+        text = self.text
+        while self.pos < len(text):
+            char = self.skip()
+            if not char:
+                return
+            if char in _STRING_STOP_RE:
+                self.string()
+                continue
+            if char in "([{":
+                depth += 1
+            elif char in ")]}":
+                if depth == 0:
+                    return
+                depth -= 1
+            elif char in ",;" and depth == 0:
+                return
+            self.pos += 1
+
+
+def parse_role_seeds(content: str) -> list:
+    """回傳 roleSeeds 陣列裡的所有物件（原樣的 dict）。"""
+    match = ROLE_SEEDS_RE.search(content)
+    if not match:
+        return []
+    seeds = JsLiteralScanner(content, match.end()).value()
+    return [seed for seed in seeds or [] if isinstance(seed, dict) and seed.get("id")]
+
+
+def role_from_seed(seed: dict) -> dict:
+    """取出 seed_supabase 需要的欄位：persona, greeting, script, mood, title, city, description, tags。"""
+
+    def text(name: str) -> str:
+        value = seed.get(name)
+        return value.strip() if isinstance(value, str) else ""
+
+    def strings(name: str) -> list:
+        value = seed.get(name)
+        return [item for item in value if isinstance(item, str)] if isinstance(value, list) else []
 
     return {
-        "id": role_id,
-        "name": {"antoine": "Antoine", "edward": "Edward Whitmore", "kieran": "Kieran Voss"}.get(role_id, role_id),
-        "persona": persona.strip(),
-        "mood": mood,
-        "greeting": greeting,
-        "script": script,
-        "title": title,
-        "city": city,
-        "description": description,
-        "tags": tags,
+        "id": seed["id"],
+        "name": text("name") or seed["id"],
+        "persona": text("persona"),
+        "mood": text("mood"),
+        "greeting": seed.get("greeting") if isinstance(seed.get("greeting"), str) else "",
+        "script": strings("script"),
+        "title": text("title"),
+        "city": text("city"),
+        "description": text("description"),
+        "tags": strings("tags"),
     }
 
 
+def extract_roles(content: str) -> list:
+    return [role_from_seed(seed) for seed in parse_role_seeds(content)]
+
+
 def main():
     if not MOBILE_SEEDS.exists():
         print(f"Not found: {MOBILE_SEEDS}")
         return
     content = MOBILE_SEEDS.read_text(encoding="utf-8")
-    roles = []
-    for rid in ROLE_IDS:
-        r = extract_one_role(content, rid)
-        if r:
-            roles.append(r)
-            print(f"Extracted: {rid} (persona len={len(r['persona'])}, script len={len(r['script'])})")
+    roles = extract_roles(content)
+    for r in roles:
+        print(f"Extracted: {r['id']} (persona len={len(r['persona'])}, script len={len(r['script'])})")
     if not roles:
         print("No roles extracted.")
         return
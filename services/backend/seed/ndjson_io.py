@@ -0,0 +1,123 @@
+"""
+以 NDJSON 串流匯出/匯入目錄資料表（roles、explore_items、daily_theater_templates），用於備份與複製環境。
+記憶體只佔一頁/一批，與表大小無關；進度輸出到 stderr。
+
+    python seed/ndjson_io.py export roles -o roles.ndjson          # 路徑以 .gz 結尾時自動 gzip
+    python seed/ndjson_io.py export explore_items > explore.ndjson
+    python seed/ndjson_io.py import roles roles.ndjson --chunk-size 1000
+    cat explore.ndjson | python seed/ndjson_io.py import explore_items -
+
+直接寫入 Supabase；若 API 正在執行，之後呼叫 /admin/import 或重啟 API 才會更新記憶體中的索引。
+"""
+import argparse
+import gzip
+import os
+import sys
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+from supabase import create_client
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+# 從 backend 目錄載入 .env
+load_dotenv(ROOT / ".env")
+
+from app.ndjson import DEFAULT_CHUNK_SIZE, DEFAULT_PAGE_SIZE, NDJSON_TABLES, NdjsonError, encode_rows, import_rows, iter_ndjson, iter_table_rows  # noqa: E402
+
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY") or os.getenv("SUPABASE_ANON_KEY")
+READ_BLOCK = 1 << 20
+
+
+def progress(message: str):
+    print(message, file=sys.stderr, flush=True)
+
+
+def open_output(path: str):
+    if path == "-":
+        return sys.stdout.buffer
+    return gzip.open(path, "wb") if path.endswith(".gz") else open(path, "wb")
+
+
+def open_input(path: str):
+    if path == "-":
+        return sys.stdin.buffer
+    return gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")
+
+
+def read_blocks(handle):
+    while True:
+        block = handle.read(READ_BLOCK)
+        if not block:
+            return
+        yield block
+
+
+def export_table(supabase, table: str, output: str, page_size: int):
+    started = time.perf_counter()
+    count = 0
+
+    def counted(rows):
+        nonlocal count
+        for row in rows:
+            count += 1
+            if count % page_size == 0:
+                progress(f"[{table}] exported {count} rows ({count / (time.perf_counter() - started):.0f} rows/s)")
+            yield row
+
+    handle = open_output(output)
+    try:
+        for chunk in encode_rows(counted(iter_table_rows(supabase, table, page_size))):
+            handle.write(chunk)
+    finally:
+        if handle is not sys.stdout.buffer:
+            handle.close()
+        else:
+            handle.flush()
+    progress(f"[{table}] exported {count} rows in {time.perf_counter() - started:.2f}s")
+
+
+def import_table(supabase, table: str, source: str, chunk_size: int):
+    started = time.perf_counter()
+
+    def report(_, counts):
+        elapsed = time.perf_counter() - started
+        progress(f"[{table}] upserted {counts['upserted']} rows in {counts['chunks']} chunks ({counts['upserted'] / elapsed:.0f} rows/s)")
+
+    handle = open_input(source)
+    try:
+        counts = import_rows(supabase, table, iter_ndjson(table, read_blocks(handle)), chunk_size, on_chunk=report)
+    except NdjsonError as exc:
+        raise SystemExit(f"[{table}] {exc}")
+    finally:
+        if handle is not sys.stdin.buffer:
+            handle.close()
+    progress(f"[{table}] imported {counts['upserted']} rows in {time.perf_counter() - started:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream catalog tables to/from NDJSON")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export")
+    export_parser.add_argument("table", choices=NDJSON_TABLES)
+    export_parser.add_argument("-o", "--output", default="-", help="File path, .gz for gzip, - for stdout")
+    export_parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE)
+    import_parser = commands.add_parser("import")
+    import_parser.add_argument("table", choices=NDJSON_TABLES)
+    import_parser.add_argument("source", help="File path, .gz for gzip, - for stdin")
+    import_parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
+        raise RuntimeError("SUPABASE_URL and SUPABASE_SERVICE_KEY (or SUPABASE_ANON_KEY) are required")
+    supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+    if args.command == "export":
+        export_table(supabase, args.table, args.output, args.page_size)
+    else:
+        import_table(supabase, args.table, args.source, args.chunk_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,20 @@
+"""
+把 seed/*.json 同步到 Supabase：只 upsert 有變動的列、分批送出、四張表並行。
+
+    python seed/seed_supabase.py                     # 依本地狀態檔比對，只送變動列
+    python seed/seed_supabase.py --dry-run           # 只列出差異，不寫入
+    python seed/seed_supabase.py --compare remote    # 改與遠端現有資料比對（狀態檔遺失或多人協作時）
+    python seed/seed_supabase.py --force --chunk-size 1000 --tables roles explore_items
+
+每列內容以 sha256 雜湊記錄在 seed/.seed_state.json；依賴 roles 的表會等 roles 寫完才開始。
+"""
+import argparse
+import hashlib
 import json
 import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -11,11 +26,28 @@ load_dotenv(ROOT / ".env")
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY") or os.getenv("SUPABASE_ANON_KEY")
+STATE_FILE = ROOT / "seed" / ".seed_state.json"
+TABLES = ("roles", "explore_items", "daily_theater_templates", "role_seed_messages")
+# 表 -> 衝突鍵；同時作為狀態檔裡每列的識別
+CONFLICT_KEYS = {
+    "roles": ("id",),
+    "explore_items": ("id",),
+    "daily_theater_templates": ("id",),
+    "role_seed_messages": ("role_id", "position"),
+}
+# 外鍵依賴：新角色要先存在，其他表才能引用
+DEPENDS_ON = {
+    "explore_items": ("roles",),
+    "daily_theater_templates": ("roles",),
+    "role_seed_messages": ("roles",),
+}
 
-if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
-    raise RuntimeError("SUPABASE_URL and SUPABASE_SERVICE_KEY (or SUPABASE_ANON_KEY) are required")
+_print_lock = threading.Lock()
 
-supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+
+def log(message: str):
+    with _print_lock:
+        print(message, flush=True)
 
 
 def load_json(path: Path):
@@ -23,11 +55,11 @@ def load_json(path: Path):
         return json.load(handle)
 
 
-def upsert_roles():
+def build_roles():
     seed_dir = ROOT / "seed"
     base_roles = load_json(seed_dir / "roles.json")
     if not base_roles:
-        return
+        return []
     # 若有 mobile 匯出的完整 persona/script/greeting，合併進去並保留 base 的 avatar_url/hero_image_url
     from_mobile = seed_dir / "roles_from_mobile.json"
     if from_mobile.exists():
@@ -45,43 +77,33 @@ def upsert_roles():
                 base["city"] = m.get("city") or base.get("city")
                 base["description"] = m.get("description") or base.get("description")
                 base["tags"] = m.get("tags") if m.get("tags") is not None else base.get("tags", [])
-        print("Merged roles_from_mobile.json (persona, greeting, script, etc.)")
-    supabase.table("roles").upsert(base_roles).execute()
-    print(f"Upserted {len(base_roles)} roles")
+        log("Merged roles_from_mobile.json (persona, greeting, script, etc.)")
+    return base_roles
 
 
-def upsert_explore_items():
+def build_explore_items():
     items = load_json(ROOT / "seed" / "explore_items.json")
-    if not items:
-        return
-    for it in items:
+    for it in items or []:
         if "world" not in it or it["world"] is None:
             it["world"] = {}
         if "recommended_roles" not in it or it["recommended_roles"] is None:
             it["recommended_roles"] = []
         if "content" not in it or it["content"] is None:
             it["content"] = []
-    supabase.table("explore_items").upsert(items).execute()
-    print(f"Upserted {len(items)} explore items")
+    return items or []
 
 
-def upsert_daily_theater_templates():
+def build_daily_theater_templates():
     path = ROOT / "seed" / "daily_theater_templates.json"
     if not path.exists():
-        return
-    templates = load_json(path)
-    if not templates:
-        return
-    supabase.table("daily_theater_templates").upsert(templates).execute()
-    print(f"Upserted {len(templates)} daily_theater_templates")
+        return []
+    return load_json(path) or []
 
 
-def upsert_role_seed_messages():
+def build_role_seed_messages():
     roles = load_json(ROOT / "seed" / "roles.json")
-    if not roles:
-        return
     rows = []
-    for r in roles:
+    for r in roles or []:
         role_id = r.get("id")
         greeting = (r.get("greeting") or "").strip()
         if not role_id or not greeting:
@@ -93,15 +115,157 @@ def upsert_role_seed_messages():
             "sender": "ai",
             "body": greeting,
         })
-    if not rows:
-        return
-    supabase.table("role_seed_messages").upsert(rows, on_conflict="role_id,position").execute()
-    print(f"Upserted {len(rows)} role_seed_messages")
+    return rows
+
+
+BUILDERS = {
+    "roles": build_roles,
+    "explore_items": build_explore_items,
+    "daily_theater_templates": build_daily_theater_templates,
+    "role_seed_messages": build_role_seed_messages,
+}
+
+
+def row_key(table: str, row: dict) -> str:
+    return "|".join(str(row.get(column)) for column in CONFLICT_KEYS[table])
+
+
+def row_hash(row: dict) -> str:
+    canonical = json.dumps(row, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def load_state() -> dict:
+    if not STATE_FILE.exists():
+        return {}
+    return load_json(STATE_FILE)
+
+
+def save_state(state: dict):
+    tmp = STATE_FILE.with_suffix(".tmp")
+    tmp.write_text(json.dumps(state, ensure_ascii=False, indent=0, sort_keys=True), encoding="utf-8")
+    tmp.replace(STATE_FILE)
+
+
+def remote_hashes(supabase, table: str, rows: list, page_size: int = 1000) -> dict:
+    """遠端每列只取本地有的欄位來算雜湊，才能與本地列直接比較。"""
+    columns = sorted({column for row in rows for column in row})
+    hashes = {}
+    offset = 0
+    while True:
+        query = supabase.table(table).select(",".join(columns))
+        for column in CONFLICT_KEYS[table]:
+            query = query.order(column, desc=False)
+        page = query.range(offset, offset + page_size - 1).execute().data or []
+        for remote in page:
+            hashes[row_key(table, remote)] = row_hash({column: remote.get(column) for column in columns})
+        if len(page) < page_size:
+            return hashes
+        offset += page_size
+
+
+def diff_table(table: str, rows: list, known: dict, force: bool):
+    added, changed, unchanged = [], [], 0
+    columns = sorted({column for row in rows for column in row})
+    for row in rows:
+        key = row_key(table, row)
+        digest = row_hash({column: row.get(column) for column in columns})
+        previous = known.get(key)
+        if force or previous != digest:
+            (changed if previous else added).append((key, digest, row))
+        else:
+            unchanged += 1
+    return added, changed, unchanged
+
+
+def print_diff(table: str, added: list, changed: list, unchanged: int, limit: int = 20):
+    log(f"[{table}] +{len(added)} added, ~{len(changed)} changed, ={unchanged} unchanged")
+    for label, entries in (("+", added), ("~", changed)):
+        for key, _, _ in entries[:limit]:
+            log(f"    {label} {key}")
+        if len(entries) > limit:
+            log(f"    {label} ... {len(entries) - limit} more")
+
+
+def upsert_chunks(supabase, table: str, pending: list, chunk_size: int, table_state: dict):
+    on_conflict = ",".join(CONFLICT_KEYS[table])
+    for start in range(0, len(pending), chunk_size):
+        chunk = pending[start : start + chunk_size]
+        began = time.perf_counter()
+        supabase.table(table).upsert([row for _, _, row in chunk], on_conflict=on_conflict).execute()
+        for key, digest, _ in chunk:
+            table_state[key] = digest
+        log(
+            f"[{table}] upserted {min(start + chunk_size, len(pending))}/{len(pending)} "
+            f"({(time.perf_counter() - began) * 1000:.0f} ms)"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental Supabase seeder")
+    parser.add_argument("--tables", nargs="+", choices=TABLES, default=list(TABLES))
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--compare", choices=("state", "remote"), default="state")
+    parser.add_argument("--dry-run", action="store_true", help="Only print the diff")
+    parser.add_argument("--force", action="store_true", help="Upsert every row regardless of hashes")
+    args = parser.parse_args()
+
+    needs_client = not args.dry_run or args.compare == "remote"
+    supabase = None
+    if needs_client:
+        if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
+            raise RuntimeError("SUPABASE_URL and SUPABASE_SERVICE_KEY (or SUPABASE_ANON_KEY) are required")
+        supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+
+    started = time.perf_counter()
+    state = load_state()
+    state_lock = threading.Lock()
+    # Created before any table starts, so a table always waits for the selected tables it
+    # depends on, whatever order they were listed or submitted in.
+    upserted = {table: Future() for table in args.tables}
+
+    def sync_table(table: str):
+        began = time.perf_counter()
+        rows = BUILDERS[table]()
+        known = remote_hashes(supabase, table, rows) if args.compare == "remote" and rows else state.get(table, {})
+        added, changed, unchanged = diff_table(table, rows, known, args.force)
+        print_diff(table, added, changed, unchanged)
+        if args.dry_run:
+            return
+        for dependency in DEPENDS_ON.get(table, ()):
+            if dependency in upserted:
+                upserted[dependency].result()
+        table_state = dict(state.get(table, {}))
+        try:
+            upsert_chunks(supabase, table, added + changed, args.chunk_size, table_state)
+        finally:
+            with state_lock:
+                state[table] = table_state
+        log(f"[{table}] done in {time.perf_counter() - began:.2f}s")
+
+    def run_table(table: str):
+        try:
+            sync_table(table)
+        except BaseException as exc:
+            upserted[table].set_exception(exc)
+            raise
+        upserted[table].set_result(None)
+
+    with ThreadPoolExecutor(max_workers=len(args.tables)) as pool:
+        futures = {table: pool.submit(run_table, table) for table in args.tables}
+        errors = []
+        for table, future in futures.items():
+            try:
+                future.result()
+            except Exception as exc:
+                errors.append(f"{table}: {exc}")
+
+    if not args.dry_run:
+        save_state(state)
+    log(f"Seed {'diff' if args.dry_run else 'sync'} finished in {time.perf_counter() - started:.2f}s")
+    if errors:
+        raise SystemExit("Seed failed for " + "; ".join(errors))
 
 
 if __name__ == "__main__":
-    upsert_roles()
-    upsert_explore_items()
-    upsert_daily_theater_templates()
-    upsert_role_seed_messages()
-    print("Seed complete")
+    main()
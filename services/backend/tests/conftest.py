@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Tests import the service as the ``app`` package, the same way uvicorn does (app.main:app).
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# No background jobs: the scheduler would otherwise call Supabase.
+os.environ.setdefault("DAILY_TASKS_SCHEDULER", "0")
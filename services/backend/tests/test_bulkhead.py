@@ -0,0 +1,68 @@
+import anyio
+import pytest
+from fastapi import HTTPException
+
+from app.bulkhead import Bulkhead
+
+
+def test_stream_holds_a_slot_until_the_body_ends():
+    pool = Bulkhead("test", 1, 1)
+    seen = []
+
+    def body():
+        yield b"a"
+        yield b"b"
+
+    async def main():
+        stream = pool.stream(body())
+        async for chunk in stream:
+            seen.append((chunk, pool.limiter.statistics().borrowed_tokens))
+
+    anyio.run(main)
+    assert seen == [(b"a", 1), (b"b", 1)]
+    assert pool.admitted == 0
+    assert pool.completed == 1
+
+
+def test_stream_is_rejected_when_the_pool_is_full():
+    pool = Bulkhead("test", 1, 1)
+    pool.stream(iter(()))
+    pool.stream(iter(()))
+    with pytest.raises(HTTPException) as error:
+        pool.stream(iter(()))
+    assert error.value.status_code == 503
+    assert pool.rejected == 1
+
+
+def test_closing_the_stream_early_closes_the_body():
+    pool = Bulkhead("test", 2, 0)
+    closed = []
+
+    def body():
+        try:
+            while True:
+                yield b"x"
+        finally:
+            closed.append(True)
+
+    async def main():
+        stream = pool.stream(body())
+        assert await stream.__anext__() == b"x"
+        await stream.aclose()
+
+    anyio.run(main)
+    assert closed == [True]
+    assert pool.admitted == 0
+    assert pool.limiter.statistics().borrowed_tokens == 0
+
+
+def test_handler_in_the_pool_hands_its_admission_to_the_stream():
+    pool = Bulkhead("test", 1, 0)
+
+    async def main():
+        stream = await pool.run(pool.stream, iter([b"a"]))
+        return [chunk async for chunk in stream]
+
+    assert anyio.run(main) == [b"a"]
+    assert pool.rejected == 0
+    assert pool.admitted == 0
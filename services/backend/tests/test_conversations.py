@@ -0,0 +1,80 @@
+from app.conversations import SEQ_CONSTRAINT, ConversationStore
+
+
+class UniqueViolation(Exception):
+    code = "23505"
+
+
+class Query:
+    def __init__(self, db, table):
+        self.db = db
+        self.table = table
+        self.filters = []
+        self.order_desc = False
+        self.limit_to = None
+        self.rows = None
+
+    def select(self, *_):
+        return self
+
+    def eq(self, column, value):
+        self.filters.append((column, value))
+        return self
+
+    def order(self, _column, desc=False):
+        self.order_desc = desc
+        return self
+
+    def limit(self, count):
+        self.limit_to = count
+        return self
+
+    def upsert(self, rows, **_):
+        self.rows = rows
+        return self
+
+    def execute(self):
+        stored = self.db.setdefault(self.table, [])
+        if self.rows is not None:
+            for row in self.rows:
+                if any(existing["id"] == row["id"] for existing in stored):
+                    continue
+                if self.table == "conversation_turns" and any(
+                    (existing["conversation_id"], existing["seq"]) == (row["conversation_id"], row["seq"]) for existing in stored
+                ):
+                    raise UniqueViolation(f'duplicate key value violates unique constraint "{SEQ_CONSTRAINT}"')
+                stored.append(dict(row))
+            return type("Result", (), {"data": self.rows})()
+        rows = [row for row in stored if all(row.get(column) == value for column, value in self.filters)]
+        if self.table == "conversation_turns":
+            rows.sort(key=lambda row: row["seq"], reverse=self.order_desc)
+        return type("Result", (), {"data": rows[: self.limit_to] if self.limit_to else rows})()
+
+
+class Client:
+    def __init__(self, db):
+        self.db = db
+
+    def table(self, name):
+        return Query(self.db, name)
+
+
+def test_seq_clash_with_another_worker_renumbers_instead_of_dropping():
+    db = {}
+    first = ConversationStore(lambda: Client(db))
+    second = ConversationStore(lambda: Client(db))
+    conversation = first.create("role-1")
+    first.flush()
+    other = second.get(conversation.id)
+    first.append(conversation, [("user", "hi from A"), ("assistant", "reply A")])
+    second.append(other, [("user", "hi from B"), ("assistant", "reply B")])
+    second.flush()
+    assert first.flush() == 0  # clashed: reloaded and renumbered, nothing written yet
+    first.append(conversation, [("user", "again")])
+    assert first.flush() == 3
+    turns = sorted(db["conversation_turns"], key=lambda row: row["seq"])
+    assert [row["seq"] for row in turns] == [0, 1, 2, 3, 4]
+    assert [row["content"] for row in turns] == ["hi from B", "reply B", "hi from A", "reply A", "again"]
+    assert [row["content"] for row in first.context(conversation, 10)] == [row["content"] for row in turns]
+    assert first.snapshot()["droppedTurns"] == 0
+    assert first.snapshot()["resequencedTurns"] == 2
@@ -0,0 +1,65 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import app.main as main
+from app.idempotency import IdempotencyKeys, MemoryStore
+from app.ratelimit import MemoryBackend, RateLimiter, TokenBucket
+
+CHAT = {"role": {"name": "Test", "persona": "test"}, "messages": [{"role": "user", "content": "hi"}]}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    calls = []
+
+    def fake_call_qwen(system, messages, model=None, **kwargs):
+        calls.append(messages)
+        return "你好。"
+
+    monkeypatch.setattr(main, "call_qwen", fake_call_qwen)
+    monkeypatch.setattr(main, "IDEMPOTENCY", IdempotencyKeys(MemoryStore()))
+    # Two chat calls' worth of budget, refilled far too slowly to matter during the test.
+    monkeypatch.setattr(main, "RATE_LIMITER", RateLimiter([TokenBucket(2, 0.0001)], MemoryBackend(), {"chat": 1}))
+    test_client = TestClient(main.app)
+    test_client.calls = calls
+    return test_client
+
+
+def test_replayed_retries_are_not_charged(client):
+    headers = {"Idempotency-Key": "retry-1"}
+    first = client.post("/chat/completion", json=CHAT, headers=headers)
+    assert first.status_code == 200
+    assert first.headers["X-RateLimit-Remaining"] == "1"
+    for _ in range(3):
+        retry = client.post("/chat/completion", json=CHAT, headers=headers)
+        assert retry.status_code == 200
+        assert retry.headers["Idempotent-Replayed"] == "true"
+        assert retry.json() == first.json()
+    assert len(client.calls) == 1
+    assert main.RATE_LIMITER.allowed == 1
+
+
+def test_new_keys_are_still_charged(client):
+    for index in range(2):
+        assert client.post("/chat/completion", json=CHAT, headers={"Idempotency-Key": f"k{index}"}).status_code == 200
+    limited = client.post("/chat/completion", json=CHAT, headers={"Idempotency-Key": "k2"})
+    assert limited.status_code == 429
+    # The rejected request released its key, so it can run once budget is back.
+    assert main.IDEMPOTENCY.store.begin("chat:k2", "other", 60).state == "run"
+    assert client.post("/chat/completion", json=CHAT).status_code == 429
+
+
+def test_key_reused_with_other_payload_is_rejected(client):
+    headers = {"Idempotency-Key": "same"}
+    assert client.post("/chat/completion", json=CHAT, headers=headers).status_code == 200
+    other = dict(CHAT, messages=[{"role": "user", "content": "something else"}])
+    assert client.post("/chat/completion", json=other, headers=headers).status_code == 422
+    assert len(client.calls) == 1
+
+
+def test_key_does_not_bypass_limits_on_routes_without_idempotency(client, monkeypatch):
+    monkeypatch.setattr(main, "RATE_LIMITER", RateLimiter([TokenBucket(2, 0.0001)], MemoryBackend(), {"save": 2}))
+    monkeypatch.setattr(main, "save_remote_asset", lambda url, prefix, trace: {"url": url})
+    body = {"url": "https://example.com/a.png"}
+    assert client.post("/ai/wan/save", json=body, headers={"Idempotency-Key": "a"}).status_code == 200
+    assert client.post("/ai/wan/save", json=body, headers={"Idempotency-Key": "b"}).status_code == 429
@@ -0,0 +1,88 @@
+import multiprocessing
+
+import numpy as np
+import pytest
+
+from app.memory import HashingEmbedder, MemoryIndex, MemoryShard, normalize
+
+DIM = 64
+
+
+def random_vectors(count: int, seed: int = 0) -> np.ndarray:
+    return normalize(np.random.default_rng(seed).standard_normal((count, DIM)).astype(np.float32))
+
+
+def records(count: int):
+    return [{"text": f"memory {index}"} for index in range(count)]
+
+
+@pytest.mark.parametrize("dtype, tolerance", [("int8", 0.01), ("float16", 0.002)])
+def test_quantized_scores_match_float32(tmp_path, dtype, tolerance):
+    vectors = random_vectors(300)
+    shard = MemoryShard(tmp_path / "shard", DIM, dtype, "test")
+    shard.append(vectors, records(300))
+    query = vectors[42]
+    hits = shard.search(query, 5)
+    assert hits[0][1] == 42
+    exact = vectors @ query
+    for score, index in hits:
+        assert abs(score - exact[index]) < tolerance
+
+
+def test_shard_reopens_with_rows_and_records(tmp_path):
+    vectors = random_vectors(600, seed=1)
+    shard = MemoryShard(tmp_path / "shard", DIM, "int8", "test")
+    shard.append(vectors[:300], records(300))
+    shard.append(vectors[300:], [{"text": f"later {index}"} for index in range(300)])  # grows past the initial capacity
+    shard.close()
+    reopened = MemoryShard(tmp_path / "shard", DIM, "int8", "test")
+    assert reopened.count == 600
+    assert reopened.record(0) == {"text": "memory 0"}
+    assert reopened.record(599) == {"text": "later 299"}
+    assert reopened.search(vectors[450], 1)[0][1] == 450
+
+
+def test_reopen_with_other_settings_is_rejected(tmp_path):
+    MemoryShard(tmp_path / "shard", DIM, "int8", "test").close()
+    with pytest.raises(ValueError):
+        MemoryShard(tmp_path / "shard", DIM, "float16", "test")
+
+
+def test_hashing_embedder_is_deterministic():
+    first = HashingEmbedder(DIM).embed(["我们上周去了海边", "hello world"])
+    second = HashingEmbedder(DIM).embed(["我们上周去了海边", "hello world"])
+    assert np.array_equal(first, second)
+    assert np.allclose(np.linalg.norm(first, axis=1), 1.0)
+
+
+def test_reader_opened_on_empty_shard_sees_later_writes(tmp_path):
+    writer = MemoryIndex(str(tmp_path), HashingEmbedder(DIM))
+    reader = MemoryIndex(str(tmp_path), HashingEmbedder(DIM))
+    writer.shard("u1", "r1")  # exists on disk, no rows yet
+    assert reader.recall("u1", "r1", "海边") == []
+    assert reader.stats()["openShards"] == 1
+    writer.remember("u1", "r1", ["我们上周去了海边看日落"])
+    assert reader.recall("u1", "r1", "海边日落", k=1)[0]["text"] == "我们上周去了海边看日落"
+
+
+def _remember_in_child(root: str, text: str) -> None:
+    MemoryIndex(root, HashingEmbedder(DIM)).remember("u1", "r1", [text])
+
+
+def test_rows_written_by_another_process_are_recalled(tmp_path):
+    reader = MemoryIndex(str(tmp_path), HashingEmbedder(DIM))
+    reader.remember("u1", "r1", ["占位"])
+    assert len(reader.recall("u1", "r1", "猫", k=5)) == 1
+    context = multiprocessing.get_context("spawn")
+    child = context.Process(target=_remember_in_child, args=(str(tmp_path), "她养了一只叫团子的猫"))
+    child.start()
+    child.join(60)
+    assert child.exitcode == 0
+    assert reader.recall("u1", "r1", "团子 猫", k=1)[0]["text"] == "她养了一只叫团子的猫"
+
+
+def test_recall_does_not_create_shards(tmp_path):
+    index = MemoryIndex(str(tmp_path), HashingEmbedder(DIM))
+    assert index.recall("stranger", "r1", "hello") == []
+    assert list(tmp_path.iterdir()) == []
+    assert index.stats()["openShards"] == 0
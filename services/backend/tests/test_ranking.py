@@ -0,0 +1,48 @@
+import random
+
+from app.ranking import FEED_TYPES, FeedRanker
+
+
+def make_row(index: int, likes: int, item_type: str = "post"):
+    return {"id": f"item-{index}", "type": item_type, "stats": {"likes": likes}, "created_at": "2025-01-01T00:00:00+00:00"}
+
+
+def expected_ids(ranker: FeedRanker, rows, feed: str, limit: int):
+    matching = [row for row in rows.values() if feed == "all" or row["type"] == feed]
+    ranked = sorted(matching, key=lambda row: (-ranker.score(row), row["id"]))
+    return [row["id"] for row in ranked[:limit]]
+
+
+def test_incremental_updates_match_a_full_sort():
+    rng = random.Random(7)
+    ranker = FeedRanker(lambda row: {"id": row["id"]}, top_k=20)
+    rows = {}
+    for index in range(200):
+        rows[f"item-{index}"] = make_row(index, rng.randrange(1000), rng.choice(("post", "world")))
+    ranker.replace_all(rows.values(), [])
+    for step in range(2000):
+        index = rng.randrange(250)
+        if rng.random() < 0.1:
+            rows.pop(f"item-{index}", None)
+            ranker.remove(f"item-{index}")
+        else:
+            row = make_row(index, rng.randrange(1000), rng.choice(("post", "world")))
+            rows[row["id"]] = row
+            ranker.upsert(row)
+        if step % 50 == 0:
+            for feed in FEED_TYPES:
+                assert [item["id"] for item in ranker.page(feed, limit=20)] == expected_ids(ranker, rows, feed, 20)
+    for feed in FEED_TYPES:
+        assert [item["id"] for item in ranker.page(feed, limit=20)] == expected_ids(ranker, rows, feed, 20)
+
+
+def test_updating_a_top_item_keeps_the_list_without_a_rebuild():
+    ranker = FeedRanker(lambda row: {"id": row["id"]}, top_k=10)
+    ranker.replace_all([make_row(index, index * 10) for index in range(100)], [])
+    hot = make_row(99, 5000)  # already first; more likes keep it in the cut
+    ranker.upsert(hot)
+    assert not ranker._dirty
+    assert ranker.page("post", limit=1)[0]["id"] == "item-99"
+    ranker.upsert(make_row(99, 0))  # falls out of the cut: the next read refills the list
+    assert "post" in ranker._dirty
+    assert [item["id"] for item in ranker.page("post", limit=10)] == [f"item-{index}" for index in range(98, 88, -1)]